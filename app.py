@@ -2,9 +2,16 @@
 
 import streamlit as st
 import pandas as pd
-from utils.processing import processar_zip 
+from utils.processing import processar_zips
+from utils.agregacoes import cache_agregacoes
+from utils.cache_llm import cache_llm
+from utils.agentes import pool_agentes
+from utils.callbacks import registro_tokens, registro_telemetria
+from utils.receitas import livro_receitas
+from utils.relatorio_word import montador_relatorio
 # Importa todos os módulos de abas, incluindo a nova de insights
 from tabs import agent_tab, insights_tab, dashboard_tab, report_tab, fiscal_tab
+from tabs.exportacao import botoes_exportacao
 
 # Configuração da página
 st.set_page_config(page_title="Plataforma de Análise de NF-e", layout="wide")
@@ -14,12 +21,16 @@ st.title("🚀 Plataforma de Análise e Relatórios de Notas Fiscais")
 # Inicializa as variáveis no estado da sessão para persistirem entre as interações.
 if 'report_items' not in st.session_state:
     st.session_state.report_items = []
-if 'df' not in st.session_state:
-    st.session_state.df = None
+if 'dataset' not in st.session_state:
+    st.session_state.dataset = None
 if 'chat_history' not in st.session_state:
     st.session_state.chat_history = []
 if 'insights_gerados' not in st.session_state:
     st.session_state.insights_gerados = None
+if 'arquivos_carregados' not in st.session_state:
+    st.session_state.arquivos_carregados = set()
+if 'versao_upload' not in st.session_state:
+    st.session_state.versao_upload = 0
 
 # --- BARRA LATERAL (SIDEBAR) ---
 with st.sidebar:
@@ -45,23 +56,51 @@ with st.sidebar:
 # --- LÓGICA DE UPLOAD E PROCESSAMENTO DO ARQUIVO ---
 upload_container = st.container(border=True)
 with upload_container:
-    uploaded_file = st.file_uploader("Selecione o arquivo .ZIP com as notas fiscais", type=["zip"])
+    uploaded_files = st.file_uploader(
+        "Selecione um ou mais arquivos .ZIP com as notas fiscais (ex.: um por mês)",
+        type=["zip"],
+        accept_multiple_files=True,
+        key=f"upload_zip_{st.session_state.versao_upload}",
+    )
 
-    if uploaded_file is not None:
-        if st.session_state.df is None:
-            try:
-                with st.spinner("Processando e analisando os dados..."):
-                    st.session_state.df = processar_zip(uploaded_file)
-                st.success("Dados carregados! Navegue pelas abas ou use os filtros abaixo para refinar sua análise.")
-            except Exception as e:
-                st.error(f"Falha ao processar o arquivo: {e}")
-                st.session_state.df = None
-    elif st.session_state.df is None:
+    # Apenas os arquivos ainda não carregados nesta sessão são processados e anexados ao dataset.
+    novos_arquivos = [f for f in uploaded_files if f.file_id not in st.session_state.arquivos_carregados]
+    if novos_arquivos:
+        try:
+            with st.spinner("Processando e analisando os dados..."):
+                barra_progresso = st.progress(0.0, text="Iniciando a leitura dos arquivos...")
+                dataset_anterior = st.session_state.dataset
+                st.session_state.dataset = processar_zips(
+                    novos_arquivos,
+                    dataset_existente=st.session_state.dataset,
+                    progresso=lambda fracao, texto: barra_progresso.progress(fracao, text=texto)
+                )
+                barra_progresso.empty()
+            if dataset_anterior is not None:
+                # Os agentes montados sobre os dados anteriores não servem mais
+                pool_agentes.descartar(dataset_anterior)
+            st.session_state.arquivos_carregados.update(f.file_id for f in novos_arquivos)
+            st.success("Dados carregados! Navegue pelas abas ou use os filtros abaixo para refinar sua análise.")
+        except Exception as e:
+            st.error(f"Falha ao processar o arquivo: {e}")
+
+    if st.session_state.dataset is not None:
+        st.caption(f"{len(st.session_state.dataset.hashes_arquivos)} arquivo(s) carregado(s) nesta análise.")
+        if st.button("Descartar dados carregados"):
+            pool_agentes.descartar(st.session_state.dataset)
+            st.session_state.dataset = None
+            st.session_state.arquivos_carregados = set()
+            # Uma nova chave recria o campo de upload vazio.
+            st.session_state.versao_upload += 1
+            st.rerun()
+    else:
         st.info("Aguardando o upload do arquivo .ZIP para começar a análise.")
 
 # --- SEÇÃO PRINCIPAL COM FILTROS E ABAS ---
-if st.session_state.df is not None:
-    df_original = st.session_state.df
+if st.session_state.dataset is not None:
+    dataset_original = st.session_state.dataset
+    # Os filtros globais atuam no nível da nota fiscal, por meio de um índice construído uma vez por dataset.
+    indice_filtro = dataset_original.indice_filtro
     
     # --- SEÇÃO DE FILTROS GLOBAIS ---
     filter_container = st.container(border=True)
@@ -70,12 +109,12 @@ if st.session_state.df is not None:
         col1, col2 = st.columns([1, 2])
         
         with col1:
-            ufs_disponiveis = sorted(df_original['uf_destinatario_x'].unique())
+            ufs_disponiveis = indice_filtro.ufs
             ufs_selecionadas = st.multiselect("Filtrar por UF do Destinatário:", options=ufs_disponiveis, default=ufs_disponiveis)
         
         with col2:
-            data_min = df_original['data_emissao_x'].min()
-            data_max = df_original['data_emissao_x'].max()
+            data_min = indice_filtro.data_min
+            data_max = indice_filtro.data_max
             data_selecionada = st.date_input(
                 "Filtrar por Período de Emissão:",
                 value=(data_min.date(), data_max.date()),
@@ -83,17 +122,18 @@ if st.session_state.df is not None:
                 max_value=data_max.date(),
             )
 
-    # Aplica os filtros para criar um DataFrame filtrado para as abas visuais
+    # Aplica os filtros e obtém o dataset filtrado para as abas visuais (memorizado por estado do filtro)
     if len(data_selecionada) == 2:
-        df_filtrado = df_original[
-            (df_original['uf_destinatario_x'].isin(ufs_selecionadas)) &
-            (df_original['data_emissao_x'].dt.date >= data_selecionada[0]) &
-            (df_original['data_emissao_x'].dt.date <= data_selecionada[1])
-        ]
-    else: 
-        df_filtrado = df_original[df_original['uf_destinatario_x'].isin(ufs_selecionadas)]
+        dataset_filtrado = indice_filtro.filtrar(ufs_selecionadas, data_selecionada[0], data_selecionada[1])
+    else:
+        dataset_filtrado = indice_filtro.filtrar(ufs_selecionadas)
 
-    st.write(f"Exibindo {len(df_filtrado)} de {len(df_original)} registros após a filtragem.")
+    st.write(
+        f"Exibindo {len(dataset_filtrado)} de {len(dataset_original)} registros "
+        f"({dataset_filtrado.num_notas} de {dataset_original.num_notas} notas) após a filtragem."
+    )
+    with st.expander("📥 Exportar Itens Filtrados (todas as colunas)"):
+        botoes_exportacao(dataset_filtrado, "itens_filtrados", "itens_filtrados")
     st.markdown("---")
 
     # Criação das abas, incluindo a nova "Insights da IA"
@@ -108,20 +148,64 @@ if st.session_state.df is not None:
     # Renderiza cada aba, passando o DataFrame apropriado para cada uma
     with tab_agent:
         # O Agente Q&A usa o DataFrame original para responder perguntas sobre todos os dados
-        agent_tab.render(df_original, google_api_key)
+        agent_tab.render(dataset_original, google_api_key)
     
     with tab_insights:
         # A nova aba de Insights também usa o DataFrame original para gerar uma análise completa
-        insights_tab.render(df_original, google_api_key)
+        insights_tab.render(dataset_original, google_api_key)
         
     with tab_dashboard:
         # O Dashboard visual reflete os filtros que o usuário selecionou
-        dashboard_tab.render(df_filtrado) 
+        dashboard_tab.render(dataset_filtrado)
         
     with tab_fiscal:
         # A Análise Fiscal visual também reflete os filtros
-        fiscal_tab.render(df_filtrado)
+        fiscal_tab.render(dataset_filtrado)
         
     with tab_report:
         # O Montador de Relatório usa os dados originais para o sumário da IA
-        report_tab.render(df_original, google_api_key)
\ No newline at end of file
+        report_tab.render(dataset_original, google_api_key)
+
+    # Estatísticas do cache de análises, exibidas ao final para já incluir esta execução
+    estatisticas = cache_agregacoes.estatisticas()
+    st.sidebar.markdown("---")
+    st.sidebar.caption(
+        f"Cache de análises: {estatisticas['acertos']} acertos, {estatisticas['falhas']} falhas, "
+        f"{estatisticas['entradas']} resultados ({estatisticas['memoria_mb']:.1f} MB)."
+    )
+    estatisticas_llm = cache_llm.estatisticas()
+    st.sidebar.caption(
+        f"Cache de respostas do LLM{' (modo de reprodução)' if estatisticas_llm['reproducao'] else ''}: "
+        f"{estatisticas_llm['acertos']} acertos, {estatisticas_llm['falhas']} falhas "
+        f"({estatisticas_llm['taxa_acertos']:.0%}), {estatisticas_llm['entradas']} respostas gravadas "
+        f"({estatisticas_llm['tamanho_mb']:.1f} MB)."
+    )
+    estatisticas_agentes = pool_agentes.estatisticas()
+    st.sidebar.caption(
+        f"Pool de agentes: {estatisticas_agentes['criados']} montados, "
+        f"{estatisticas_agentes['reaproveitados']} reaproveitados, {estatisticas_agentes['ociosos']} prontos."
+    )
+    estatisticas_receitas = livro_receitas.estatisticas()
+    st.sidebar.caption(
+        f"Receitas de análise: {estatisticas_receitas['receitas']} gravadas, "
+        f"{estatisticas_receitas['reproduzidas']} reproduzidas sem o LLM, {estatisticas_receitas['falhas']} falhas."
+    )
+    estatisticas_tokens = registro_tokens.estatisticas()
+    st.sidebar.caption(
+        f"Tokens do LLM: {estatisticas_tokens['chamadas']} chamadas, {estatisticas_tokens['entrada']:,} de entrada "
+        f"(média de {estatisticas_tokens['media_entrada']:,.0f} por chamada) e {estatisticas_tokens['saida']:,} de saída."
+        .replace(",", ".")
+    )
+    estatisticas_relatorio = montador_relatorio.estatisticas()
+    st.sidebar.caption(
+        f"Relatório Word: {estatisticas_relatorio['renderizados']} itens renderizados, "
+        f"{estatisticas_relatorio['fragmentos']} em cache, {estatisticas_relatorio['montagens']} documentos montados."
+    )
+    # Latência dos agentes por aba (percentis das execuções mais recentes)
+    for aba, resumo in registro_telemetria.resumo().items():
+        st.sidebar.caption(
+            f"Agente ({aba}): {resumo['execucoes']} execuções, {resumo['falhas']} falhas; duração p50 "
+            f"{resumo['duracao']['p50']:.1f} s, p90 {resumo['duracao']['p90']:.1f} s, p99 {resumo['duracao']['p99']:.1f} s "
+            f"(LLM p50 {resumo['tempo_llm']['p50']:.1f} s, ferramentas p50 {resumo['tempo_ferramentas']['p50']:.1f} s, "
+            f"p50 de {resumo['iteracoes']['p50']:.0f} iterações e {resumo['tokens']['p50']:,.0f}".replace(",", ".") + " tokens)."
+        )
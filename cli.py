@@ -0,0 +1,277 @@
+# cli.py
+
+import argparse
+import multiprocessing
+import os
+import sys
+import time
+import traceback
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import numpy as np
+import pandas as pd
+from utils.processing import processar_zip, LIMITE_MEMORIA_MB, MAX_PROCESSOS_INGESTAO
+from utils.regras import avaliar_regras
+from utils.indicadores import calcular_kpis, calcular_top_n, calcular_serie_diaria
+from utils.relatorio_word import criar_documento_word
+from utils.exportacao import exportar_parquet
+from utils.roteador import formatar_reais, formatar_inteiro, formatar_quantidade
+
+# --- PROCESSAMENTO EM LOTE, SEM A INTERFACE ---
+# Processa diretórios de ZIPs de NF-e sem o Streamlit: para cada arquivo, a ingestão, as
+# auditorias da Análise Fiscal, os indicadores do Dashboard e, opcionalmente, os insights da
+# IA, gravando um relatório .docx e os itens em .parquet. Os arquivos são distribuídos em um
+# pool de processos e, ao final, é exibido o tempo de cada etapa.
+#
+#     python cli.py exportacoes/ --saida relatorios/ --processos 4 --insights
+#
+# Com --insights, a chave do Gemini vem da variável de ambiente GOOGLE_API_KEY (ou use
+# --modelo-falso para testar o fluxo sem rede).
+MODELO_LLM = "gemini-1.5-flash"
+MODELO_FALSO = "modelo-react-falso"
+ETAPAS = ('ingestao', 'auditoria', 'indicadores', 'insights', 'docx', 'parquet')
+
+
+def listar_zips(entradas):
+    """Arquivos .ZIP informados diretamente ou contidos (sem subdiretórios) nos diretórios informados."""
+    arquivos = []
+    for entrada in entradas:
+        if os.path.isdir(entrada):
+            arquivos += sorted(
+                os.path.join(entrada, nome) for nome in os.listdir(entrada)
+                if nome.lower().endswith('.zip') and os.path.isfile(os.path.join(entrada, nome))
+            )
+        else:
+            arquivos.append(entrada)
+    return list(dict.fromkeys(arquivos))
+
+
+def _coluna_ou_none(nome, disponiveis):
+    return nome if nome in disponiveis else None
+
+
+def _tabela(titulo, dados, categoria):
+    if isinstance(dados, pd.Series):
+        dados = dados.to_frame()
+    return {"type": "dataframe", "category": categoria, "title": f"Tabela: {titulo}", "content": {"titulo": titulo, "dados": dados}}
+
+
+def _indicadores(dataset, opcoes):
+    """Itens do relatório com os KPIs e os rankings do Dashboard."""
+    cubo = dataset.cubo
+    coluna_cliente = _coluna_ou_none(opcoes['coluna_cliente'], cubo.dimensoes)
+    coluna_produto = _coluna_ou_none(opcoes['coluna_produto'], cubo.dimensoes)
+    coluna_quantidade = _coluna_ou_none(opcoes['coluna_quantidade'], cubo.medidas)
+
+    kpis = calcular_kpis(dataset, coluna_quantidade, coluna_cliente)
+    tabela_kpis = pd.DataFrame({
+        'Indicador': ['Faturamento Total', 'Itens Vendidos', 'Notas Fiscais Únicas', 'Clientes Únicos'],
+        'Valor': [
+            formatar_reais(kpis['valor_total']),
+            formatar_quantidade(kpis['quantidade']) if coluna_quantidade else "N/A",
+            formatar_inteiro(kpis['notas']),
+            formatar_inteiro(kpis['clientes']) if coluna_cliente else "N/A",
+        ],
+    })
+    itens = [_tabela("Indicadores Chave de Performance", tabela_kpis, "dashboard")]
+    if coluna_cliente:
+        itens.append(_tabela("Top 10 Clientes por Valor de Compra",
+                             calcular_top_n(dataset, coluna_cliente, 'valor_total', 10), "dashboard"))
+    if coluna_produto:
+        itens.append(_tabela("Top 10 Produtos por Faturamento",
+                             calcular_top_n(dataset, coluna_produto, 'valor_total', 10), "dashboard"))
+    itens.append(_tabela("Faturamento Diário", calcular_serie_diaria(dataset, 'valor_total'), "dashboard"))
+    return kpis, itens
+
+
+def _auditoria(dataset):
+    """Itens do relatório com o resultado de cada regra fiscal e o número de ocorrências por regra."""
+    resultados = avaliar_regras(dataset)
+    itens, ocorrencias = [], {}
+    for nome, resultado in resultados.items():
+        if not resultado.disponivel:
+            continue
+        if resultado.regra.tipo == 'predicado':
+            ocorrencias[nome] = resultado.ocorrencias
+            if resultado.ocorrencias == 0:
+                continue
+        itens.append(_tabela(resultado.regra.titulo, resultado.resultado, "fiscal"))
+    return ocorrencias, itens
+
+
+def _insights(dataset, opcoes):
+    """Itens do relatório com as respostas do agente às perguntas da aba de insights."""
+    # Só carregados quando os insights são pedidos
+    from utils.insights import GeradorInsights, PERGUNTAS_RELEVANTES, REQUISICOES_LLM_POR_MINUTO, criar_limitador_taxa
+
+    # O limite de requisições vale para todo o lote: cada processo fica com a sua parte
+    limitador = criar_limitador_taxa((opcoes['requisicoes_por_minuto'] or REQUISICOES_LLM_POR_MINUTO) / opcoes['processos'])
+    if opcoes['modelo_falso']:
+        from utils.modelo_falso import ModeloReActFalso
+        modelo, llm = MODELO_FALSO, ModeloReActFalso(rate_limiter=limitador)
+        criar_llm = lambda: llm
+    else:
+        from langchain_google_genai import ChatGoogleGenerativeAI
+        modelo = MODELO_LLM
+        criar_llm = lambda: ChatGoogleGenerativeAI(model=MODELO_LLM, google_api_key=os.environ["GOOGLE_API_KEY"],
+                                                   temperature=0, rate_limiter=limitador)
+    # Sem interface, os passos de cada agente não são impressos; só as novas tentativas são contadas
+    gerador = GeradorInsights(dataset, criar_llm, modelo=modelo, temperatura=0, exibir_passos=False)
+    novas_tentativas = 0
+
+    def ao_repetir(indice, tentativa):
+        nonlocal novas_tentativas
+        novas_tentativas += 1
+
+    resultados = gerador.gerar(PERGUNTAS_RELEVANTES, ao_repetir=ao_repetir)
+    itens = [
+        {"type": "qa", "category": "insight_ia", "title": f"Insight IA: {resultado['pergunta'][:40]}...", "content": resultado}
+        for resultado in resultados if not resultado.get('erro')
+    ]
+    return sum(1 for resultado in resultados if resultado.get('erro')), novas_tentativas, itens
+
+
+def processar_arquivo(caminho, opcoes):
+    """
+    Processa um ZIP de ponta a ponta e grava as saídas. Devolve um resumo com o tempo de cada
+    etapa; uma falha interrompe apenas este arquivo e é informada em 'erro'.
+    """
+    nome = os.path.splitext(os.path.basename(caminho))[0]
+    resumo = {'arquivo': caminho, 'tempos': {}, 'erro': None}
+    etapa, inicio = None, time.perf_counter()
+
+    def medir(proxima):
+        nonlocal etapa, inicio
+        agora = time.perf_counter()
+        if etapa is not None:
+            resumo['tempos'][etapa] = agora - inicio
+        etapa, inicio = proxima, agora
+
+    try:
+        medir('ingestao')
+        dataset = processar_zip(caminho, opcoes['limite_memoria_mb'], usar_cache=opcoes['usar_cache'])
+        resumo.update(itens=len(dataset), notas=dataset.num_notas)
+
+        medir('auditoria')
+        ocorrencias, itens_auditoria = _auditoria(dataset)
+        resumo['ocorrencias'] = ocorrencias
+
+        medir('indicadores')
+        kpis, itens_indicadores = _indicadores(dataset, opcoes)
+        resumo['faturamento'] = kpis['valor_total']
+
+        itens_insights = []
+        if opcoes['insights']:
+            medir('insights')
+            resumo['insights_sem_resposta'], resumo['insights_novas_tentativas'], itens_insights = _insights(dataset, opcoes)
+
+        if 'docx' in opcoes['formatos']:
+            medir('docx')
+            documento = criar_documento_word(itens_insights + itens_indicadores + itens_auditoria)
+            with open(os.path.join(opcoes['saida'], f"{nome}.docx"), 'wb') as f:
+                f.write(documento.getbuffer())
+
+        if 'parquet' in opcoes['formatos']:
+            medir('parquet')
+            with open(os.path.join(opcoes['saida'], f"{nome}.parquet"), 'wb') as f:
+                exportar_parquet(dataset, f)
+        medir(None)
+    except Exception as e:
+        medir(None)
+        resumo['erro'] = f"{type(e).__name__}: {e}"
+        resumo['detalhes'] = traceback.format_exc()
+    return resumo
+
+
+def _imprimir_tempos(resumos, duracao):
+    print(f"\n{'Etapa':<12} {'arquivos':>8} {'total (s)':>10} {'média (s)':>10} {'p50 (s)':>9} {'p90 (s)':>9} {'máx (s)':>9}")
+    for etapa in ETAPAS:
+        tempos = [r['tempos'][etapa] for r in resumos if etapa in r['tempos']]
+        if not tempos:
+            continue
+        p50, p90 = np.percentile(tempos, [50, 90])
+        print(f"{etapa:<12} {len(tempos):>8} {sum(tempos):>10.2f} {np.mean(tempos):>10.2f} {p50:>9.2f} {p90:>9.2f} {max(tempos):>9.2f}")
+    soma = sum(sum(r['tempos'].values()) for r in resumos)
+    print(f"\n{len(resumos)} arquivo(s) em {duracao:.1f} s ({len(resumos) / duracao * 60:.1f} por minuto); "
+          f"{soma:.1f} s somando as etapas de todos os processos.")
+
+
+def main(argumentos=None):
+    parser = argparse.ArgumentParser(description="Processamento em lote de arquivos .ZIP de NF-e, sem a interface.")
+    parser.add_argument("entradas", nargs="+", help="arquivos .ZIP ou diretórios com arquivos .ZIP")
+    parser.add_argument("--saida", default="saida", help="diretório dos relatórios e do resumo")
+    parser.add_argument("--formatos", default="docx,parquet", help="saídas de cada arquivo: docx, parquet ou ambas")
+    parser.add_argument("--processos", type=int, default=MAX_PROCESSOS_INGESTAO, help="arquivos processados ao mesmo tempo")
+    parser.add_argument("--insights", action="store_true", help="gera os insights da IA (requer GOOGLE_API_KEY)")
+    parser.add_argument("--modelo-falso", action="store_true", help="usa o modelo falso, sem rede, nos insights")
+    parser.add_argument("--requisicoes-por-minuto", type=float, default=None,
+                        help="limite de requisições ao LLM de todo o lote (padrão: NFE_LLM_REQUISICOES_POR_MINUTO)")
+    parser.add_argument("--coluna-cliente", default="nome_destinatario_x")
+    parser.add_argument("--coluna-produto", default="descricao_do_produto_servico")
+    parser.add_argument("--coluna-quantidade", default="quantidade")
+    parser.add_argument("--limite-memoria-mb", type=int, default=LIMITE_MEMORIA_MB)
+    parser.add_argument("--sem-cache", action="store_true", help="não lê nem grava o cache de datasets em disco")
+    args = parser.parse_args(argumentos)
+
+    formatos = {f.strip() for f in args.formatos.split(",") if f.strip()}
+    if not formatos <= {'docx', 'parquet'}:
+        parser.error(f"formatos desconhecidos: {', '.join(sorted(formatos - {'docx', 'parquet'}))}")
+    if args.insights and not args.modelo_falso and not os.environ.get("GOOGLE_API_KEY"):
+        parser.error("--insights requer a variável de ambiente GOOGLE_API_KEY (ou --modelo-falso)")
+    arquivos = listar_zips(args.entradas)
+    if not arquivos:
+        parser.error("nenhum arquivo .ZIP encontrado")
+
+    os.makedirs(args.saida, exist_ok=True)
+    processos = max(1, min(args.processos, len(arquivos)))
+    opcoes = {
+        'saida': args.saida, 'formatos': formatos, 'insights': args.insights, 'modelo_falso': args.modelo_falso,
+        'requisicoes_por_minuto': args.requisicoes_por_minuto, 'processos': processos,
+        'coluna_cliente': args.coluna_cliente, 'coluna_produto': args.coluna_produto,
+        'coluna_quantidade': args.coluna_quantidade, 'limite_memoria_mb': args.limite_memoria_mb,
+        'usar_cache': not args.sem_cache,
+    }
+    print(f"{len(arquivos)} arquivo(s), {processos} processo(s); saídas em {args.saida}")
+
+    inicio = time.perf_counter()
+    resumos = []
+
+    def concluir(resumo):
+        resumos.append(resumo)
+        prefixo = f"[{len(resumos)}/{len(arquivos)}] {os.path.basename(resumo['arquivo'])}"
+        if resumo['erro']:
+            print(f"{prefixo}: FALHA — {resumo['erro']}")
+        else:
+            print(f"{prefixo}: {formatar_inteiro(resumo['itens'])} itens, {formatar_inteiro(resumo['notas'])} notas "
+                  f"em {sum(resumo['tempos'].values()):.2f} s")
+
+    if processos == 1:
+        for caminho in arquivos:
+            concluir(processar_arquivo(caminho, opcoes))
+    else:
+        with ProcessPoolExecutor(max_workers=processos, mp_context=multiprocessing.get_context('spawn')) as pool:
+            futuros = [pool.submit(processar_arquivo, caminho, opcoes) for caminho in arquivos]
+            for futuro in as_completed(futuros):
+                concluir(futuro.result())
+    duracao = time.perf_counter() - inicio
+
+    # Resumo de cada arquivo, na ordem de entrada, para acompanhar os lotes de uma noite para outra
+    ordem = {caminho: i for i, caminho in enumerate(arquivos)}
+    resumos.sort(key=lambda r: ordem[r['arquivo']])
+    linhas = [
+        {'arquivo': r['arquivo'], 'itens': r.get('itens'), 'notas': r.get('notas'), 'faturamento': r.get('faturamento'),
+         **{f"ocorrencias_{nome}": n for nome, n in r.get('ocorrencias', {}).items()},
+         'insights_sem_resposta': r.get('insights_sem_resposta'), 'insights_novas_tentativas': r.get('insights_novas_tentativas'),
+         **{f"segundos_{etapa}": t for etapa, t in r['tempos'].items()}, 'erro': r['erro']}
+        for r in resumos
+    ]
+    pd.DataFrame(linhas).to_csv(os.path.join(args.saida, "resumo.csv"), index=False)
+
+    _imprimir_tempos(resumos, duracao)
+    falhas = [r for r in resumos if r['erro']]
+    for resumo in falhas:
+        print(f"\nFalha em {resumo['arquivo']}:\n{resumo['detalhes']}", file=sys.stderr)
+    return 1 if falhas else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -2,62 +2,128 @@
 
 import streamlit as st
 from langchain_google_genai import ChatGoogleGenerativeAI
-from langchain_experimental.agents.agent_toolkits import create_pandas_dataframe_agent
 
 # Importa o nosso handler de callback final, com o estilo polido
-from utils.callbacks import PolishedCallbackHandler
+from utils.callbacks import PolishedCallbackHandler, TelemetriaCallbackHandler
+from utils.roteador import rotear, redigir_com_llm, prompt_redacao
+from utils.cache_llm import cache_llm
+from utils.agentes import pool_agentes
+from utils.receitas import livro_receitas
+from utils.insights import limitador_llm
+from utils.streaming import ExecucaoEmSegundoPlano
+from utils.relatorio_word import montador_relatorio
 
-def render(df, google_api_key):
+MODELO_LLM = "gemini-1.5-flash"
+
+def render(dataset, google_api_key):
     """
     Renderiza a aba do Agente de Q&A (Perguntas e Respostas).
+    O DataFrame unificado só é montado quando o agente é de fato acionado.
     """
     st.header("💬 Converse com seus Dados")
-    st.write("Faça perguntas em linguagem natural. O processo de raciocínio do agente será exibido no terminal.")
+    st.write("Faça perguntas em linguagem natural. O raciocínio do agente aparece aqui à medida que ele trabalha.")
     
     # Formulário para o usuário inserir a pergunta
     with st.form(key="qa_form"):
         pergunta_usuario = st.text_input("Sua pergunta sobre os dados:", key="pergunta_input")
         submitted = st.form_submit_button("Perguntar ao Agente 🤖")
 
+    if st.session_state.get("parar_agente"):
+        st.info("Execução do agente interrompida.")
+
     # Lógica executada apenas quando o formulário é enviado com uma pergunta
+    # Perguntas conhecidas (faturamento total, top N produtos...) são respondidas direto do cubo, sem LLM
+    resposta_roteada = rotear(dataset, pergunta_usuario) if submitted and pergunta_usuario else None
+    if resposta_roteada is not None and not resposta_roteada.precisa_redacao:
+        st.session_state.chat_history.insert(0, {"pergunta": pergunta_usuario, "resposta": resposta_roteada.texto})
+        st.rerun()
+
     if submitted and pergunta_usuario:
-        # Verifica se a chave de API foi fornecida
-        if google_api_key:
-            # Mostra um spinner na interface enquanto o agente trabalha
-            with st.spinner("O Gemini está pensando... 🧠 (verifique o terminal para o log detalhado)"):
-                
-                # Define o prompt de sistema para guiar o agente
-                AGENT_PREFIX = "Você é um especialista em análise de dados de arquivos CSV, com foco em notas fiscais. Sua principal função é extrair, interpretar e apresentar insights claros e precisos a partir dos dados fornecidos. Você deve responder às perguntas do usuário utilizando as informações contidas no DataFrame, sem fazer suposições ou extrapolações."
-                
-                # Inicializa o modelo de linguagem
-                llm = ChatGoogleGenerativeAI(model="gemini-1.5-flash", google_api_key=google_api_key, temperature=0)
-
-                # Cria a instância do agente, passando o LLM e o DataFrame
-                agent = create_pandas_dataframe_agent(
-                    llm, 
-                    df, 
-                    prefix=AGENT_PREFIX, 
-                    verbose=False, # Desliga o logger padrão do LangChain
-                    allow_dangerous_code=True
-                )
-                
-                try:
+        # Verifica se a chave de API foi fornecida (no modo de reprodução, só o cache é consultado)
+        if google_api_key or cache_llm.reproducao:
+            # Define o prompt de sistema para guiar o agente
+            AGENT_PREFIX = "Você é um especialista em análise de dados de arquivos CSV, com foco em notas fiscais. Sua principal função é extrair, interpretar e apresentar insights claros e precisos a partir dos dados fornecidos. Você deve responder às perguntas do usuário utilizando as informações contidas no DataFrame, sem fazer suposições ou extrapolações."
+
+            def criar_llm():
+                # Inicializa o modelo de linguagem apenas na primeira vez (o cliente fica no pool de agentes)
+                return ChatGoogleGenerativeAI(model=MODELO_LLM, google_api_key=google_api_key, temperature=0, rate_limiter=limitador_llm)
+
+            # Mede a execução do agente (ou da redação) para a telemetria (utils/callbacks.py)
+            telemetria = TelemetriaCallbackHandler('qa')
+
+            def invocar_agente(captura, streaming):
+                # Empresta o agente deste dataset do pool (utils/agentes.py), montado uma única vez
+                with pool_agentes.emprestar(dataset, 'qa', MODELO_LLM, 0, criar_llm, prefixo=AGENT_PREFIX) as agent:
                     # Instancia nosso handler final, dando um nome profissional ao agente
                     handler = PolishedCallbackHandler(agent_name="Analista de Dados de NF-e")
 
-                    # Executa o agente com a pergunta do usuário usando o método mais recente
+                    # Executa o agente com a pergunta do usuário; o código que ele executar com
+                    # sucesso vira a receita da pergunta e os tokens e passos seguem para a tela
                     resposta = agent.invoke(
                         {"input": pergunta_usuario},
-                        config={"callbacks": [handler]}
+                        config={"callbacks": [handler, captura, streaming, telemetria]}
+                    )
+                return resposta['output']
+
+            def responder(streaming):
+                # A mesma pergunta sobre os mesmos dados é respondida pelo cache do LLM (utils/cache_llm.py)
+                if resposta_roteada is not None:
+                    # Os fatos já foram calculados: o LLM apenas redige a resposta
+                    return cache_llm.obter_ou_gerar(
+                        dataset, MODELO_LLM, 0, prompt_redacao(pergunta_usuario, resposta_roteada),
+                        lambda: redigir_com_llm(pool_agentes.cliente_llm(MODELO_LLM, 0, criar_llm), pergunta_usuario,
+                                                resposta_roteada, callbacks=[streaming, telemetria]),
                     )
+                # Uma receita já gravada para a pergunta (utils/receitas.py) dispensa o raciocínio do LLM
+                return cache_llm.obter_ou_gerar(
+                    dataset, MODELO_LLM, 0, pergunta_usuario,
+                    lambda: livro_receitas.responder(
+                        dataset, pergunta_usuario, lambda captura: invocar_agente(captura, streaming),
+                        lambda fatos: redigir_com_llm(pool_agentes.cliente_llm(MODELO_LLM, 0, criar_llm), pergunta_usuario,
+                                                      fatos, callbacks=[streaming, telemetria]),
+                    ),
+                    prefixo=AGENT_PREFIX,
+                )
+
+            # O agente roda em segundo plano (utils/streaming.py) e os tokens e passos aparecem
+            # aqui à medida que chegam. Clicar em "Parar" dispara uma nova execução do script,
+            # que interrompe este laço e cancela o agente no bloco finally.
+            execucao = ExecucaoEmSegundoPlano(responder).iniciar()
+            st.button("⏹️ Parar", key="parar_agente")
+            with st.status("O Gemini está pensando... 🧠", expanded=True) as status:
+                area_passos = st.container()
+                area_texto = st.empty()
+                texto = ""
+                try:
+                    for tipo, dados in execucao.eventos():
+                        if tipo == 'aguardando':
+                            status.update(label=f"O Gemini está pensando... 🧠 ({dados:.0f} s)")
+                        elif tipo == 'inicio_llm':
+                            texto = ""
+                        elif tipo == 'token':
+                            texto += dados
+                            area_texto.markdown(texto + "▌")
+                        elif tipo == 'acao':
+                            area_texto.empty()
+                            area_passos.markdown(f"⚡ **{dados['ferramenta']}**")
+                            area_passos.code(str(dados['entrada']).strip().strip("`"), language="python")
+                        elif tipo == 'observacao':
+                            area_passos.caption(dados[:1000])
+                finally:
+                    execucao.cancelar()
 
-                    # Adiciona a conversa ao histórico e atualiza a interface
-                    st.session_state.chat_history.insert(0, {"pergunta": pergunta_usuario, "resposta": resposta['output']})
-                    st.rerun()
+                if execucao.erro is None:
+                    status.update(label="Resposta pronta!", state="complete", expanded=False)
+                else:
+                    status.update(label="A execução do agente falhou.", state="error")
 
-                except Exception as e:
-                    # Exibe uma mensagem de erro na interface em caso de falha
-                    st.error(f"Ocorreu um erro ao executar o agente: {e}")
+            if execucao.erro is None:
+                # Adiciona a conversa ao histórico e atualiza a interface
+                st.session_state.chat_history.insert(0, {"pergunta": pergunta_usuario, "resposta": execucao.resultado})
+                st.rerun()
+            else:
+                # Exibe uma mensagem de erro na interface em caso de falha
+                st.error(f"Ocorreu um erro ao executar o agente: {execucao.erro}")
         else:
             st.warning("A chave de API do Google é necessária para esta funcionalidade.")
 
@@ -73,13 +139,13 @@ def render(df, google_api_key):
                 
                 # Botão para adicionar a conversa ao relatório final
                 if st.button("📌 Adicionar ao Relatório", key=f"pin_qa_{i}"):
-                    item_para_adicionar = {
+                    item_para_adicionar = montador_relatorio.preparar({
                         "type": "qa", 
                         "category": "q&a",
                         "title": f"Pergunta: {conversa['pergunta'][:50]}...",
                         "content": conversa
-                    }
-                    if item_para_adicionar not in st.session_state.report_items:
+                    })
+                    if not montador_relatorio.contem(st.session_state.report_items, item_para_adicionar):
                         st.session_state.report_items.append(item_para_adicionar)
                         st.success("Adicionado ao relatório! Veja na barra lateral.")
                         st.rerun()
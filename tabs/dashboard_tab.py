@@ -3,6 +3,10 @@
 import streamlit as st
 import pandas as pd
 import plotly.express as px
+from utils.cubo import DIMENSAO_DATA
+from utils.indicadores import calcular_kpis, calcular_top_n, calcular_serie_diaria
+from utils.relatorio_word import montador_relatorio
+from tabs.exportacao import botoes_exportacao
 
 def formatar_numero(numero):
     """Função auxiliar para formatar números no padrão brasileiro."""
@@ -10,10 +14,12 @@ def formatar_numero(numero):
         return "N/A"
     return f"{numero:,.2f}".replace(",", "v").replace(".", ",").replace("v", ".")
 
-def render(df):
+def render(dataset):
     """
     Renderiza a aba do Dashboard com mapeamento de colunas interno e botões de "pin" individuais.
+    Todos os KPIs e gráficos são respondidos pelo cubo OLAP pré-calculado do dataset.
     """
+    cubo = dataset.cubo
     st.header("📊 Painel de Controle de Vendas")
     st.write("Análise dos principais indicadores e insights extraídos das notas fiscais.")
 
@@ -21,8 +27,9 @@ def render(df):
     with st.expander("Configurar Mapeamento de Colunas Essenciais", expanded=True):
         st.info("Para que os KPIs e gráficos principais funcionem, por favor, indique quais colunas correspondem a cada conceito de negócio.")
         
-        # Prepara a lista de colunas disponíveis para o usuário escolher
-        lista_colunas_disponiveis = ["Selecione uma coluna..."] + sorted(df.columns.tolist())
+        # As opções são as dimensões e medidas do cubo pré-calculado
+        lista_colunas_disponiveis = ["Selecione uma coluna..."] + sorted(d for d in cubo.dimensoes if d != DIMENSAO_DATA)
+        lista_medidas_disponiveis = ["Selecione uma coluna..."] + [m for m in cubo.medidas if m != 'valor_total']
         
         col1, col2, col3 = st.columns(3)
         with col1:
@@ -40,7 +47,7 @@ def render(df):
         with col3:
             col_quantidade = st.selectbox(
                 "Coluna de **Quantidade** de Itens:",
-                options=lista_colunas_disponiveis, 
+                options=lista_medidas_disponiveis, 
                 key="map_quantidade"
             )
 
@@ -54,10 +61,11 @@ def render(df):
     # --- 2. CÁLCULOS E EXIBIÇÃO DOS KPIs ---
     st.subheader("Indicadores Chave de Performance (KPIs)")
     
-    valor_total_faturado = df['valor_total'].sum()
-    quantidade_total_itens = df[coluna_quantidade].sum() if coluna_quantidade else "N/A"
-    num_notas_unicas = df['chave_de_acesso'].nunique()
-    num_clientes_unicos = df[coluna_cliente].nunique() if coluna_cliente else "N/A"
+    kpis = calcular_kpis(dataset, coluna_quantidade, coluna_cliente)
+    valor_total_faturado = kpis['valor_total']
+    quantidade_total_itens = kpis['quantidade']
+    num_notas_unicas = kpis['notas']
+    num_clientes_unicos = kpis['clientes']
 
     kpi1, kpi2, kpi3, kpi4 = st.columns(4)
     with kpi1:
@@ -81,17 +89,19 @@ def render(df):
 
     with col_a:
         if coluna_cliente:
-            top_10_clientes = df.groupby(coluna_cliente)['valor_total'].sum().nlargest(10).sort_values()
+            top_10_clientes = calcular_top_n(dataset, coluna_cliente, 'valor_total', 10).sort_values()
             fig_clientes = px.bar(
                 top_10_clientes, x='valor_total', y=top_10_clientes.index, orientation='h',
                 title="🏆 Top 10 Clientes por Valor de Compra", labels={'valor_total': 'Valor Total (R$)', 'y': 'Cliente'}, text_auto='.2s'
             )
             fig_clientes.update_layout(showlegend=False, yaxis={'categoryorder':'total ascending'})
             st.plotly_chart(fig_clientes, use_container_width=True)
+            with st.expander("📥 Exportar dados do gráfico"):
+                botoes_exportacao(top_10_clientes, "top_clientes", "top_clientes")
 
             if st.button("📌 Adicionar Gráfico de Clientes ao Relatório", key="pin_clientes"):
                 item = {"type": "chart", "category": "dashboard", "title": "Gráfico: Top 10 Clientes", "content": {"titulo": "Top 10 Clientes por Valor de Compra", "dados": top_10_clientes, "metrica": "Valor Total (R$)", "fig": fig_clientes}}
-                st.session_state.report_items.append(item)
+                st.session_state.report_items.append(montador_relatorio.preparar(item))
                 st.success("Gráfico de Clientes adicionado!")
                 st.rerun()
         else:
@@ -99,32 +109,36 @@ def render(df):
 
     with col_b:
         if coluna_produto:
-            top_10_produtos = df.groupby(coluna_produto)['valor_total'].sum().nlargest(10).sort_values()
+            top_10_produtos = calcular_top_n(dataset, coluna_produto, 'valor_total', 10).sort_values()
             fig_produtos = px.bar(
                 top_10_produtos, x='valor_total', y=top_10_produtos.index, orientation='h',
                 title="🛍️ Top 10 Produtos por Faturamento", labels={'valor_total': 'Valor Total (R$)', 'y': 'Produto'}, text_auto='.2s'
             )
             fig_produtos.update_layout(yaxis={'categoryorder':'total ascending'})
             st.plotly_chart(fig_produtos, use_container_width=True)
+            with st.expander("📥 Exportar dados do gráfico"):
+                botoes_exportacao(top_10_produtos, "top_produtos", "top_produtos")
             
             if st.button("📌 Adicionar Gráfico de Produtos ao Relatório", key="pin_produtos"):
                 item = {"type": "chart", "category": "dashboard", "title": "Gráfico: Top 10 Produtos", "content": {"titulo": "Top 10 Produtos por Faturamento", "dados": top_10_produtos, "metrica": "Valor Total (R$)", "fig": fig_produtos}}
-                st.session_state.report_items.append(item)
+                st.session_state.report_items.append(montador_relatorio.preparar(item))
                 st.success("Gráfico de Produtos adicionado!")
                 st.rerun()
         else:
             st.info("Selecione a coluna de 'Produto' no mapeamento para ver o ranking de produtos.")
 
-    vendas_no_tempo = df.set_index('data_emissao_x').resample('D')['valor_total'].sum()
+    vendas_no_tempo = calcular_serie_diaria(dataset, 'valor_total')
     fig_tempo = px.line(
         vendas_no_tempo, x=vendas_no_tempo.index, y='valor_total',
         title="📈 Faturamento Diário ao Longo do Tempo", labels={'data_emissao_x': 'Data', 'valor_total': 'Faturamento (R$)'}, markers=True
     )
     st.plotly_chart(fig_tempo, use_container_width=True)
+    with st.expander("📥 Exportar dados do gráfico"):
+        botoes_exportacao(vendas_no_tempo, "faturamento_diario", "faturamento_diario")
     
     if st.button("📌 Adicionar Gráfico de Tempo ao Relatório", key="pin_tempo"):
         item = {"type": "chart", "category": "dashboard", "title": "Gráfico: Vendas no Tempo", "content": {"titulo": "Faturamento Diário ao Longo do Tempo", "dados": vendas_no_tempo, "metrica": "Faturamento (R$)", "fig": fig_tempo}}
-        st.session_state.report_items.append(item)
+        st.session_state.report_items.append(montador_relatorio.preparar(item))
         st.success("Gráfico de Vendas no Tempo adicionado!")
         st.rerun()
 
@@ -134,10 +148,8 @@ def render(df):
     with st.expander("🔬 Análise Detalhada e Personalizada (Deep Dive)"):
         st.write("Use as opções abaixo para cruzar diferentes dimensões e métricas dos dados.")
         
-        colunas_numericas_expander = df.select_dtypes(include='number').columns.tolist()
-        colunas_categoricas_expander = df.select_dtypes(include=['object', 'category']).columns.tolist()
-        colunas_a_remover_num = ['modelo_x', 'serie_x', 'numero_x', 'numero_produto', 'modelo_y', 'serie_y', 'numero_y']
-        colunas_numericas_expander = [col for col in colunas_numericas_expander if col not in colunas_a_remover_num]
+        colunas_numericas_expander = cubo.medidas
+        colunas_categoricas_expander = [d for d in cubo.dimensoes if d != DIMENSAO_DATA]
         
         if colunas_categoricas_expander and colunas_numericas_expander:
             c1, c2, c3, c4 = st.columns(4)
@@ -151,7 +163,7 @@ def render(df):
             with c4:
                 tipo_grafico = st.selectbox("Tipo de Gráfico:", options=["Barras", "Pizza"], key="grafico_detalhado")
 
-            dados_agrupados = df.groupby(dimensao)[metrica].sum().nlargest(top_n)
+            dados_agrupados = calcular_top_n(dataset, dimensao, metrica, top_n)
             titulo_grafico = f"Top {top_n} {dimensao} por Soma de {metrica}"
             
             fig_detalhada = None
@@ -162,10 +174,12 @@ def render(df):
             
             if fig_detalhada:
                 st.plotly_chart(fig_detalhada, use_container_width=True)
+                # Já dentro de um expander (o Streamlit não permite aninhá-los)
+                botoes_exportacao(dados_agrupados, "analise_detalhada", "analise_detalhada")
 
                 if st.button("📌 Adicionar Gráfico ao Relatório", key="pin_chart_detalhado"):
-                    item_para_adicionar = {"type": "chart", "category": "dashboard", "title": f"Gráfico: {titulo_grafico[:40]}...", "content": {"titulo": titulo_grafico, "dados": dados_agrupados, "metrica": metrica, "fig": fig_detalhada}}
-                    if item_para_adicionar not in st.session_state.report_items:
+                    item_para_adicionar = montador_relatorio.preparar({"type": "chart", "category": "dashboard", "title": f"Gráfico: {titulo_grafico[:40]}...", "content": {"titulo": titulo_grafico, "dados": dados_agrupados, "metrica": metrica, "fig": fig_detalhada}})
+                    if not montador_relatorio.contem(st.session_state.report_items, item_para_adicionar):
                         st.session_state.report_items.append(item_para_adicionar)
                         st.success("Gráfico adicionado ao relatório!")
                         st.rerun()
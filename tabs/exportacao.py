@@ -0,0 +1,25 @@
+# tabs/exportacao.py
+
+import functools
+import streamlit as st
+from utils.exportacao import FORMATOS, exportar
+
+
+def botoes_exportacao(dados, nome_arquivo, chave):
+    """
+    Botões de download de `dados` (DatasetNFe, DataFrame ou Series) em XLSX, CSV compactado e
+    Parquet. O arquivo só é gerado quando o botão é clicado, em blocos (utils/exportacao.py), e
+    o clique não executa a página de novo.
+    """
+    colunas = st.columns(len(FORMATOS))
+    for coluna, (formato, (extensao, mime, rotulo)) in zip(colunas, FORMATOS.items()):
+        with coluna:
+            st.download_button(
+                label=f"📥 {rotulo}",
+                data=functools.partial(exportar, dados, formato),
+                file_name=f"{nome_arquivo}.{extensao}",
+                mime=mime,
+                key=f"exportar_{chave}_{formato}",
+                on_click="ignore",
+                use_container_width=True,
+            )
@@ -1,15 +1,20 @@
 # tabs/report_tab.py
 
 import streamlit as st
-from utils.processing import criar_documento_word
+from utils.relatorio_word import montador_relatorio
+from utils.graficos import servico_graficos
 import plotly.express as px
 
 # Importa os componentes de IA necessários
 from langchain_google_genai import ChatGoogleGenerativeAI
-from langchain_experimental.agents.agent_toolkits import create_pandas_dataframe_agent
-from utils.callbacks import PolishedCallbackHandler
+from utils.callbacks import PolishedCallbackHandler, TelemetriaCallbackHandler
+from utils.cache_llm import cache_llm
+from utils.agentes import pool_agentes
+from utils.insights import limitador_llm
 
-def render(df, google_api_key):
+MODELO_LLM = "gemini-1.5-flash"
+
+def render(dataset, google_api_key):
     st.header("📄 Montador de Relatório Personalizado")
     st.write("Visualize, organize e exporte os insights que você selecionou.")
     st.markdown("---")
@@ -49,42 +54,50 @@ def render(df, google_api_key):
                         st.session_state.report_items.pop(i)
                         st.rerun()
 
+    # Com gráficos no relatório, o renderizador de imagens já começa a ser preparado para a exportação
+    if any(item['type'] == 'chart' for item in st.session_state.report_items):
+        servico_graficos.aquecer()
+
     st.markdown("---")
     st.header("Finalizar e Exportar")
 
     # --- LÓGICA DO SUMÁRIO COM IA AGORA IMPLEMENTADA ---
     if st.button("🤖 Gerar Sumário Executivo com IA e Adicionar ao Topo", use_container_width=True):
-        if not google_api_key:
+        if not google_api_key and not cache_llm.reproducao:
             st.warning("A chave de API do Google é necessária para esta funcionalidade.")
         else:
             with st.spinner("O agente está lendo todos os dados para criar um sumário executivo..."):
                 try:
-                    # Prepara o agente
-                    llm = ChatGoogleGenerativeAI(model="gemini-1.5-flash", google_api_key=google_api_key, temperature=0.2)
-                    handler = PolishedCallbackHandler(agent_name="Analista Estratégico de IA")
-                    # Passamos o DataFrame original (df) para uma análise completa
-                    agent = create_pandas_dataframe_agent(llm, df, verbose=False, allow_dangerous_code=True, handle_parsing_errors=True)
-                    
                     # Prompt para o sumário
                     prompt_sumario = """
                     Analisando o DataFrame como um todo, escreva um sumário executivo conciso em 2 ou 3 bullet points.
                     Destaque os insights mais importantes sobre o faturamento geral, os produtos ou clientes de maior destaque,
                     e qualquer padrão ou anomalia notável que você encontrar.
                     """
-                    
-                    # Invoca o agente
-                    resposta = agent.invoke({"input": prompt_sumario}, config={"callbacks": [handler]})
+
+                    def criar_llm():
+                        return ChatGoogleGenerativeAI(model=MODELO_LLM, google_api_key=google_api_key, temperature=0.2, rate_limiter=limitador_llm)
+
+                    def invocar_agente():
+                        # Empresta o agente do pool (utils/agentes.py), montado sobre o DataFrame original completo
+                        handler = PolishedCallbackHandler(agent_name="Analista Estratégico de IA")
+                        with pool_agentes.emprestar(dataset, 'sumario', MODELO_LLM, 0.2, criar_llm, agent_executor_kwargs={"handle_parsing_errors": True}) as agent:
+                            # Invoca o agente
+                            return agent.invoke({"input": prompt_sumario}, config={"callbacks": [handler, TelemetriaCallbackHandler('sumario')]})['output']
+
+                    # O sumário dos mesmos dados é reaproveitado do cache do LLM (utils/cache_llm.py)
+                    texto_sumario = cache_llm.obter_ou_gerar(dataset, MODELO_LLM, 0.2, prompt_sumario, invocar_agente)
                     
                     # Cria o item do relatório
                     item_sumario = {
                         "type": "summary",
                         "category": "summary_ia",
                         "title": "Sumário Executivo Gerado por IA",
-                        "content": {"texto": resposta['output']}
+                        "content": {"texto": texto_sumario}
                     }
                     
                     # Adiciona o sumário no TOPO da lista de itens
-                    st.session_state.report_items.insert(0, item_sumario)
+                    st.session_state.report_items.insert(0, montador_relatorio.preparar(item_sumario))
                     st.success("Sumário gerado e adicionado ao topo do relatório!")
                     st.rerun()
 
@@ -93,12 +106,12 @@ def render(df, google_api_key):
 
     # Botão de download para o documento Word
     if st.session_state.report_items:
-        with st.spinner("Montando seu relatório profissional..."):
-            word_buffer = criar_documento_word(st.session_state.report_items)
-        
+        # Os itens já foram renderizados ao serem fixados (utils/relatorio_word.py): o documento só é
+        # montado, a partir dos fragmentos, quando o usuário clica em exportar
+        itens = list(st.session_state.report_items)
         st.download_button(
             label="📥 Exportar Relatório Final para Word (.docx)",
-            data=word_buffer,
+            data=lambda: montador_relatorio.documento(itens),
             file_name="relatorio_final_analise_nfs.docx",
             mime="application/vnd.openxmlformats-officedocument.wordprocessingml.document",
             use_container_width=True
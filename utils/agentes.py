@@ -0,0 +1,137 @@
+# utils/agentes.py
+
+import os
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+from langchain_experimental.agents.agent_toolkits import create_pandas_dataframe_agent
+from utils.callbacks import ContadorTokensCallbackHandler
+from utils.perfil import montar_prefixo
+from utils.sandbox import pool_sandbox, usar_sandbox, renovar_namespace
+
+# --- POOL DE AGENTES E CLIENTES DO LLM ---
+# Quantos datasets mantêm agentes prontos ao mesmo tempo (os usados há mais tempo são descartados).
+LIMITE_DATASETS_AGENTES = int(os.environ.get("NFE_AGENTES_DATASETS", "2"))
+# Agentes ociosos guardados por papel; os excedentes são descartados ao serem devolvidos.
+MAX_AGENTES_OCIOSOS = int(os.environ.get("NFE_AGENTES_OCIOSOS", "4"))
+
+
+class PoolAgentes:
+    """
+    Agentes pandas e clientes do LLM reaproveitados entre execuções, abas e sessões.
+
+    Montar um agente recria a ferramenta de Python, o prompt e o `df.head()` embutido nele;
+    aqui cada agente é montado uma vez por (dataset, papel, modelo, temperatura, prefixo) e
+    emprestado a quem precisa com `emprestar`, que garante uso exclusivo: duas perguntas
+    simultâneas recebem agentes diferentes, e o agente volta ao pool ao final. Cada empréstimo
+    começa com variáveis novas no sandbox, como um agente recém-montado. Os clientes do
+    LLM são compartilhados por (modelo, temperatura) e registram os tokens de cada chamada
+    (utils/callbacks.py). O prompt dos agentes traz o perfil compacto do dataset
+    (utils/perfil.py) no lugar das primeiras linhas do DataFrame, e o código que eles escrevem
+    roda no sandbox (utils/sandbox.py), fora do processo da aplicação.
+
+    Os agentes guardam uma referência ao DataFrame, então só os datasets usados mais
+    recentemente (LIMITE_DATASETS_AGENTES) mantêm agentes; os demais são descartados, assim
+    como os de um dataset removido com `descartar`.
+    """
+
+    def __init__(self, limite_datasets=LIMITE_DATASETS_AGENTES, max_ociosos=MAX_AGENTES_OCIOSOS):
+        self.limite_datasets = max(1, limite_datasets)
+        self.max_ociosos = max(1, max_ociosos)
+        # {identificação do dataset: {chave do agente: [agentes ociosos]}}
+        self._ociosos = OrderedDict()
+        self._clientes = {}
+        self._lock = threading.Lock()
+        self.criados = 0
+        self.reaproveitados = 0
+
+    @staticmethod
+    def identificar(dataset):
+        """Identificação do dataset: conteúdo dos ZIPs e estado do filtro (ou o próprio objeto)."""
+        if dataset.hash_conteudo is None:
+            return ('objeto', id(dataset))
+        return (dataset.hash_conteudo, dataset.estado_filtro)
+
+    def cliente_llm(self, modelo, temperatura, criar_llm):
+        """Cliente do LLM compartilhado para (modelo, temperatura), criado por `criar_llm()` na primeira vez."""
+        chave = (modelo, temperatura)
+        with self._lock:
+            cliente = self._clientes.get(chave)
+        if cliente is None:
+            cliente = criar_llm()
+            cliente.callbacks = [*(cliente.callbacks or []), ContadorTokensCallbackHandler(modelo)]
+            with self._lock:
+                cliente = self._clientes.setdefault(chave, cliente)
+        return cliente
+
+    def _retirar(self, identificacao, chave):
+        with self._lock:
+            agentes = self._ociosos.get(identificacao, {}).get(chave)
+            if identificacao in self._ociosos:
+                self._ociosos.move_to_end(identificacao)
+            if agentes:
+                self.reaproveitados += 1
+                return agentes.pop()
+            self.criados += 1
+            return None
+
+    def _devolver(self, identificacao, chave, agente):
+        with self._lock:
+            por_chave = self._ociosos.get(identificacao)
+            if por_chave is None:
+                por_chave = self._ociosos[identificacao] = {}
+                while len(self._ociosos) > self.limite_datasets:
+                    self._ociosos.popitem(last=False)
+            self._ociosos.move_to_end(identificacao)
+            agentes = por_chave.setdefault(chave, [])
+            if len(agentes) < self.max_ociosos:
+                agentes.append(agente)
+
+    @contextmanager
+    def emprestar(self, dataset, papel, modelo, temperatura, criar_llm, prefixo=None, **opcoes):
+        """
+        Empresta um agente pandas sobre `dataset.df` para o papel informado ("qa", "insights"...),
+        montando-o na primeira vez. `prefixo` são as instruções do papel, que antecedem o perfil
+        do dataset. `opcoes` vão para `create_pandas_dataframe_agent` e devem ser sempre as
+        mesmas para um mesmo papel.
+        """
+        identificacao = self.identificar(dataset)
+        chave = (papel, modelo, temperatura, prefixo)
+        agente = self._retirar(identificacao, chave)
+        if agente is None:
+            llm = self.cliente_llm(modelo, temperatura, criar_llm)
+            agente = create_pandas_dataframe_agent(
+                llm, dataset.df, prefix=montar_prefixo(dataset, prefixo), include_df_in_prompt=False,
+                verbose=False, allow_dangerous_code=True, **opcoes
+            )
+            usar_sandbox(agente, dataset, pool_sandbox)
+        else:
+            # Cada empréstimo tem o seu namespace: variáveis de uma pergunta anterior (de outra
+            # sessão, inclusive) não vazam para a próxima.
+            renovar_namespace(agente)
+        try:
+            yield agente
+        finally:
+            # Um agente cuja execução falhou também volta ao pool: o DataFrame dele não muda.
+            self._devolver(identificacao, chave, agente)
+
+    def descartar(self, dataset=None):
+        """Descarta os agentes do dataset (ou de todos, se nenhum for informado) e a cópia dele no sandbox."""
+        with self._lock:
+            if dataset is None:
+                self._ociosos.clear()
+            else:
+                self._ociosos.pop(self.identificar(dataset), None)
+        pool_sandbox.descartar(dataset)
+
+    def estatisticas(self):
+        with self._lock:
+            return {
+                'datasets': len(self._ociosos),
+                'ociosos': sum(len(agentes) for por_chave in self._ociosos.values() for agentes in por_chave.values()),
+                'criados': self.criados,
+                'reaproveitados': self.reaproveitados,
+            }
+
+
+pool_agentes = PoolAgentes()
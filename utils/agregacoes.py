@@ -0,0 +1,114 @@
+# utils/agregacoes.py
+
+import functools
+import os
+import sys
+import threading
+from collections import OrderedDict
+import pandas as pd
+
+# Memória máxima (MB) ocupada pelos resultados de análises memorizados.
+LIMITE_AGREGACOES_MB = int(os.environ.get("NFE_CACHE_AGREGACOES_MB", "256"))
+
+
+def _tamanho_resultado(resultado):
+    """Estimativa em bytes da memória ocupada por um resultado de análise."""
+    if isinstance(resultado, (pd.DataFrame, pd.Series)):
+        uso = resultado.memory_usage(deep=True)
+        return int(uso.sum()) if isinstance(uso, pd.Series) else int(uso)
+    if isinstance(resultado, (tuple, list)):
+        return sys.getsizeof(resultado) + sum(_tamanho_resultado(r) for r in resultado)
+    if isinstance(resultado, dict):
+        return sys.getsizeof(resultado) + sum(_tamanho_resultado(r) for r in resultado.values())
+    if hasattr(resultado, '__dict__'):
+        return sys.getsizeof(resultado) + _tamanho_resultado(vars(resultado))
+    return sys.getsizeof(resultado)
+
+
+class CacheAgregacoes:
+    """
+    Memoriza os resultados das análises das abas (agregados, tabelas de inconsistências,
+    rankings...) pela chave (dataset, estado do filtro, análise, parâmetros).
+
+    O dataset é identificado pelo hash do conteúdo dos ZIPs e o estado do filtro é o mesmo
+    usado pelo IndiceFiltro, então voltar a uma combinação de filtros já vista devolve o
+    resultado sem recalcular nada. A memória ocupada é limitada: quando o total estimado
+    passa do limite, os resultados usados há mais tempo são descartados (LRU).
+
+    Os resultados são compartilhados entre as execuções e não devem ser alterados por quem
+    os recebe.
+    """
+
+    def __init__(self, limite_mb=LIMITE_AGREGACOES_MB):
+        self.limite_bytes = limite_mb * 1024 * 1024
+        self._entradas = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.acertos = 0
+        self.falhas = 0
+
+    @staticmethod
+    def chave(dataset, nome, args=(), kwargs=None):
+        """Chave da análise, ou None quando o dataset não tem identificação de conteúdo."""
+        if dataset.hash_conteudo is None:
+            return None
+        return (dataset.hash_conteudo, dataset.estado_filtro, nome, tuple(args), tuple(sorted((kwargs or {}).items())))
+
+    def obter_ou_calcular(self, dataset, nome, funcao, *args, **kwargs):
+        """Devolve o resultado memorizado de `funcao(dataset, *args, **kwargs)`, calculando-o se preciso."""
+        chave = self.chave(dataset, nome, args, kwargs)
+        if chave is not None:
+            with self._lock:
+                if chave in self._entradas:
+                    self._entradas.move_to_end(chave)
+                    self.acertos += 1
+                    return self._entradas[chave][0]
+                self.falhas += 1
+
+        resultado = funcao(dataset, *args, **kwargs)
+        if chave is not None:
+            self._guardar(chave, resultado)
+        return resultado
+
+    def _guardar(self, chave, resultado):
+        tamanho = _tamanho_resultado(resultado)
+        if tamanho > self.limite_bytes:
+            return
+        with self._lock:
+            if chave in self._entradas:
+                self._bytes -= self._entradas.pop(chave)[1]
+            self._entradas[chave] = (resultado, tamanho)
+            self._bytes += tamanho
+            while self._bytes > self.limite_bytes:
+                _, (_, tamanho_removido) = self._entradas.popitem(last=False)
+                self._bytes -= tamanho_removido
+
+    def limpar(self):
+        with self._lock:
+            self._entradas.clear()
+            self._bytes = 0
+
+    def estatisticas(self):
+        with self._lock:
+            return {
+                'entradas': len(self._entradas),
+                'memoria_mb': self._bytes / (1024 * 1024),
+                'acertos': self.acertos,
+                'falhas': self.falhas,
+            }
+
+
+cache_agregacoes = CacheAgregacoes()
+
+
+def memorizar_agregacao(funcao):
+    """
+    Decorador para funções de análise com a assinatura `funcao(dataset, *parametros)`.
+    Os parâmetros precisam ser hasheáveis (nomes de colunas, números...).
+    """
+    nome = f"{funcao.__module__}.{funcao.__qualname__}"
+
+    @functools.wraps(funcao)
+    def memorizada(dataset, *args, **kwargs):
+        return cache_agregacoes.obter_ou_calcular(dataset, nome, funcao, *args, **kwargs)
+    return memorizada
@@ -0,0 +1,216 @@
+# utils/benchmark.py
+
+import argparse
+import os
+import shutil
+import tempfile
+import time
+import uuid
+import numpy as np
+from utils.agentes import PoolAgentes
+from utils.cache_llm import CacheRespostasLLM
+from utils.callbacks import TelemetriaCallbackHandler, registro_telemetria
+from utils.insights import GeradorInsights, criar_limitador_taxa
+from utils.modelo_falso import ModeloReActFalso
+from utils.processing import processar_zips
+from utils.receitas import LivroReceitas
+from utils.roteador import redigir_com_llm
+from utils.sandbox import pool_sandbox
+from utils.streaming import ExecucaoEmSegundoPlano
+
+# --- BENCHMARK DOS AGENTES SEM REDE ---
+# Executa os fluxos de agente das abas de Q&A, insights e relatório com o ModeloReActFalso
+# (utils/modelo_falso.py) no lugar do Gemini e mede quanto tempo a aplicação gasta além da
+# latência simulada do LLM, como as tentativas se comportam sob falhas e a vazão dos
+# insights com diferentes níveis de concorrência.
+#
+#     python -m utils.benchmark dados.zip --latencia 0.2 --concorrencia 1,4,8 --taxa-falhas 0.1
+#
+# O cache do LLM e as receitas ficam em um diretório temporário, e cada pergunta é única:
+# todas as execuções passam de fato pelo agente.
+MODELO = "modelo-react-falso"
+PREFIXO_QA = "Você é um especialista em análise de dados de notas fiscais."
+PROMPT_SUMARIO = "Escreva um sumário executivo conciso em 2 ou 3 bullet points sobre os dados."
+OPCOES_AGENTE = {'agent_executor_kwargs': {'handle_parsing_errors': True}}
+
+
+def _percentis(valores):
+    if not valores:
+        return "-"
+    p50, p90, p99 = np.percentile(valores, [50, 90, 99])
+    return f"p50 {p50 * 1000:8.1f} ms | p90 {p90 * 1000:8.1f} ms | p99 {p99 * 1000:8.1f} ms"
+
+
+def _pergunta(rotulo, indice):
+    # Perguntas únicas, que o roteador não reconhece, para não haver acertos de cache nem de receitas
+    return f"Pergunta de benchmark {rotulo} {indice} ({uuid.uuid4().hex[:8]}): descreva os dados."
+
+
+class Benchmark:
+    """Os cenários do benchmark sobre um dataset, com cache, receitas e pool de agentes próprios."""
+
+    def __init__(self, dataset, modelo, diretorio, repeticoes):
+        self.dataset = dataset
+        self.modelo = modelo
+        self.repeticoes = repeticoes
+        self.cache = CacheRespostasLLM(os.path.join(diretorio, "respostas_llm.sqlite3"), reproducao=False)
+        self.receitas = LivroReceitas(os.path.join(diretorio, "receitas.json"))
+        self.pool = PoolAgentes()
+
+    def criar_llm(self):
+        return self.modelo
+
+    def _medir(self, aba, executar):
+        """Executa `executar(indice)` em sequência e imprime duração, sobrecarga e ferramentas por execução."""
+        registro_telemetria.execucoes.pop(aba, None)
+        duracoes, sobrecargas = [], []
+        falhas = 0
+        for indice in range(self.repeticoes):
+            simulado = self.modelo.estatisticas()['tempo_simulado']
+            inicio = time.perf_counter()
+            try:
+                executar(indice)
+            except Exception:
+                # Como nas abas, uma execução que falhou não é repetida
+                falhas += 1
+                continue
+            duracao = time.perf_counter() - inicio
+            execucao = registro_telemetria.execucoes[aba][-1]
+            ferramentas = sum(f['duracao'] for f in execucao['ferramentas'])
+            duracoes.append(duracao)
+            sobrecargas.append(duracao - (self.modelo.estatisticas()['tempo_simulado'] - simulado) - ferramentas)
+        execucoes = [e for e in registro_telemetria.execucoes.get(aba, []) if e['erro'] is None]
+        print(f"  {self.repeticoes} execuções, {falhas} falhas")
+        if not execucoes:
+            return
+        print(f"  duração total      {_percentis(duracoes)}")
+        print(f"  sobrecarga         {_percentis(sobrecargas)}  (duração − latência simulada − ferramentas)")
+        print(f"  ferramentas        {_percentis([sum(f['duracao'] for f in e['ferramentas']) for e in execucoes])}")
+        print(f"  iterações p50 {np.percentile([e['iteracoes'] for e in execucoes], 50):.0f}, "
+              f"tokens p50 {np.percentile([e['tokens_entrada'] + e['tokens_saida'] for e in execucoes], 50):.0f}")
+
+    def qa(self):
+        """Fluxo da aba de Q&A: agente em segundo plano, com streaming dos tokens, receitas e cache."""
+        print("\n[Q&A] agente em segundo plano com streaming")
+        primeiros_tokens = []
+
+        def executar(indice):
+            pergunta = _pergunta("qa", indice)
+            telemetria = TelemetriaCallbackHandler('qa')
+
+            def invocar_agente(captura, streaming):
+                with self.pool.emprestar(self.dataset, 'qa', MODELO, 0, self.criar_llm, prefixo=PREFIXO_QA) as agente:
+                    return agente.invoke({"input": pergunta},
+                                         config={"callbacks": [captura, streaming, telemetria]})['output']
+
+            def responder(streaming):
+                return self.cache.obter_ou_gerar(
+                    self.dataset, MODELO, 0, pergunta,
+                    lambda: self.receitas.responder(
+                        self.dataset, pergunta, lambda captura: invocar_agente(captura, streaming),
+                        lambda fatos: redigir_com_llm(self.pool.cliente_llm(MODELO, 0, self.criar_llm), pergunta, fatos,
+                                                      callbacks=[streaming, telemetria]),
+                    ),
+                    prefixo=PREFIXO_QA,
+                )
+
+            inicio = time.perf_counter()
+            execucao = ExecucaoEmSegundoPlano(responder).iniciar()
+            for tipo, _ in execucao.eventos(intervalo=0.05):
+                if tipo == 'token' and len(primeiros_tokens) <= indice:
+                    primeiros_tokens.append(time.perf_counter() - inicio)
+            if execucao.erro is not None:
+                raise execucao.erro
+
+        self._medir('qa', executar)
+        print(f"  primeiro token     {_percentis(primeiros_tokens)}")
+
+    def sumario(self):
+        """Fluxo do sumário executivo da aba de relatório."""
+        print("\n[Relatório] sumário executivo")
+
+        def executar(indice):
+            prompt = f"{PROMPT_SUMARIO} ({_pergunta('sumario', indice)})"
+
+            def invocar_agente():
+                with self.pool.emprestar(self.dataset, 'sumario', MODELO, 0.2, self.criar_llm, **OPCOES_AGENTE) as agente:
+                    return agente.invoke({"input": prompt},
+                                         config={"callbacks": [TelemetriaCallbackHandler('sumario')]})['output']
+
+            self.cache.obter_ou_gerar(self.dataset, MODELO, 0.2, prompt, invocar_agente)
+
+        self._medir('sumario', executar)
+
+    def insights(self, perguntas, concorrencias, espera_maxima):
+        """Fluxo da aba de insights: vazão e tentativas com diferentes níveis de concorrência."""
+        print(f"\n[Insights] {perguntas} perguntas por rodada")
+        for concorrencia in concorrencias:
+            registro_telemetria.execucoes.pop('insights', None)
+            antes = self.modelo.estatisticas()
+            gerador = GeradorInsights(self.dataset, self.criar_llm, modelo=MODELO, max_concorrencia=concorrencia,
+                                      espera_maxima=espera_maxima, cache=self.cache, pool=self.pool,
+                                      receitas=self.receitas, exibir_passos=False)
+            inicio = time.perf_counter()
+            resultados = gerador.gerar([_pergunta(f"insights-{concorrencia}", i) for i in range(perguntas)])
+            duracao = time.perf_counter() - inicio
+            depois = self.modelo.estatisticas()
+            execucoes = list(registro_telemetria.execucoes.get('insights', []))
+            print(
+                f"  concorrência {concorrencia:>2}: {perguntas / duracao:6.2f} perguntas/s ({duracao:.2f} s); "
+                f"{len(execucoes)} execuções do agente, {sum(1 for e in execucoes if e['tentativa'] > 1)} novas tentativas, "
+                f"{sum(1 for r in resultados if r.get('erro'))} perguntas sem resposta; "
+                f"{depois['falhas'] - antes['falhas']} falhas e "
+                f"{depois['mal_formatadas'] - antes['mal_formatadas']} respostas mal formatadas simuladas"
+            )
+            print(f"      duração por execução {_percentis([e['duracao'] for e in execucoes])}")
+
+
+def main(argumentos=None):
+    parser = argparse.ArgumentParser(description="Benchmark dos fluxos de agente com um LLM falso, sem rede.")
+    parser.add_argument("zips", nargs="+", help="arquivos .ZIP com Cabecalho.csv e Itens.csv")
+    parser.add_argument("--latencia", type=float, default=0.2, help="latência simulada de cada chamada ao LLM (s)")
+    parser.add_argument("--variacao", type=float, default=0.05, help="variação aleatória da latência (s)")
+    parser.add_argument("--latencia-por-token", type=float, default=0.0, help="latência de cada token em streaming (s)")
+    parser.add_argument("--taxa-falhas", type=float, default=0.0, help="probabilidade de falha de cada chamada")
+    parser.add_argument("--taxa-mal-formatadas", type=float, default=0.0,
+                        help="probabilidade de uma resposta fora do formato ReAct")
+    parser.add_argument("--repeticoes", type=int, default=5, help="execuções sequenciais do Q&A e do sumário")
+    parser.add_argument("--perguntas", type=int, default=16, help="perguntas de cada rodada de insights")
+    parser.add_argument("--concorrencia", default="1,4,8", help="níveis de concorrência dos insights")
+    parser.add_argument("--requisicoes-por-minuto", type=float, default=0,
+                        help="limite de taxa do LLM (0 = sem limite)")
+    parser.add_argument("--semente", type=int, default=0)
+    args = parser.parse_args(argumentos)
+
+    modelo = ModeloReActFalso(
+        latencia=args.latencia, variacao=args.variacao, latencia_por_token=args.latencia_por_token,
+        taxa_falhas=args.taxa_falhas, taxa_mal_formatadas=args.taxa_mal_formatadas, semente=args.semente,
+        rate_limiter=criar_limitador_taxa(args.requisicoes_por_minuto) if args.requisicoes_por_minuto else None,
+    )
+    # A telemetria do benchmark fica só em memória, fora do arquivo da aplicação
+    registro_telemetria.arquivo = None
+    diretorio = tempfile.mkdtemp(prefix="nfe-benchmark-")
+    try:
+        inicio = time.perf_counter()
+        dataset = processar_zips(args.zips)
+        print(f"Dataset: {len(dataset):,} itens de {dataset.num_notas:,} notas ({time.perf_counter() - inicio:.2f} s)".replace(",", "."))
+        inicio = time.perf_counter()
+        pool_sandbox.executar(dataset, "len(df)")
+        print(f"Sandbox pronto em {time.perf_counter() - inicio:.2f} s (excluído das medições)")
+
+        benchmark = Benchmark(dataset, modelo, diretorio, max(1, args.repeticoes))
+        benchmark.qa()
+        benchmark.sumario()
+        benchmark.insights(args.perguntas, [int(c) for c in args.concorrencia.split(",")], espera_maxima=args.latencia)
+
+        estatisticas = modelo.estatisticas()
+        print(f"\nLLM falso: {estatisticas['chamadas']} chamadas, {estatisticas['falhas']} falhas e "
+              f"{estatisticas['mal_formatadas']} respostas mal formatadas simuladas, "
+              f"{estatisticas['tempo_simulado']:.1f} s de latência simulada.")
+    finally:
+        pool_sandbox.encerrar()
+        shutil.rmtree(diretorio, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
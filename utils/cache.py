@@ -0,0 +1,130 @@
+# utils/cache.py
+
+import hashlib
+import os
+import shutil
+import threading
+import uuid
+import pyarrow as pa
+
+# --- CONFIGURAÇÃO DO CACHE EM DISCO ---
+# Diretório e tamanho máximo (MB) do cache de datasets já processados.
+DIRETORIO_CACHE = os.environ.get("NFE_CACHE_DIR", os.path.join(".cache", "datasets"))
+LIMITE_CACHE_MB = int(os.environ.get("NFE_CACHE_LIMITE_MB", "2048"))
+# Incrementar sempre que o formato do DataFrame processado mudar, para invalidar entradas antigas.
+VERSAO_FORMATO = 5
+
+
+def calcular_hash_arquivo(arquivo, tamanho_bloco=1024 * 1024):
+    """
+    Calcula o SHA-256 do conteúdo de um arquivo (caminho ou objeto de arquivo, como o
+    UploadedFile do Streamlit). A posição de leitura do objeto é restaurada ao final.
+    """
+    sha = hashlib.sha256()
+    if isinstance(arquivo, (str, os.PathLike)):
+        with open(arquivo, 'rb') as f:
+            for bloco in iter(lambda: f.read(tamanho_bloco), b''):
+                sha.update(bloco)
+        return sha.hexdigest()
+
+    posicao = arquivo.tell()
+    arquivo.seek(0)
+    for bloco in iter(lambda: arquivo.read(tamanho_bloco), b''):
+        sha.update(bloco)
+    arquivo.seek(posicao)
+    return sha.hexdigest()
+
+
+class CacheDatasets:
+    """
+    Cache persistente de datasets processados, endereçado pelo hash do conteúdo do ZIP.
+
+    Cada entrada é um diretório com uma ou mais tabelas (ex.: cabeçalho e itens), gravadas
+    como arquivos Arrow IPC sem compressão e reabertas via memory-map, sem nenhum
+    reprocessamento do CSV. Apenas as colunas numéricas sem valores ausentes viram DataFrame
+    sem cópia, apontando para as páginas do arquivo, que o sistema operacional só traz para a
+    memória quando usadas; as colunas de texto e as categóricas são copiadas (os textos viram
+    objetos do Python) e ocupam memória como na primeira leitura. Quando o tamanho total
+    ultrapassa o limite, as entradas acessadas há mais tempo são removidas (LRU pela data de
+    modificação).
+    """
+    EXTENSAO = '.arrow'
+
+    def __init__(self, diretorio=DIRETORIO_CACHE, limite_mb=LIMITE_CACHE_MB):
+        self.diretorio = diretorio
+        self.limite_bytes = limite_mb * 1024 * 1024
+        self._lock = threading.Lock()
+
+    def _caminho(self, chave):
+        return os.path.join(self.diretorio, f"{chave}-v{VERSAO_FORMATO}")
+
+    def obter(self, chave):
+        """Retorna o dicionário {nome: DataFrame} em cache para a chave, ou None se não existir."""
+        caminho = self._caminho(chave)
+        if not os.path.isdir(caminho):
+            return None
+        tabelas = {}
+        try:
+            for nome_arquivo in sorted(os.listdir(caminho)):
+                if nome_arquivo.endswith(self.EXTENSAO):
+                    arquivo = os.path.join(caminho, nome_arquivo)
+                    tabela = pa.ipc.open_file(pa.memory_map(arquivo, 'r')).read_all()
+                    tabelas[nome_arquivo[:-len(self.EXTENSAO)]] = tabela.to_pandas(split_blocks=True)
+        except (OSError, pa.ArrowInvalid) as e:
+            print(f"Entrada de cache corrompida ignorada ({caminho}): {e}")
+            self._remover(caminho)
+            return None
+        if not tabelas:
+            return None
+        # Marca a entrada como usada recentemente para a política LRU.
+        os.utime(caminho)
+        return tabelas
+
+    def gravar(self, chave, tabelas):
+        """Grava as tabelas {nome: DataFrame} no cache e aplica a política de remoção por tamanho."""
+        os.makedirs(self.diretorio, exist_ok=True)
+        caminho = self._caminho(chave)
+        temporario = f"{caminho}.{uuid.uuid4().hex}.tmp"
+        try:
+            os.makedirs(temporario)
+            for nome, df in tabelas.items():
+                tabela = pa.Table.from_pandas(df, preserve_index=False)
+                with pa.OSFile(os.path.join(temporario, f"{nome}{self.EXTENSAO}"), 'wb') as sink:
+                    with pa.ipc.new_file(sink, tabela.schema) as writer:
+                        writer.write_table(tabela)
+            if os.path.isdir(caminho):
+                self._remover(caminho)
+            os.replace(temporario, caminho)
+        except (OSError, pa.ArrowException) as e:
+            # O cache é apenas uma otimização: uma falha de gravação não deve interromper a análise.
+            print(f"Não foi possível gravar o dataset no cache: {e}")
+            self._remover(temporario)
+            return
+        self._remover_excedente()
+
+    def _remover(self, caminho):
+        shutil.rmtree(caminho, ignore_errors=True)
+
+    def _tamanho(self, caminho):
+        return sum(entrada.stat().st_size for entrada in os.scandir(caminho) if entrada.is_file())
+
+    def _remover_excedente(self):
+        with self._lock:
+            entradas = []
+            for entrada in os.scandir(self.diretorio):
+                if not entrada.is_dir() or entrada.name.endswith('.tmp'):
+                    continue
+                try:
+                    entradas.append((entrada.stat().st_mtime, self._tamanho(entrada.path), entrada.path))
+                except OSError:
+                    continue
+
+            total = sum(tamanho for _, tamanho, _ in entradas)
+            for _, tamanho, caminho in sorted(entradas):
+                if total <= self.limite_bytes:
+                    break
+                self._remover(caminho)
+                total -= tamanho
+
+
+cache_datasets = CacheDatasets()
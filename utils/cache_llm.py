@@ -0,0 +1,176 @@
+# utils/cache_llm.py
+
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+
+# --- CONFIGURAÇÃO DO CACHE DE RESPOSTAS DO LLM ---
+# Arquivo SQLite com as respostas já obtidas do LLM.
+ARQUIVO_CACHE_LLM = os.environ.get("NFE_CACHE_LLM_ARQUIVO", os.path.join(".cache", "respostas_llm.sqlite3"))
+# Validade (horas) de uma resposta e tamanho máximo (MB) do cache.
+VALIDADE_CACHE_LLM_HORAS = float(os.environ.get("NFE_CACHE_LLM_VALIDADE_HORAS", "168"))
+LIMITE_CACHE_LLM_MB = int(os.environ.get("NFE_CACHE_LLM_LIMITE_MB", "64"))
+# Modo de reprodução: só responde com o que já está gravado, sem nunca chamar o LLM
+# (demonstrações offline e testes).
+MODO_REPRODUCAO = os.environ.get("NFE_LLM_REPRODUCAO", "0").lower() in ("1", "true", "sim")
+
+
+class RespostaNaoGravada(LookupError):
+    """A pergunta não tem resposta gravada e o cache está no modo de reprodução."""
+
+
+class CacheRespostasLLM:
+    """
+    Cache persistente das respostas do LLM (agente, redação e sumários), endereçado por
+    (hash do conteúdo do dataset, modelo, temperatura, prompt, prefixo do agente).
+
+    As respostas ficam em um único arquivo SQLite, compartilhado entre sessões e execuções
+    da aplicação. Uma resposta vale por `validade_horas`; quando o tamanho total passa do
+    limite, as usadas há mais tempo são removidas (LRU). Falhas não são gravadas. Sem o hash
+    do dataset não há como identificar os dados, então nada é lido nem gravado.
+    """
+
+    def __init__(self, arquivo=ARQUIVO_CACHE_LLM, validade_horas=VALIDADE_CACHE_LLM_HORAS,
+                 limite_mb=LIMITE_CACHE_LLM_MB, reproducao=MODO_REPRODUCAO):
+        self.arquivo = arquivo
+        self.validade_segundos = validade_horas * 3600
+        self.limite_bytes = limite_mb * 1024 * 1024
+        self.reproducao = reproducao
+        self._lock = threading.Lock()
+        self._iniciado = False
+        self.acertos = 0
+        self.falhas = 0
+
+    @staticmethod
+    def chave(dataset, modelo, temperatura, prompt, prefixo=None):
+        """Chave da resposta, ou None quando o dataset não tem identificação de conteúdo."""
+        if dataset.hash_conteudo is None:
+            return None
+        conteudo = json.dumps([dataset.hash_conteudo, modelo, temperatura, prompt, prefixo], ensure_ascii=False)
+        return hashlib.sha256(conteudo.encode('utf-8')).hexdigest()
+
+    @contextmanager
+    def _conectar(self):
+        """Conexão própria para cada operação (pode ser usada por várias threads); confirma ao sair."""
+        os.makedirs(os.path.dirname(self.arquivo) or '.', exist_ok=True)
+        conexao = sqlite3.connect(self.arquivo, timeout=30)
+        try:
+            if not self._iniciado:
+                self._criar_tabela(conexao)
+            with conexao:
+                yield conexao
+        finally:
+            conexao.close()
+
+    def _criar_tabela(self, conexao):
+        conexao.execute("PRAGMA journal_mode=WAL")
+        conexao.execute(
+            "CREATE TABLE IF NOT EXISTS respostas ("
+            " chave TEXT PRIMARY KEY, modelo TEXT, prompt TEXT, resposta TEXT NOT NULL,"
+            " tamanho INTEGER NOT NULL, criado_em REAL NOT NULL, usado_em REAL NOT NULL,"
+            " acertos INTEGER NOT NULL DEFAULT 0)"
+        )
+        conexao.execute("CREATE INDEX IF NOT EXISTS respostas_usado_em ON respostas (usado_em)")
+        self._iniciado = True
+
+    def obter(self, chave):
+        """Resposta gravada e ainda válida para a chave, ou None."""
+        try:
+            with self._lock, self._conectar() as conexao:
+                linha = conexao.execute(
+                    "SELECT resposta FROM respostas WHERE chave = ? AND criado_em >= ?",
+                    (chave, time.time() - self.validade_segundos),
+                ).fetchone()
+                if linha is not None:
+                    conexao.execute("UPDATE respostas SET usado_em = ?, acertos = acertos + 1 WHERE chave = ?",
+                                    (time.time(), chave))
+        except sqlite3.Error as e:
+            print(f"Não foi possível ler o cache de respostas do LLM: {e}")
+            return None
+        return None if linha is None else linha[0]
+
+    def gravar(self, chave, resposta, modelo=None, prompt=None):
+        """Grava a resposta e aplica as políticas de validade e de tamanho."""
+        agora = time.time()
+        tamanho = len(resposta.encode('utf-8')) + len((prompt or '').encode('utf-8'))
+        try:
+            with self._lock, self._conectar() as conexao:
+                conexao.execute(
+                    "INSERT OR REPLACE INTO respostas (chave, modelo, prompt, resposta, tamanho, criado_em, usado_em)"
+                    " VALUES (?, ?, ?, ?, ?, ?, ?)",
+                    (chave, modelo, prompt, resposta, tamanho, agora, agora),
+                )
+                self._remover_excedente(conexao, agora)
+        except sqlite3.Error as e:
+            # O cache é apenas uma otimização: uma falha de gravação não deve interromper a análise.
+            print(f"Não foi possível gravar a resposta no cache do LLM: {e}")
+
+    def _remover_excedente(self, conexao, agora):
+        conexao.execute("DELETE FROM respostas WHERE criado_em < ?", (agora - self.validade_segundos,))
+        total = conexao.execute("SELECT COALESCE(SUM(tamanho), 0) FROM respostas").fetchone()[0]
+        if total <= self.limite_bytes:
+            return
+        removidas = []
+        for chave, tamanho in conexao.execute("SELECT chave, tamanho FROM respostas ORDER BY usado_em"):
+            if total <= self.limite_bytes:
+                break
+            removidas.append((chave,))
+            total -= tamanho
+        conexao.executemany("DELETE FROM respostas WHERE chave = ?", removidas)
+
+    def obter_ou_gerar(self, dataset, modelo, temperatura, prompt, gerar, prefixo=None):
+        """
+        Devolve a resposta gravada para o prompt ou chama `gerar()` e grava o resultado.
+        No modo de reprodução, uma resposta ausente gera RespostaNaoGravada em vez de chamar o LLM.
+        """
+        chave = self.chave(dataset, modelo, temperatura, prompt, prefixo)
+        if chave is not None:
+            resposta = self.obter(chave)
+            with self._lock:
+                if resposta is not None:
+                    self.acertos += 1
+                else:
+                    self.falhas += 1
+            if resposta is not None:
+                return resposta
+        if self.reproducao:
+            raise RespostaNaoGravada(f"Não há resposta gravada para esta pergunta (modo de reprodução): {prompt[:80]}")
+
+        resposta = gerar()
+        if chave is not None:
+            self.gravar(chave, resposta, modelo, prompt)
+        return resposta
+
+    def limpar(self):
+        with self._lock:
+            if os.path.exists(self.arquivo):
+                with self._conectar() as conexao:
+                    conexao.execute("DELETE FROM respostas")
+
+    def estatisticas(self):
+        """Acertos e falhas desta execução da aplicação, mais o conteúdo atual do arquivo."""
+        entradas, tamanho = 0, 0
+        if os.path.exists(self.arquivo):
+            try:
+                with self._lock, self._conectar() as conexao:
+                    entradas, tamanho = conexao.execute(
+                        "SELECT COUNT(*), COALESCE(SUM(tamanho), 0) FROM respostas").fetchone()
+            except sqlite3.Error:
+                pass
+        with self._lock:
+            consultas = self.acertos + self.falhas
+            return {
+                'entradas': entradas,
+                'tamanho_mb': tamanho / (1024 * 1024),
+                'acertos': self.acertos,
+                'falhas': self.falhas,
+                'taxa_acertos': self.acertos / consultas if consultas else 0.0,
+                'reproducao': self.reproducao,
+            }
+
+
+cache_llm = CacheRespostasLLM()
@@ -3,7 +3,21 @@
 from typing import Any
 from langchain.callbacks.base import BaseCallbackHandler
 from langchain_core.agents import AgentAction, AgentFinish
+from langchain_core.outputs import LLMResult
+from langchain_experimental.tools.python.tool import sanitize_input
+from collections import deque
+import numpy as np
+import json
+import os
 import re
+import threading
+import time
+
+# Arquivo JSONL com a telemetria de cada execução dos agentes (vazio desativa a gravação).
+ARQUIVO_TELEMETRIA = os.environ.get("NFE_TELEMETRIA_ARQUIVO", os.path.join(".cache", "telemetria.jsonl"))
+# Tamanho máximo (MB) do arquivo de telemetria; ao atingi-lo, ele é renomeado para "<arquivo>.1"
+# (substituindo o anterior) e um novo arquivo é iniciado.
+LIMITE_TELEMETRIA_MB = int(os.environ.get("NFE_TELEMETRIA_LIMITE_MB", "16"))
 
 # A classe de cores permanece a mesma, apenas a forma como a usamos vai mudar.
 class BColors:
@@ -33,7 +47,9 @@ class PolishedCallbackHandler(BaseCallbackHandler):
         """
         Formata o Pensamento (Azul) e a Ação (Verde).
         """
-        thought = re.split(r'Action:|Thought:', action.log)[1].strip()
+        # O log nem sempre traz "Thought:" (ex.: erros de formatação tratados pelo agente)
+        thought = re.split(r'Action\s*\d*\s*:', action.log)[0]
+        thought = re.sub(r'^\s*Thought\s*:', '', thought).strip()
         
         # ALTERADO: Cor do Pensamento padronizada para Azul.
         print(f"{BColors.BOLD}{BColors.OKBLUE}🤔 PENSAMENTO{BColors.ENDC}")
@@ -43,7 +59,7 @@ class PolishedCallbackHandler(BaseCallbackHandler):
         print(f"\n{BColors.BOLD}{BColors.OKGREEN}⚡ AÇÃO{BColors.ENDC}")
         print(f"   - Ferramenta: {BColors.BOLD}{action.tool}{BColors.ENDC}")
         
-        clean_input = action.tool_input.strip().strip("```python").strip("```").strip()
+        clean_input = sanitize_input(str(action.tool_input))
         # ALTERADO: Cor do bloco de código padronizada para Amarelo.
         print(f"   - Código a executar:\n{BColors.WARNING}```python\n{clean_input}\n```{BColors.ENDC}")
 
@@ -64,4 +80,266 @@ class PolishedCallbackHandler(BaseCallbackHandler):
         # ALTERADO: Cor da Resposta Final padronizada para Ciano.
         print(f"\n{BColors.BOLD}{BColors.OKCYAN}✅ RESPOSTA FINAL{BColors.ENDC}")
         print(final_answer)
-        print("\n" + "="*80 + "\n")
\ No newline at end of file
+        print("\n" + "="*80 + "\n")
+
+class RegistroTokens:
+    """
+    Contabilidade dos tokens de entrada (prompt) e de saída (resposta) de cada chamada ao
+    LLM, acumulada por modelo. Quando o provedor não informa o uso, o número é estimado
+    pelo tamanho do texto e a chamada é marcada como estimada.
+    """
+    CARACTERES_POR_TOKEN = 4
+
+    def __init__(self, max_chamadas=200):
+        self._lock = threading.Lock()
+        self.chamadas = deque(maxlen=max_chamadas)
+        self.totais = {}
+
+    def registrar(self, modelo, entrada, saida, estimado=False):
+        with self._lock:
+            self.chamadas.append({'modelo': modelo, 'entrada': entrada, 'saida': saida, 'estimado': estimado})
+            total = self.totais.setdefault(modelo, {'chamadas': 0, 'entrada': 0, 'saida': 0})
+            total['chamadas'] += 1
+            total['entrada'] += entrada
+            total['saida'] += saida
+
+    def estatisticas(self):
+        with self._lock:
+            chamadas = sum(t['chamadas'] for t in self.totais.values())
+            entrada = sum(t['entrada'] for t in self.totais.values())
+            saida = sum(t['saida'] for t in self.totais.values())
+            return {
+                'chamadas': chamadas,
+                'entrada': entrada,
+                'saida': saida,
+                'media_entrada': entrada / chamadas if chamadas else 0.0,
+                'por_modelo': {modelo: dict(total) for modelo, total in self.totais.items()},
+            }
+
+
+registro_tokens = RegistroTokens()
+
+
+def _caracteres_mensagens(messages):
+    return sum(len(str(m.content)) for lote in messages for m in lote)
+
+
+def contar_tokens(response, caracteres_prompt):
+    """
+    (entrada, saída, estimado) de uma chamada ao LLM: o uso informado pelo provedor ou,
+    na falta dele, uma estimativa pelo tamanho do prompt e da resposta.
+    """
+    geracao = response.generations[0][0] if response.generations and response.generations[0] else None
+    uso = getattr(getattr(geracao, 'message', None), 'usage_metadata', None)
+    if uso:
+        return uso.get('input_tokens', 0), uso.get('output_tokens', 0), False
+    caracteres_resposta = len(geracao.text) if geracao is not None else 0
+    por_token = RegistroTokens.CARACTERES_POR_TOKEN
+    return -(-caracteres_prompt // por_token), -(-caracteres_resposta // por_token), True
+
+
+class ContadorTokensCallbackHandler(BaseCallbackHandler):
+    """
+    Registra no RegistroTokens os tokens de cada chamada do modelo de chat ao qual é anexado
+    (veja PoolAgentes.cliente_llm).
+    """
+    def __init__(self, modelo, registro=registro_tokens):
+        super().__init__()
+        self.modelo = modelo
+        self.registro = registro
+        self._caracteres_prompt = {}
+
+    def on_chat_model_start(self, serialized, messages, *, run_id, **kwargs: Any) -> Any:
+        self._caracteres_prompt[run_id] = _caracteres_mensagens(messages)
+
+    def on_llm_start(self, serialized, prompts, *, run_id, **kwargs: Any) -> Any:
+        self._caracteres_prompt[run_id] = sum(len(p) for p in prompts)
+
+    def on_llm_end(self, response: LLMResult, *, run_id, **kwargs: Any) -> Any:
+        entrada, saida, estimado = contar_tokens(response, self._caracteres_prompt.pop(run_id, 0))
+        self.registro.registrar(self.modelo, entrada, saida, estimado=estimado)
+
+    def on_llm_error(self, error: BaseException, *, run_id, **kwargs: Any) -> Any:
+        self._caracteres_prompt.pop(run_id, None)
+
+
+class RegistroTelemetria:
+    """
+    Telemetria das execuções dos agentes: cada execução é acrescentada ao arquivo JSONL (para
+    acompanhar regressões de latência entre versões) e as mais recentes de cada aba ficam em
+    memória, para os percentis exibidos na aplicação. O arquivo é rotacionado ao atingir
+    `limite_mb`, então o disco guarda no máximo duas vezes esse tamanho.
+    """
+    PERCENTIS = (50, 90, 99)
+
+    def __init__(self, arquivo=ARQUIVO_TELEMETRIA, max_execucoes=500, limite_mb=LIMITE_TELEMETRIA_MB):
+        self.arquivo = arquivo
+        self.limite_bytes = limite_mb * 1024 * 1024
+        self._lock = threading.Lock()
+        self._max_execucoes = max_execucoes
+        self.execucoes = {}
+
+    def registrar(self, execucao):
+        with self._lock:
+            self.execucoes.setdefault(execucao['aba'], deque(maxlen=self._max_execucoes)).append(execucao)
+            if not self.arquivo:
+                return
+            try:
+                os.makedirs(os.path.dirname(self.arquivo) or '.', exist_ok=True)
+                self._rotacionar()
+                with open(self.arquivo, 'a', encoding='utf-8') as f:
+                    f.write(json.dumps(execucao, ensure_ascii=False) + "\n")
+            except OSError as e:
+                # A telemetria não deve interromper a análise.
+                print(f"Não foi possível gravar a telemetria: {e}")
+
+    def _rotacionar(self):
+        """Renomeia o arquivo para "<arquivo>.1" quando ele atinge o limite de tamanho."""
+        try:
+            tamanho = os.path.getsize(self.arquivo)
+        except OSError:
+            return
+        if tamanho >= self.limite_bytes:
+            os.replace(self.arquivo, self.arquivo + ".1")
+
+    def _percentis(self, valores):
+        if not valores:
+            return {f"p{p}": 0.0 for p in self.PERCENTIS}
+        return {f"p{p}": float(v) for p, v in zip(self.PERCENTIS, np.percentile(valores, self.PERCENTIS))}
+
+    def resumo(self):
+        """Percentis, por aba, da duração total, do tempo no LLM e nas ferramentas, das iterações e dos tokens."""
+        with self._lock:
+            por_aba = {aba: list(execucoes) for aba, execucoes in self.execucoes.items()}
+        resumo = {}
+        for aba, execucoes in por_aba.items():
+            resumo[aba] = {
+                'execucoes': len(execucoes),
+                'falhas': sum(1 for e in execucoes if e['erro']),
+                'duracao': self._percentis([e['duracao'] for e in execucoes]),
+                'tempo_llm': self._percentis([sum(e['chamadas_llm']) for e in execucoes]),
+                'tempo_ferramentas': self._percentis([sum(f['duracao'] for f in e['ferramentas']) for e in execucoes]),
+                'iteracoes': self._percentis([e['iteracoes'] for e in execucoes]),
+                'tokens': self._percentis([e['tokens_entrada'] + e['tokens_saida'] for e in execucoes]),
+            }
+        return resumo
+
+
+registro_telemetria = RegistroTelemetria()
+
+
+class TelemetriaCallbackHandler(BaseCallbackHandler):
+    """
+    Mede cada execução (de um agente ou de uma chamada avulsa ao LLM) da aba `aba`: a duração
+    total e a de cada chamada ao LLM e à ferramenta, as iterações do ciclo ReAct, os tokens e
+    as repetições. Ao fim de cada execução, o resultado vai para o RegistroTelemetria.
+
+    O mesmo handler pode acompanhar as várias tentativas de uma pergunta: cada uma é
+    registrada com o seu número em `tentativa`.
+    """
+    def __init__(self, aba, registro=registro_telemetria):
+        super().__init__()
+        self.aba = aba
+        self.registro = registro
+        self.tentativas = 0
+        self._lock = threading.Lock()
+        self._raiz = None
+        self._execucao = None
+        self._inicios = {}
+        self._caracteres_prompt = {}
+        self._ferramentas = {}
+
+    def _iniciar(self, run_id, parent_run_id):
+        agora = time.perf_counter()
+        with self._lock:
+            if parent_run_id is None and self._raiz is None:
+                self.tentativas += 1
+                self._raiz = run_id
+                self._execucao = {
+                    'aba': self.aba, 'inicio': time.time(), 'tentativa': self.tentativas, 'duracao': 0.0,
+                    'erro': None, 'iteracoes': 0, 'chamadas_llm': [], 'ferramentas': [], 'tokens_entrada': 0,
+                    'tokens_saida': 0, 'tokens_estimados': False, 'repeticoes_llm': 0,
+                }
+            self._inicios[run_id] = agora
+
+    def _duracao(self, run_id):
+        inicio = self._inicios.pop(run_id, None)
+        return 0.0 if inicio is None else time.perf_counter() - inicio
+
+    def _finalizar(self, run_id, duracao, erro=None):
+        with self._lock:
+            if run_id != self._raiz:
+                return
+            execucao, self._raiz = self._execucao, None
+            self._inicios.clear()
+            self._caracteres_prompt.clear()
+            self._ferramentas.clear()
+        execucao['duracao'] = round(duracao, 4)
+        execucao['erro'] = None if erro is None else f"{type(erro).__name__}: {str(erro)[:200]}"
+        self.registro.registrar(execucao)
+
+    # --- Execução do agente ---
+    def on_chain_start(self, serialized, inputs, *, run_id, parent_run_id=None, **kwargs: Any) -> Any:
+        self._iniciar(run_id, parent_run_id)
+
+    def on_chain_end(self, outputs, *, run_id, **kwargs: Any) -> Any:
+        self._finalizar(run_id, self._duracao(run_id))
+
+    def on_chain_error(self, error: BaseException, *, run_id, **kwargs: Any) -> Any:
+        self._finalizar(run_id, self._duracao(run_id), erro=error)
+
+    def on_agent_action(self, action: AgentAction, **kwargs: Any) -> Any:
+        if self._raiz is not None:
+            self._execucao['iteracoes'] += 1
+
+    def on_agent_finish(self, finish: AgentFinish, **kwargs: Any) -> Any:
+        if self._raiz is not None:
+            self._execucao['iteracoes'] += 1
+
+    # --- Chamadas ao LLM ---
+    def on_chat_model_start(self, serialized, messages, *, run_id, parent_run_id=None, **kwargs: Any) -> Any:
+        self._iniciar(run_id, parent_run_id)
+        self._caracteres_prompt[run_id] = _caracteres_mensagens(messages)
+
+    def on_llm_start(self, serialized, prompts, *, run_id, parent_run_id=None, **kwargs: Any) -> Any:
+        self._iniciar(run_id, parent_run_id)
+        self._caracteres_prompt[run_id] = sum(len(p) for p in prompts)
+
+    def on_llm_end(self, response: LLMResult, *, run_id, **kwargs: Any) -> Any:
+        duracao = self._duracao(run_id)
+        entrada, saida, estimado = contar_tokens(response, self._caracteres_prompt.pop(run_id, 0))
+        if self._raiz is not None:
+            self._execucao['chamadas_llm'].append(round(duracao, 4))
+            self._execucao['tokens_entrada'] += entrada
+            self._execucao['tokens_saida'] += saida
+            self._execucao['tokens_estimados'] |= estimado
+        self._finalizar(run_id, duracao)
+
+    def on_llm_error(self, error: BaseException, *, run_id, **kwargs: Any) -> Any:
+        duracao = self._duracao(run_id)
+        self._caracteres_prompt.pop(run_id, None)
+        if self._raiz is not None:
+            self._execucao['chamadas_llm'].append(round(duracao, 4))
+        self._finalizar(run_id, duracao, erro=error)
+
+    def on_retry(self, retry_state, **kwargs: Any) -> Any:
+        if self._raiz is not None:
+            self._execucao['repeticoes_llm'] += 1
+
+    # --- Ferramentas ---
+    def on_tool_start(self, serialized, input_str, *, run_id, parent_run_id=None, **kwargs: Any) -> Any:
+        self._iniciar(run_id, parent_run_id)
+        self._ferramentas[run_id] = (serialized or {}).get('name') or kwargs.get('name') or 'ferramenta'
+
+    def _encerrar_ferramenta(self, run_id, erro=None):
+        duracao = self._duracao(run_id)
+        nome = self._ferramentas.pop(run_id, 'ferramenta')
+        if self._raiz is not None:
+            self._execucao['ferramentas'].append({'nome': nome, 'duracao': round(duracao, 4), 'erro': erro is not None})
+        self._finalizar(run_id, duracao, erro=erro)
+
+    def on_tool_end(self, output: Any, *, run_id, **kwargs: Any) -> Any:
+        self._encerrar_ferramenta(run_id)
+
+    def on_tool_error(self, error: BaseException, *, run_id, **kwargs: Any) -> Any:
+        self._encerrar_ferramenta(run_id, erro=error)
@@ -0,0 +1,432 @@
+# utils/cfop.py
+
+import numpy as np
+import pandas as pd
+
+# --- TABELA DE CFOP (Código Fiscal de Operações e Prestações) ---
+# O CFOP tem 4 dígitos: o primeiro indica a direção e a abrangência da operação
+# (1/2/3 = entrada estadual/interestadual/do exterior; 5/6/7 = saída estadual/interestadual/
+# para o exterior) e os três últimos, a operação em si. A mesma operação se repete nos três
+# prefixos de cada direção, então a tabela é montada a partir das operações-base abaixo.
+
+CODIGO_AUSENTE = 0
+MAX_CFOP = 8000
+
+# Operações-base de entrada (dígitos 2 a 4 do CFOP)
+OPERACOES_ENTRADA = {
+    101: "Compra para industrialização ou produção rural",
+    102: "Compra para comercialização",
+    111: "Compra para industrialização de mercadoria recebida anteriormente em consignação industrial",
+    113: "Compra para comercialização, de mercadoria recebida anteriormente em consignação mercantil",
+    116: "Compra para industrialização ou produção rural originada de encomenda para recebimento futuro",
+    117: "Compra para comercialização originada de encomenda para recebimento futuro",
+    118: "Compra de mercadoria para comercialização pelo adquirente originário, entregue pelo vendedor remetente ao destinatário, em venda à ordem",
+    120: "Compra para industrialização, em venda à ordem, já recebida do vendedor remetente",
+    121: "Compra para comercialização, em venda à ordem, já recebida do vendedor remetente",
+    122: "Compra para industrialização em que a mercadoria foi remetida pelo fornecedor ao industrializador sem transitar pelo estabelecimento adquirente",
+    124: "Industrialização efetuada por outra empresa",
+    125: "Industrialização efetuada por outra empresa quando a mercadoria remetida para utilização no processo não transitou pelo estabelecimento adquirente",
+    126: "Compra para utilização na prestação de serviço sujeita ao ICMS",
+    127: "Compra para industrialização sob o regime de drawback",
+    128: "Compra para utilização na prestação de serviço sujeita ao ISSQN",
+    151: "Transferência para industrialização ou produção rural",
+    152: "Transferência para comercialização",
+    153: "Transferência de energia elétrica para distribuição",
+    154: "Transferência para utilização na prestação de serviço",
+    159: "Entrada decorrente do fornecimento de produto ou mercadoria de ato cooperativo",
+    201: "Devolução de venda de produção do estabelecimento",
+    202: "Devolução de venda de mercadoria adquirida ou recebida de terceiros",
+    203: "Devolução de venda de produção do estabelecimento destinada à Zona Franca de Manaus ou Áreas de Livre Comércio",
+    204: "Devolução de venda de mercadoria adquirida ou recebida de terceiros destinada à Zona Franca de Manaus ou Áreas de Livre Comércio",
+    205: "Anulação de valor relativo à prestação de serviço de comunicação",
+    206: "Anulação de valor relativo à prestação de serviço de transporte",
+    207: "Anulação de valor relativo à venda de energia elétrica",
+    208: "Devolução de produção do estabelecimento remetida em transferência",
+    209: "Devolução de mercadoria adquirida ou recebida de terceiros remetida em transferência",
+    251: "Compra de energia elétrica para distribuição ou comercialização",
+    252: "Compra de energia elétrica por estabelecimento industrial",
+    253: "Compra de energia elétrica por estabelecimento comercial",
+    254: "Compra de energia elétrica por estabelecimento prestador de serviço de transporte",
+    255: "Compra de energia elétrica por estabelecimento prestador de serviço de comunicação",
+    256: "Compra de energia elétrica por estabelecimento de produtor rural",
+    257: "Compra de energia elétrica para consumo por demanda contratada",
+    301: "Aquisição de serviço de comunicação para execução de serviço da mesma natureza",
+    302: "Aquisição de serviço de comunicação por estabelecimento industrial",
+    303: "Aquisição de serviço de comunicação por estabelecimento comercial",
+    304: "Aquisição de serviço de comunicação por estabelecimento prestador de serviço de transporte",
+    305: "Aquisição de serviço de comunicação por estabelecimento de geradora ou distribuidora de energia elétrica",
+    306: "Aquisição de serviço de comunicação por estabelecimento de produtor rural",
+    351: "Aquisição de serviço de transporte para execução de serviço da mesma natureza",
+    352: "Aquisição de serviço de transporte por estabelecimento industrial",
+    353: "Aquisição de serviço de transporte por estabelecimento comercial",
+    354: "Aquisição de serviço de transporte por estabelecimento prestador de serviço de comunicação",
+    355: "Aquisição de serviço de transporte por estabelecimento de geradora ou distribuidora de energia elétrica",
+    356: "Aquisição de serviço de transporte por estabelecimento de produtor rural",
+    360: "Aquisição de serviço de transporte por contribuinte substituto em relação ao serviço de transporte",
+    401: "Compra para industrialização ou produção rural de mercadoria sujeita ao regime de substituição tributária",
+    403: "Compra para comercialização de mercadoria sujeita ao regime de substituição tributária",
+    406: "Compra de bem para o ativo imobilizado sujeito ao regime de substituição tributária",
+    407: "Compra de mercadoria para uso ou consumo sujeita ao regime de substituição tributária",
+    408: "Transferência para industrialização ou produção rural de mercadoria sujeita ao regime de substituição tributária",
+    409: "Transferência para comercialização de mercadoria sujeita ao regime de substituição tributária",
+    410: "Devolução de venda de produção do estabelecimento sujeita ao regime de substituição tributária",
+    411: "Devolução de venda de mercadoria adquirida ou recebida de terceiros sujeita ao regime de substituição tributária",
+    414: "Retorno de produção do estabelecimento remetida para venda fora do estabelecimento, sujeita ao regime de substituição tributária",
+    415: "Retorno de mercadoria de terceiros remetida para venda fora do estabelecimento, sujeita ao regime de substituição tributária",
+    451: "Retorno de animal do estabelecimento produtor",
+    452: "Retorno de insumo não utilizado na produção",
+    501: "Entrada de mercadoria recebida com fim específico de exportação",
+    503: "Entrada decorrente de devolução de produto do estabelecimento remetido com fim específico de exportação",
+    504: "Entrada decorrente de devolução de mercadoria de terceiros remetida com fim específico de exportação",
+    505: "Entrada decorrente de devolução de produtos do estabelecimento remetidos para formação de lote de exportação",
+    506: "Entrada decorrente de devolução de mercadorias de terceiros remetidas para formação de lote de exportação",
+    551: "Compra de bem para o ativo imobilizado",
+    552: "Transferência de bem do ativo imobilizado",
+    553: "Devolução de venda de bem do ativo imobilizado",
+    554: "Retorno de bem do ativo imobilizado remetido para uso fora do estabelecimento",
+    555: "Entrada de bem do ativo imobilizado de terceiro, remetido para uso no estabelecimento",
+    556: "Compra de material para uso ou consumo",
+    557: "Transferência de material para uso ou consumo",
+    601: "Recebimento, por transferência, de crédito de ICMS",
+    602: "Recebimento, por transferência, de saldo credor de ICMS de outro estabelecimento da mesma empresa",
+    603: "Ressarcimento de ICMS retido por substituição tributária",
+    604: "Lançamento do crédito relativo à compra de bem para o ativo imobilizado",
+    605: "Recebimento, por transferência, de saldo devedor de ICMS de outro estabelecimento da mesma empresa",
+    651: "Compra de combustível ou lubrificante para industrialização subsequente",
+    652: "Compra de combustível ou lubrificante para comercialização",
+    653: "Compra de combustível ou lubrificante por consumidor ou usuário final",
+    658: "Transferência de combustível ou lubrificante para industrialização",
+    659: "Transferência de combustível ou lubrificante para comercialização",
+    660: "Devolução de venda de combustível ou lubrificante destinado à industrialização subsequente",
+    661: "Devolução de venda de combustível ou lubrificante destinado à comercialização",
+    662: "Devolução de venda de combustível ou lubrificante destinado a consumidor ou usuário final",
+    663: "Entrada de combustível ou lubrificante para armazenagem",
+    664: "Retorno de combustível ou lubrificante remetido para armazenagem",
+    901: "Entrada para industrialização por encomenda",
+    902: "Retorno de mercadoria remetida para industrialização por encomenda",
+    903: "Entrada de mercadoria remetida para industrialização e não aplicada no referido processo",
+    904: "Retorno de remessa de venda fora do estabelecimento",
+    905: "Entrada de mercadoria recebida para depósito em depósito fechado ou armazém geral",
+    906: "Retorno de mercadoria remetida para depósito fechado ou armazém geral",
+    907: "Retorno simbólico de mercadoria remetida para depósito fechado ou armazém geral",
+    908: "Entrada de bem por conta de contrato de comodato",
+    909: "Retorno de bem remetido por conta de contrato de comodato",
+    910: "Entrada de bonificação, doação ou brinde",
+    911: "Entrada de amostra grátis",
+    912: "Entrada de mercadoria ou bem recebido para demonstração ou mostruário",
+    913: "Retorno de mercadoria ou bem remetido para demonstração, mostruário ou treinamento",
+    914: "Retorno de mercadoria ou bem remetido para exposição ou feira",
+    915: "Entrada de mercadoria ou bem recebido para conserto ou reparo",
+    916: "Retorno de mercadoria ou bem remetido para conserto ou reparo",
+    917: "Entrada de mercadoria recebida em consignação mercantil ou industrial",
+    918: "Devolução de mercadoria remetida em consignação mercantil ou industrial",
+    919: "Devolução simbólica de mercadoria vendida ou utilizada em processo industrial, remetida anteriormente em consignação",
+    920: "Entrada de vasilhame ou sacaria",
+    921: "Retorno de vasilhame ou sacaria",
+    922: "Lançamento a título de simples faturamento decorrente de compra para recebimento futuro",
+    923: "Entrada de mercadoria recebida do vendedor remetente, em venda à ordem",
+    924: "Entrada para industrialização por conta e ordem do adquirente, quando a mercadoria não transitar pelo seu estabelecimento",
+    925: "Retorno de mercadoria remetida para industrialização por conta e ordem do adquirente, quando a mercadoria não transitar pelo seu estabelecimento",
+    926: "Lançamento a título de reclassificação de mercadoria decorrente de formação de kit ou de sua desagregação",
+    933: "Aquisição de serviço tributado pelo ISSQN",
+    934: "Entrada simbólica de mercadoria recebida para depósito fechado ou armazém geral",
+    949: "Outra entrada de mercadoria ou prestação de serviço não especificada",
+}
+
+# Operações-base de saída (dígitos 2 a 4 do CFOP)
+OPERACOES_SAIDA = {
+    101: "Venda de produção do estabelecimento",
+    102: "Venda de mercadoria adquirida ou recebida de terceiros",
+    103: "Venda de produção do estabelecimento, efetuada fora do estabelecimento",
+    104: "Venda de mercadoria adquirida ou recebida de terceiros, efetuada fora do estabelecimento",
+    105: "Venda de produção do estabelecimento que não deva por ele transitar",
+    106: "Venda de mercadoria adquirida ou recebida de terceiros, que não deva por ele transitar",
+    107: "Venda de produção do estabelecimento, destinada a não contribuinte",
+    108: "Venda de mercadoria adquirida ou recebida de terceiros, destinada a não contribuinte",
+    109: "Venda de produção do estabelecimento destinada à Zona Franca de Manaus ou Áreas de Livre Comércio",
+    110: "Venda de mercadoria de terceiros destinada à Zona Franca de Manaus ou Áreas de Livre Comércio",
+    111: "Venda de produção do estabelecimento remetida anteriormente em consignação industrial",
+    112: "Venda de mercadoria de terceiros remetida anteriormente em consignação industrial",
+    113: "Venda de produção do estabelecimento remetida anteriormente em consignação mercantil",
+    114: "Venda de mercadoria de terceiros remetida anteriormente em consignação mercantil",
+    115: "Venda de mercadoria de terceiros recebida anteriormente em consignação mercantil",
+    116: "Venda de produção do estabelecimento originada de encomenda para entrega futura",
+    117: "Venda de mercadoria de terceiros originada de encomenda para entrega futura",
+    118: "Venda de produção do estabelecimento entregue ao destinatário por conta e ordem do adquirente originário, em venda à ordem",
+    119: "Venda de mercadoria de terceiros entregue ao destinatário por conta e ordem do adquirente originário, em venda à ordem",
+    120: "Venda de mercadoria de terceiros entregue ao destinatário pelo vendedor remetente, em venda à ordem",
+    122: "Venda de produção do estabelecimento remetida para industrialização, por conta e ordem do adquirente, sem transitar pelo seu estabelecimento",
+    123: "Venda de mercadoria de terceiros remetida para industrialização, por conta e ordem do adquirente, sem transitar pelo seu estabelecimento",
+    124: "Industrialização efetuada para outra empresa",
+    125: "Industrialização efetuada para outra empresa quando a mercadoria recebida não transitar pelo estabelecimento adquirente",
+    127: "Venda de produção do estabelecimento sob o regime de drawback",
+    151: "Transferência de produção do estabelecimento",
+    152: "Transferência de mercadoria adquirida ou recebida de terceiros",
+    153: "Transferência de energia elétrica",
+    155: "Transferência de produção do estabelecimento, que não deva por ele transitar",
+    156: "Transferência de mercadoria de terceiros, que não deva por ele transitar",
+    159: "Fornecimento de produção do estabelecimento de ato cooperativo",
+    160: "Fornecimento de mercadoria adquirida ou recebida de terceiros de ato cooperativo",
+    201: "Devolução de compra para industrialização ou produção rural",
+    202: "Devolução de compra para comercialização",
+    205: "Anulação de valor relativo a aquisição de serviço de comunicação",
+    206: "Anulação de valor relativo a aquisição de serviço de transporte",
+    207: "Anulação de valor relativo à compra de energia elétrica",
+    208: "Devolução de mercadoria recebida em transferência para industrialização ou produção rural",
+    209: "Devolução de mercadoria recebida em transferência para comercialização",
+    210: "Devolução de compra para utilização na prestação de serviço",
+    251: "Venda de energia elétrica para distribuição ou comercialização",
+    252: "Venda de energia elétrica para estabelecimento industrial",
+    253: "Venda de energia elétrica para estabelecimento comercial",
+    254: "Venda de energia elétrica para estabelecimento prestador de serviço de transporte",
+    255: "Venda de energia elétrica para estabelecimento prestador de serviço de comunicação",
+    256: "Venda de energia elétrica para estabelecimento de produtor rural",
+    257: "Venda de energia elétrica para consumo por demanda contratada",
+    258: "Venda de energia elétrica a não contribuinte",
+    301: "Prestação de serviço de comunicação para execução de serviço da mesma natureza",
+    302: "Prestação de serviço de comunicação a estabelecimento industrial",
+    303: "Prestação de serviço de comunicação a estabelecimento comercial",
+    304: "Prestação de serviço de comunicação a estabelecimento de prestador de serviço de transporte",
+    305: "Prestação de serviço de comunicação a estabelecimento de geradora ou distribuidora de energia elétrica",
+    306: "Prestação de serviço de comunicação a estabelecimento de produtor rural",
+    307: "Prestação de serviço de comunicação a não contribuinte",
+    351: "Prestação de serviço de transporte para execução de serviço da mesma natureza",
+    352: "Prestação de serviço de transporte a estabelecimento industrial",
+    353: "Prestação de serviço de transporte a estabelecimento comercial",
+    354: "Prestação de serviço de transporte a estabelecimento de prestador de serviço de comunicação",
+    355: "Prestação de serviço de transporte a estabelecimento de geradora ou distribuidora de energia elétrica",
+    356: "Prestação de serviço de transporte a estabelecimento de produtor rural",
+    357: "Prestação de serviço de transporte a não contribuinte",
+    359: "Prestação de serviço de transporte quando a mercadoria transportada está dispensada de emissão de nota fiscal",
+    360: "Prestação de serviço de transporte a contribuinte substituto em relação ao serviço de transporte",
+    401: "Venda de produção do estabelecimento sujeita ao regime de substituição tributária, como contribuinte substituto",
+    402: "Venda de produção do estabelecimento sujeita ao regime de substituição tributária, entre contribuintes substitutos do mesmo produto",
+    403: "Venda de mercadoria de terceiros sujeita ao regime de substituição tributária, como contribuinte substituto",
+    404: "Venda de mercadoria sujeita ao regime de substituição tributária, cujo imposto já tenha sido retido anteriormente",
+    405: "Venda de mercadoria de terceiros sujeita ao regime de substituição tributária, como contribuinte substituído",
+    408: "Transferência de produção do estabelecimento sujeita ao regime de substituição tributária",
+    409: "Transferência de mercadoria de terceiros sujeita ao regime de substituição tributária",
+    410: "Devolução de compra para industrialização ou produção rural sujeita ao regime de substituição tributária",
+    411: "Devolução de compra para comercialização sujeita ao regime de substituição tributária",
+    412: "Devolução de bem do ativo imobilizado sujeito ao regime de substituição tributária",
+    413: "Devolução de mercadoria destinada ao uso ou consumo sujeita ao regime de substituição tributária",
+    414: "Remessa de produção do estabelecimento para venda fora do estabelecimento, sujeita ao regime de substituição tributária",
+    415: "Remessa de mercadoria de terceiros para venda fora do estabelecimento, sujeita ao regime de substituição tributária",
+    451: "Remessa de animal e de insumo para estabelecimento produtor",
+    501: "Remessa de produção do estabelecimento com fim específico de exportação",
+    502: "Remessa de mercadoria adquirida ou recebida de terceiros com fim específico de exportação",
+    503: "Devolução de mercadoria recebida com fim específico de exportação",
+    504: "Remessa de produtos do estabelecimento para formação de lote de exportação",
+    505: "Remessa de mercadorias de terceiros para formação de lote de exportação",
+    551: "Venda de bem do ativo imobilizado",
+    552: "Transferência de bem do ativo imobilizado",
+    553: "Devolução de compra de bem para o ativo imobilizado",
+    554: "Remessa de bem do ativo imobilizado para uso fora do estabelecimento",
+    555: "Devolução de bem do ativo imobilizado de terceiro, recebido para uso no estabelecimento",
+    556: "Devolução de compra de material de uso ou consumo",
+    557: "Transferência de material de uso ou consumo",
+    601: "Transferência de crédito de ICMS acumulado",
+    602: "Transferência de saldo credor de ICMS para outro estabelecimento da mesma empresa",
+    603: "Ressarcimento de ICMS retido por substituição tributária",
+    605: "Transferência de saldo devedor de ICMS de outro estabelecimento da mesma empresa",
+    606: "Utilização de saldo credor de ICMS para extinção por compensação de débitos fiscais",
+    651: "Venda de combustível ou lubrificante de produção do estabelecimento destinado à industrialização subsequente",
+    652: "Venda de combustível ou lubrificante de produção do estabelecimento destinado à comercialização",
+    653: "Venda de combustível ou lubrificante de produção do estabelecimento destinado a consumidor ou usuário final",
+    654: "Venda de combustível ou lubrificante de terceiros destinado à industrialização subsequente",
+    655: "Venda de combustível ou lubrificante de terceiros destinado à comercialização",
+    656: "Venda de combustível ou lubrificante de terceiros destinado a consumidor ou usuário final",
+    657: "Remessa de combustível ou lubrificante de terceiros para venda fora do estabelecimento",
+    658: "Transferência de combustível ou lubrificante de produção do estabelecimento",
+    659: "Transferência de combustível ou lubrificante adquirido ou recebido de terceiros",
+    660: "Devolução de compra de combustível ou lubrificante adquirido para industrialização subsequente",
+    661: "Devolução de compra de combustível ou lubrificante adquirido para comercialização",
+    662: "Devolução de compra de combustível ou lubrificante adquirido por consumidor ou usuário final",
+    663: "Remessa para armazenagem de combustível ou lubrificante",
+    664: "Retorno de combustível ou lubrificante recebido para armazenagem",
+    665: "Retorno simbólico de combustível ou lubrificante recebido para armazenagem",
+    666: "Remessa por conta e ordem de terceiros de combustível ou lubrificante recebido para armazenagem",
+    667: "Venda de combustível ou lubrificante a consumidor ou usuário final estabelecido em outra unidade da Federação",
+    901: "Remessa para industrialização por encomenda",
+    902: "Retorno de mercadoria utilizada na industrialização por encomenda",
+    903: "Retorno de mercadoria recebida para industrialização e não aplicada no referido processo",
+    904: "Remessa para venda fora do estabelecimento",
+    905: "Remessa para depósito fechado ou armazém geral",
+    906: "Retorno de mercadoria depositada em depósito fechado ou armazém geral",
+    907: "Retorno simbólico de mercadoria depositada em depósito fechado ou armazém geral",
+    908: "Remessa de bem por conta de contrato de comodato",
+    909: "Retorno de bem recebido por conta de contrato de comodato",
+    910: "Remessa em bonificação, doação ou brinde",
+    911: "Remessa de amostra grátis",
+    912: "Remessa de mercadoria ou bem para demonstração, mostruário ou treinamento",
+    913: "Retorno de mercadoria ou bem recebido para demonstração ou mostruário",
+    914: "Remessa de mercadoria ou bem para exposição ou feira",
+    915: "Remessa de mercadoria ou bem para conserto ou reparo",
+    916: "Retorno de mercadoria ou bem recebido para conserto ou reparo",
+    917: "Remessa de mercadoria em consignação mercantil ou industrial",
+    918: "Devolução de mercadoria recebida em consignação mercantil ou industrial",
+    919: "Devolução simbólica de mercadoria vendida ou utilizada em processo industrial, recebida anteriormente em consignação",
+    920: "Remessa de vasilhame ou sacaria",
+    921: "Devolução de vasilhame ou sacaria",
+    922: "Lançamento a título de simples faturamento decorrente de venda para entrega futura",
+    923: "Remessa de mercadoria por conta e ordem de terceiros, em venda à ordem ou em operações com armazém geral ou depósito fechado",
+    924: "Remessa para industrialização por conta e ordem do adquirente, quando a mercadoria não transitar pelo seu estabelecimento",
+    925: "Retorno de mercadoria recebida para industrialização por conta e ordem do adquirente, quando a mercadoria não transitar pelo seu estabelecimento",
+    926: "Lançamento a título de reclassificação de mercadoria decorrente de formação de kit ou de sua desagregação",
+    927: "Lançamento a título de baixa de estoque decorrente de perda, roubo ou deterioração",
+    928: "Lançamento a título de baixa de estoque decorrente do encerramento da atividade da empresa",
+    929: "Lançamento relativo a operação também registrada em equipamento Emissor de Cupom Fiscal (ECF)",
+    933: "Prestação de serviço tributado pelo ISSQN",
+    934: "Remessa simbólica de mercadoria depositada em armazém geral ou depósito fechado",
+    949: "Outra saída de mercadoria ou prestação de serviço não especificada",
+}
+
+# Operações que só existem em alguns prefixos (as demais valem para os três da direção,
+# respeitando os grupos de PREFIXOS_POR_GRUPO).
+PREFIXOS_EXCLUSIVOS = {
+    'entrada': {127: (3,)},
+    'saida': {107: (6,), 108: (6,), 127: (7,), 404: (6,), 405: (5,), 667: (6,)},
+}
+
+# Grupos de operações (centena e meia centena dos 3 últimos dígitos) e prefixos em que aparecem.
+# Créditos de ICMS e lançamentos de estoque são operações internas do estado; do/para o
+# exterior só existem compras e vendas, devoluções, energia, serviços, exportação, ativo,
+# combustíveis e a operação genérica "outras".
+GRUPOS_SOMENTE_ESTADUAIS = (600,)
+OPERACOES_SOMENTE_ESTADUAIS = (926, 927, 928, 929)
+GRUPOS_EXTERIOR = (100, 200, 250, 300, 350, 500, 550, 650)
+OPERACOES_EXTERIOR = (949,)
+
+# Categorias usadas nos gráficos e nas regras de auditoria, por grupo de operação.
+CATEGORIA_AUSENTE = "Outras Operações"
+CATEGORIAS_POR_GRUPO = {
+    'entrada': {
+        100: "Compra", 150: "Transferência", 200: "Devolução", 250: "Energia Elétrica",
+        300: "Serviços de Comunicação", 350: "Serviços de Transporte", 400: "Compra com ST",
+        450: "Sistema de Integração", 500: "Exportação", 550: "Ativo Imobilizado e Uso e Consumo",
+        600: "Créditos de ICMS", 650: "Combustíveis", 900: "Outras Entradas",
+    },
+    'saida': {
+        100: "Venda", 150: "Transferência", 200: "Devolução de Compra", 250: "Energia Elétrica",
+        300: "Serviços de Comunicação", 350: "Serviços de Transporte", 400: "Venda com ST",
+        450: "Sistema de Integração", 500: "Exportação", 550: "Ativo Imobilizado e Uso e Consumo",
+        600: "Créditos de ICMS", 650: "Combustíveis", 900: "Outras Saídas",
+    },
+}
+
+PREFIXOS = {'entrada': (1, 2, 3), 'saida': (5, 6, 7)}
+DIRECOES = ("Ausente", "Entrada", "Saída")
+ABRANGENCIAS = ("Ausente", "Estadual", "Interestadual", "Exterior")
+DESCRICAO_AUSENTE = "Descrição não encontrada"
+
+
+def _grupo(operacao):
+    """Grupo da operação: centenas, com as meias centenas (150, 250...) como grupos próprios."""
+    if operacao >= 900:
+        return 900
+    return operacao // 50 * 50
+
+
+def _prefixo_valido(prefixo, operacao, direcao):
+    exclusivos = PREFIXOS_EXCLUSIVOS[direcao]
+    if operacao in exclusivos:
+        return prefixo in exclusivos[operacao]
+    abrangencia = PREFIXOS[direcao].index(prefixo)
+    if abrangencia == 0:
+        return True
+    if _grupo(operacao) in GRUPOS_SOMENTE_ESTADUAIS or operacao in OPERACOES_SOMENTE_ESTADUAIS:
+        return False
+    if abrangencia == 2:
+        return _grupo(operacao) in GRUPOS_EXTERIOR or operacao in OPERACOES_EXTERIOR
+    return True
+
+
+def _montar_tabelas():
+    """Monta os vetores de consulta indexados pelo próprio código do CFOP (0 a 7999)."""
+    categorias = [CATEGORIA_AUSENTE] + sorted({c for grupos in CATEGORIAS_POR_GRUPO.values() for c in grupos.values()})
+    descricoes = {DESCRICAO_AUSENTE: 0}
+    descricao = np.zeros(MAX_CFOP, dtype=np.int16)
+    categoria = np.zeros(MAX_CFOP, dtype=np.int8)
+    direcao = np.zeros(MAX_CFOP, dtype=np.int8)
+    abrangencia = np.zeros(MAX_CFOP, dtype=np.int8)
+
+    for nome_direcao, operacoes in (('entrada', OPERACOES_ENTRADA), ('saida', OPERACOES_SAIDA)):
+        for indice_abrangencia, prefixo in enumerate(PREFIXOS[nome_direcao], start=1):
+            inicio = prefixo * 1000
+            # Todo código do prefixo tem direção, abrangência e categoria pelo grupo, mesmo
+            # que a operação não esteja catalogada.
+            direcao[inicio:inicio + 1000] = DIRECOES.index("Entrada" if nome_direcao == 'entrada' else "Saída")
+            abrangencia[inicio:inicio + 1000] = indice_abrangencia
+            for operacao in range(100, 1000):
+                nome_categoria = CATEGORIAS_POR_GRUPO[nome_direcao].get(_grupo(operacao), CATEGORIA_AUSENTE)
+                categoria[inicio + operacao] = categorias.index(nome_categoria)
+            for operacao, texto in operacoes.items():
+                if _prefixo_valido(prefixo, operacao, nome_direcao):
+                    # Textos iguais (ex.: 5949 e 6949) compartilham a mesma entrada.
+                    descricao[inicio + operacao] = descricoes.setdefault(texto, len(descricoes))
+
+    return tuple(descricoes), tuple(categorias), descricao, categoria, direcao, abrangencia
+
+
+DESCRICOES, CATEGORIAS, _DESCRICAO, _CATEGORIA, _DIRECAO, _ABRANGENCIA = _montar_tabelas()
+_INTERESTADUAL = _ABRANGENCIA == ABRANGENCIAS.index("Interestadual")
+
+
+def codigos_catalogados():
+    """CFOPs presentes na tabela de descrições, em ordem crescente."""
+    return np.flatnonzero(_DESCRICAO)
+
+
+def _indices(cfop):
+    """Converte os CFOPs para índices dos vetores de consulta; valores fora da faixa viram 0."""
+    indices = np.asarray(cfop)
+    if indices.dtype.kind == 'f':
+        indices = np.nan_to_num(indices, nan=CODIGO_AUSENTE)
+    indices = indices.astype(np.int64, copy=False)
+    return np.where((indices > 0) & (indices < MAX_CFOP), indices, CODIGO_AUSENTE)
+
+
+def descricao_cfop(cfop):
+    """Descrição de cada CFOP, como categórica (sem criar um texto por linha)."""
+    return pd.Categorical.from_codes(_DESCRICAO[_indices(cfop)], categories=pd.Index(DESCRICOES))
+
+def categoria_cfop(cfop):
+    return pd.Categorical.from_codes(_CATEGORIA[_indices(cfop)], categories=pd.Index(CATEGORIAS))
+
+def direcao_cfop(cfop):
+    return pd.Categorical.from_codes(_DIRECAO[_indices(cfop)], categories=pd.Index(DIRECOES))
+
+def eh_interestadual(cfop):
+    return _INTERESTADUAL[_indices(cfop)]
+
+def eh_saida_estadual(cfop):
+    """CFOPs 5xxx: saída para destinatário no mesmo estado."""
+    indices = _indices(cfop)
+    return (_DIRECAO[indices] == DIRECOES.index("Saída")) & (_ABRANGENCIA[indices] == ABRANGENCIAS.index("Estadual"))
+
+def classificar_cfop(cfop):
+    """DataFrame com descrição, categoria, direção e indicador interestadual de cada CFOP."""
+    indices = _indices(cfop)
+    indice = cfop.index if isinstance(cfop, pd.Series) else None
+    return pd.DataFrame({
+        'descricao': pd.Categorical.from_codes(_DESCRICAO[indices], categories=pd.Index(DESCRICOES)),
+        'categoria': pd.Categorical.from_codes(_CATEGORIA[indices], categories=pd.Index(CATEGORIAS)),
+        'direcao': pd.Categorical.from_codes(_DIRECAO[indices], categories=pd.Index(DIRECOES)),
+        'interestadual': _INTERESTADUAL[indices],
+    }, index=indice)
+
+def converter_cfop(serie):
+    """
+    Converte a coluna de CFOP (texto ou categórica) para int16, interpretando cada valor
+    distinto uma única vez. Valores ausentes ou inválidos viram CODIGO_AUSENTE (0).
+    """
+    if isinstance(serie.dtype, pd.CategoricalDtype):
+        codigos, unicos = serie.cat.codes.to_numpy(), serie.cat.categories
+    else:
+        codigos, unicos = pd.factorize(serie)
+    unicos = pd.Index(unicos).astype(str).str.replace('.', '', regex=False).str.strip()
+    valores = pd.to_numeric(unicos, errors='coerce')
+    valores = np.where((valores > 0) & (valores < MAX_CFOP), valores, CODIGO_AUSENTE)
+    # O código -1 (valor ausente) cai no CODIGO_AUSENTE acrescentado ao final.
+    valores = np.append(valores.astype(np.int16), np.int16(CODIGO_AUSENTE))
+    return pd.Series(valores[codigos], index=serie.index, name=serie.name)
@@ -0,0 +1,110 @@
+# utils/cubo.py
+
+import numpy as np
+import pandas as pd
+from utils.schema import centavos_para_reais
+
+# Dimensões do cubo, com os nomes do DataFrame unificado. A data é truncada no dia.
+DIMENSAO_DATA = 'data_emissao_x'
+DIMENSAO_UF = 'uf_destinatario_x'
+DIMENSOES = [DIMENSAO_DATA, DIMENSAO_UF, 'nome_destinatario_x', 'descricao_do_produto_servico', 'cfop']
+
+# Medidas somáveis: valor em centavos, quantidade e número de itens.
+MEDIDAS = ['valor_total', 'quantidade', 'qtd_itens']
+MEDIDAS_MONETARIAS = ['valor_total']
+
+
+class CuboOLAP:
+    """
+    Agregados pré-calculados na ingestão sobre data × UF × cliente × produto × CFOP, com as
+    medidas de soma e contagem. Os KPIs e gráficos do dashboard são respondidos a partir daqui,
+    então o custo de cada consulta depende do tamanho do cubo, não do número de itens.
+
+    O número de notas não é somável entre clientes ou produtos, mas é somável entre dias e
+    UFs (cada nota tem uma única data e UF). Por isso ele fica num segundo cubo, menor,
+    com a granularidade dia × UF.
+    """
+
+    def __init__(self, fatos, notas):
+        self.fatos = fatos
+        self.notas = notas
+
+    @classmethod
+    def construir(cls, dataset):
+        dimensoes = [d for d in DIMENSOES if d in dataset.colunas]
+        medidas = [m for m in MEDIDAS if m in dataset.colunas]
+
+        base = dataset.juntar(dimensoes + medidas, centavos=True)
+        if DIMENSAO_DATA in base.columns:
+            base[DIMENSAO_DATA] = base[DIMENSAO_DATA].dt.floor('D')
+        base['qtd_itens'] = 1
+        fatos = base.groupby(dimensoes, observed=True, sort=False, dropna=False)[medidas + ['qtd_itens']].sum().reset_index()
+
+        notas = pd.DataFrame({
+            DIMENSAO_DATA: dataset.coluna_nota(DIMENSAO_DATA).dt.floor('D'),
+            DIMENSAO_UF: dataset.coluna_nota(DIMENSAO_UF),
+            'chave_de_acesso': dataset.cabecalho['chave_de_acesso'],
+        }).drop_duplicates(subset='chave_de_acesso')
+        notas = notas.groupby([DIMENSAO_DATA, DIMENSAO_UF], observed=True, sort=False, dropna=False).size().rename('qtd_notas').reset_index()
+        return cls(fatos, notas)
+
+    @classmethod
+    def combinar(cls, cubos):
+        """Soma cubos de partições disjuntas (ex.: arquivos de meses diferentes)."""
+        def somar(tabelas, chaves):
+            tabela = pd.concat(tabelas, ignore_index=True)
+            for col in chaves:
+                if not isinstance(tabela[col].dtype, pd.CategoricalDtype) and any(
+                        isinstance(t[col].dtype, pd.CategoricalDtype) for t in tabelas):
+                    tabela[col] = tabela[col].astype('category')
+            return tabela.groupby(chaves, observed=True, sort=False, dropna=False).sum().reset_index()
+
+        dimensoes = [d for d in cubos[0].fatos.columns if d in DIMENSOES]
+        return cls(
+            somar([c.fatos for c in cubos], dimensoes),
+            somar([c.notas for c in cubos], [DIMENSAO_DATA, DIMENSAO_UF]),
+        )
+
+    @property
+    def dimensoes(self):
+        return [d for d in DIMENSOES if d in self.fatos.columns]
+
+    @property
+    def medidas(self):
+        return [m for m in MEDIDAS if m in self.fatos.columns]
+
+    def filtrar(self, ufs, data_inicio=None, data_fim=None):
+        """Recorte do cubo para os filtros globais (UFs do destinatário e período)."""
+        def mascara(tabela):
+            selecao = tabela[DIMENSAO_UF].isin(ufs).to_numpy().copy()
+            if data_inicio is not None and data_fim is not None:
+                dias = tabela[DIMENSAO_DATA].to_numpy().astype('datetime64[D]')
+                selecao &= (dias >= np.datetime64(data_inicio, 'D')) & (dias <= np.datetime64(data_fim, 'D'))
+            return selecao
+
+        return CuboOLAP(self.fatos[mascara(self.fatos)], self.notas[mascara(self.notas)])
+
+    def _em_reais(self, medida, valores):
+        return centavos_para_reais(valores) if medida in MEDIDAS_MONETARIAS else valores
+
+    def total(self, medida):
+        total = self.fatos[medida].sum()
+        return total / 100 if medida in MEDIDAS_MONETARIAS else total
+
+    def total_notas(self):
+        return int(self.notas['qtd_notas'].sum())
+
+    def nunique(self, dimensao):
+        return self.fatos[dimensao].nunique()
+
+    def agregar(self, dimensao, medida):
+        """Soma da medida por valor da dimensão."""
+        agregado = self.fatos.groupby(dimensao, observed=True)[medida].sum()
+        return self._em_reais(medida, agregado)
+
+    def serie_diaria(self, medida):
+        """Soma diária da medida, com os dias sem movimento preenchidos com zero."""
+        diaria = self.fatos.groupby(DIMENSAO_DATA)[medida].sum()
+        if not diaria.empty:
+            diaria = diaria.asfreq('D', fill_value=0)
+        return self._em_reais(medida, diaria)
@@ -0,0 +1,257 @@
+# utils/dataset.py
+
+import hashlib
+import numpy as np
+import pandas as pd
+from utils.schema import eh_monetaria, centavos_para_reais, concatenar_lotes
+from utils.filtros import IndiceFiltro
+from utils.cubo import CuboOLAP
+
+CHAVE = 'chave_de_acesso'
+
+
+def combinar_hashes(hashes):
+    """Identificador de um dataset montado a partir de vários arquivos."""
+    if len(hashes) == 1:
+        return hashes[0]
+    return hashlib.sha256('\n'.join(hashes).encode()).hexdigest()
+
+
+class DatasetNFe:
+    """
+    Mantém o cabeçalho (uma linha por nota) e os itens (uma linha por produto) em tabelas
+    separadas, sem repetir as colunas do cabeçalho em cada item.
+
+    As colunas que existem nos dois CSVs (UF, data de emissão, emitente...) ficam apenas no
+    cabeçalho. Para quem precisa do formato antigo do merge, `juntar()` monta sob demanda
+    somente as colunas pedidas, com os mesmos nomes que o `pd.merge` gerava (`uf_destinatario_x`,
+    `data_emissao_y`, ...). Cada item aponta para a linha da sua nota no cabeçalho por
+    posição, então a junção é apenas um `take` vetorizado.
+
+    Os valores monetários ficam guardados em centavos (veja utils/schema.py); `coluna()`,
+    `juntar()` e `somar()` os devolvem em reais, a menos que `centavos=True`.
+    """
+
+    def __init__(self, cabecalho, itens, hash_conteudo=None, compartilhadas=None):
+        # `compartilhadas` permite informar colunas repetidas que já foram descartadas dos itens na leitura.
+        if compartilhadas is None:
+            compartilhadas = [c for c in itens.columns if c in cabecalho.columns and c != CHAVE]
+
+        itens = itens.drop(columns=[c for c in compartilhadas if c in itens.columns])
+
+        # Mesma semântica do merge "inner": notas sem itens e itens sem nota são descartados.
+        codigos, chaves_unicas = pd.factorize(cabecalho[CHAVE])
+        indexador = pd.Index(chaves_unicas).get_indexer(itens[CHAVE])
+        mantidos = indexador >= 0
+        if not mantidos.all():
+            itens = itens[mantidos]
+            indexador = indexador[mantidos]
+        itens = itens.reset_index(drop=True)
+
+        mascara_notas = (np.bincount(indexador, minlength=len(chaves_unicas)) > 0)[codigos]
+        cabecalho = cabecalho[mascara_notas].reset_index(drop=True)
+        codigos = codigos[mascara_notas]
+
+        # Se uma chave aparecer repetida no cabeçalho, os itens apontam para a primeira ocorrência.
+        primeira_ocorrencia = np.full(len(chaves_unicas), -1, dtype=np.int64)
+        primeira_ocorrencia[codigos[::-1]] = np.arange(len(codigos))[::-1]
+
+        self._inicializar(cabecalho, itens, primeira_ocorrencia[indexador], compartilhadas,
+                          hash_conteudo)
+
+    def _inicializar(self, cabecalho, itens, posicao_nota, compartilhadas, hash_conteudo, hashes_arquivos=None):
+        self.cabecalho = cabecalho
+        self.itens = itens
+        self.posicao_nota = np.asarray(posicao_nota, dtype=np.int64)
+        self.compartilhadas = list(compartilhadas)
+        self.hash_conteudo = hash_conteudo
+        # Hashes dos ZIPs que compõem o dataset, na ordem em que foram carregados.
+        if hashes_arquivos is None:
+            hashes_arquivos = (hash_conteudo,) if hash_conteudo else ()
+        self.hashes_arquivos = tuple(hashes_arquivos)
+        self._df_completo = None
+        self._indice_filtro = None
+        self._cubo = None
+        # Preenchidos quando o dataset é o resultado de um filtro global (veja IndiceFiltro.filtrar).
+        self.estado_filtro = None
+        self.dataset_pai = None
+
+        # Mapa "nome no formato do merge" -> (tabela, coluna de origem)
+        self._origem = {CHAVE: ('itens', CHAVE)}
+        for col in cabecalho.columns:
+            if col != CHAVE:
+                nome = f"{col}_x" if col in self.compartilhadas else col
+                self._origem[nome] = ('cabecalho', col)
+        for col in self.compartilhadas:
+            self._origem[f"{col}_y"] = ('cabecalho', col)
+        for col in itens.columns:
+            if col != CHAVE:
+                self._origem[col] = ('itens', col)
+
+    @classmethod
+    def _derivado(cls, cabecalho, itens, posicao_nota, compartilhadas, hash_conteudo, hashes_arquivos=None):
+        dataset = cls.__new__(cls)
+        dataset._inicializar(cabecalho, itens, posicao_nota, compartilhadas, hash_conteudo, hashes_arquivos)
+        return dataset
+
+    def tabelas_para_cache(self):
+        """Tabelas que permitem reconstruir o dataset e seu cubo sem recalcular nada (veja `do_cache`)."""
+        return {
+            'cabecalho': self.cabecalho,
+            'itens': self.itens,
+            'posicao_nota': pd.DataFrame({'posicao': self.posicao_nota}),
+            'compartilhadas': pd.DataFrame({'coluna': self.compartilhadas}, dtype=object),
+            'cubo_fatos': self.cubo.fatos,
+            'cubo_notas': self.cubo.notas,
+        }
+
+    @classmethod
+    def do_cache(cls, tabelas, hash_conteudo):
+        dataset = cls._derivado(tabelas['cabecalho'], tabelas['itens'], tabelas['posicao_nota']['posicao'].to_numpy(),
+                                tabelas['compartilhadas']['coluna'].tolist(), hash_conteudo)
+        dataset._cubo = CuboOLAP(tabelas['cubo_fatos'], tabelas['cubo_notas'])
+        return dataset
+
+    def __len__(self):
+        return len(self.itens)
+
+    @property
+    def num_notas(self):
+        return len(self.cabecalho)
+
+    @property
+    def colunas(self):
+        """Nomes das colunas no formato do DataFrame unificado."""
+        return list(self._origem)
+
+    def tipos(self):
+        """dtypes de cada coluna no formato unificado (como devolvidas por `juntar`), sem materializar a junção."""
+        return pd.Series({
+            nome: np.dtype('float64') if eh_monetaria(col) else (self.cabecalho if tabela == 'cabecalho' else self.itens)[col].dtype
+            for nome, (tabela, col) in self._origem.items()
+        })
+
+    def eh_coluna_de_nota(self, nome):
+        return self._origem[nome][0] == 'cabecalho'
+
+    def coluna_nota(self, nome):
+        """Coluna do cabeçalho (uma linha por nota) a partir do nome no formato unificado."""
+        tabela, col = self._origem[nome]
+        if tabela != 'cabecalho' and col != CHAVE:
+            raise KeyError(f"A coluna '{nome}' não é uma coluna de nota fiscal.")
+        return self.cabecalho[col]
+
+    def coluna(self, nome, centavos=False, posicoes=None):
+        """
+        Coluna no nível de item, juntando com o cabeçalho apenas se necessário. Com `posicoes`,
+        devolve apenas os itens dessas posições (o índice preserva as posições originais).
+        """
+        tabela, col = self._origem[nome]
+        if posicoes is None:
+            if tabela == 'itens':
+                serie = self.itens[col].rename(nome)
+            else:
+                serie = pd.Series(self.cabecalho[col].array.take(self.posicao_nota), name=nome)
+        else:
+            posicoes = np.asarray(posicoes, dtype=np.int64)
+            origem = self.itens[col].array.take(posicoes) if tabela == 'itens' else \
+                self.cabecalho[col].array.take(self.posicao_nota[posicoes])
+            serie = pd.Series(origem, index=posicoes, name=nome)
+        if eh_monetaria(col) and not centavos:
+            serie = centavos_para_reais(serie)
+        return serie
+
+    def juntar(self, colunas=None, centavos=False, posicoes=None):
+        """Monta o DataFrame no nível de item somente com as colunas (e itens) pedidos."""
+        colunas = self.colunas if colunas is None else list(dict.fromkeys(colunas))
+        return pd.DataFrame({nome: self.coluna(nome, centavos=centavos, posicoes=posicoes) for nome in colunas})
+
+    @property
+    def df(self):
+        """DataFrame unificado completo (como o antigo merge), montado uma única vez."""
+        if self._df_completo is None:
+            self._df_completo = self.juntar()
+        return self._df_completo
+
+    @property
+    def indice_filtro(self):
+        """Índice dos filtros globais (UF e período), construído na primeira utilização."""
+        if self._indice_filtro is None:
+            self._indice_filtro = IndiceFiltro(self)
+        return self._indice_filtro
+
+    @property
+    def cubo(self):
+        """
+        Cubo OLAP do dataset. Num dataset filtrado pelos filtros globais, é o recorte do cubo
+        do dataset original, sem reagregar os itens.
+        """
+        if self._cubo is None:
+            if self.dataset_pai is not None and self.estado_filtro is not None:
+                self._cubo = self.dataset_pai.cubo.filtrar(*self.estado_filtro)
+            else:
+                self._cubo = CuboOLAP.construir(self)
+        return self._cubo
+
+    def nunique(self, nome):
+        """Valores distintos, calculados na tabela de notas quando a coluna pertence a ela."""
+        if nome == CHAVE or self.eh_coluna_de_nota(nome):
+            return self.coluna_nota(nome).nunique()
+        return self.itens[self._origem[nome][1]].nunique()
+
+    def somar(self, nome):
+        """Soma de uma coluna no nível de item (valores monetários em reais)."""
+        tabela, col = self._origem[nome]
+        if tabela == 'itens':
+            total = self.itens[col].sum()
+            return total / 100 if eh_monetaria(col) else total
+        return self.coluna(nome).sum()
+
+    def somar_por_nota(self, coluna_item, centavos=False):
+        """Soma uma coluna numérica dos itens para cada linha do cabeçalho."""
+        valores = self.itens[coluna_item].to_numpy(dtype=np.float64, na_value=0.0)
+        somas = np.bincount(self.posicao_nota, weights=valores, minlength=self.num_notas)
+        if eh_monetaria(coluna_item):
+            # Somas de centavos são inteiras e exatas até 2**53.
+            somas = somas.round()
+            if not centavos:
+                somas = somas / 100
+        return pd.Series(somas, index=self.cabecalho.index)
+
+    def filtrar_notas(self, mascara):
+        """Novo dataset apenas com as notas selecionadas pela máscara booleana do cabeçalho."""
+        mascara = np.asarray(mascara, dtype=bool)
+        mascara_itens = mascara[self.posicao_nota]
+        nova_posicao = np.cumsum(mascara) - 1
+        return DatasetNFe._derivado(
+            self.cabecalho[mascara].reset_index(drop=True),
+            self.itens[mascara_itens].reset_index(drop=True),
+            nova_posicao[self.posicao_nota[mascara_itens]],
+            self.compartilhadas,
+            self.hash_conteudo,
+            self.hashes_arquivos,
+        )
+
+    def anexar(self, outro):
+        """
+        Novo dataset com as notas de `outro` que ainda não existem neste (deduplicadas pela
+        chave de acesso). As tabelas já carregadas não são reprocessadas, apenas concatenadas
+        com a nova partição.
+        """
+        chaves_existentes = pd.Index(pd.unique(self.cabecalho[CHAVE]))
+        novas = chaves_existentes.get_indexer(outro.cabecalho[CHAVE]) < 0
+        particao = outro if novas.all() else outro.filtrar_notas(novas)
+
+        hashes = self.hashes_arquivos + tuple(h for h in outro.hashes_arquivos if h not in self.hashes_arquivos)
+        compartilhadas = self.compartilhadas + [c for c in particao.compartilhadas if c not in self.compartilhadas]
+        anexado = DatasetNFe._derivado(
+            concatenar_lotes([self.cabecalho, particao.cabecalho]),
+            concatenar_lotes([self.itens, particao.itens]),
+            np.concatenate([self.posicao_nota, particao.posicao_nota + self.num_notas]),
+            compartilhadas,
+            combinar_hashes(hashes),
+            hashes,
+        )
+        # O cubo é aditivo: basta somar o cubo já existente com o da nova partição.
+        anexado._cubo = CuboOLAP.combinar([self.cubo, particao.cubo])
+        return anexado
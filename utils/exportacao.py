@@ -0,0 +1,163 @@
+# utils/exportacao.py
+
+import gzip
+import os
+import tempfile
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.csv as pacsv
+import pyarrow.parquet as pq
+from utils.dataset import DatasetNFe
+
+# --- EXPORTAÇÃO DE TABELAS GRANDES (XLSX, CSV E PARQUET) ---
+# O relatório Word comporta apenas amostras das tabelas. Aqui os itens filtrados, os
+# resultados das regras fiscais e as agregações do painel são exportados por inteiro, em
+# blocos de linhas: cada bloco é montado, convertido e escrito antes do próximo, em um arquivo
+# temporário anônimo. O arquivo nunca existe em memória além da cópia que o Streamlit lê para
+# o download, e os itens de um DatasetNFe só são juntados com o cabeçalho bloco a bloco.
+LINHAS_POR_BLOCO_EXPORTACAO = int(os.environ.get("NFE_EXPORTACAO_LINHAS_BLOCO", "50000"))
+# Nível de compressão do CSV (1 = mais rápido, 9 = menor).
+NIVEL_GZIP = int(os.environ.get("NFE_EXPORTACAO_NIVEL_GZIP", "6"))
+
+# Limite de linhas de uma planilha do Excel (contando o cabeçalho); o excedente vai para novas planilhas.
+MAX_LINHAS_PLANILHA = 1_048_576
+_LINHAS_POR_LOTE_XLSX = 5000
+
+# (extensão, tipo MIME, rótulo) de cada formato.
+FORMATOS = {
+    'xlsx': ('xlsx', 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet', 'Excel (.xlsx)'),
+    'csv': ('csv.gz', 'application/gzip', 'CSV compactado (.csv.gz)'),
+    'parquet': ('parquet', 'application/vnd.apache.parquet', 'Parquet (.parquet)'),
+}
+
+
+def _preparar_tabela(dados):
+    """Itens de um DatasetNFe, ou DataFrame/Series com o índice nomeado transformado em coluna."""
+    if isinstance(dados, DatasetNFe):
+        return dados
+    if isinstance(dados, pd.Series):
+        dados = dados.to_frame(dados.name if dados.name is not None else 'valor')
+    if any(nome is not None for nome in dados.index.names):
+        dados = dados.reset_index()
+    return dados
+
+
+def contar_linhas(dados):
+    return len(_preparar_tabela(dados))
+
+
+def blocos(dados, linhas_por_bloco=LINHAS_POR_BLOCO_EXPORTACAO):
+    """DataFrames consecutivos com até `linhas_por_bloco` linhas de `dados` (pelo menos um, mesmo vazio)."""
+    dados = _preparar_tabela(dados)
+    total = len(dados)
+    for inicio in range(0, max(total, 1), linhas_por_bloco):
+        fim = min(inicio + linhas_por_bloco, total)
+        if isinstance(dados, DatasetNFe):
+            # Apenas as linhas do bloco são juntadas com o cabeçalho
+            yield dados.juntar(posicoes=np.arange(inicio, fim)).reset_index(drop=True)
+        else:
+            yield dados.iloc[inicio:fim]
+
+
+def _tabelas_arrow(dados, linhas_por_bloco):
+    """Blocos convertidos em tabelas do Arrow, todos com o esquema do primeiro bloco."""
+    esquema = None
+    for bloco in blocos(dados, linhas_por_bloco):
+        tabela = pa.Table.from_pandas(bloco, schema=esquema, preserve_index=False)
+        esquema = tabela.schema
+        yield tabela
+
+
+def exportar_csv(dados, destino, linhas_por_bloco=LINHAS_POR_BLOCO_EXPORTACAO, nivel=NIVEL_GZIP):
+    """CSV (UTF-8, separado por vírgulas) compactado com gzip, escrito em `destino` bloco a bloco."""
+    escritor = None
+    # Fechar o GzipFile finaliza a compressão, mas mantém `destino` aberto
+    with gzip.GzipFile(fileobj=destino, mode='wb', compresslevel=nivel) as compactado:
+        # O escritor de CSV do Arrow é bem mais rápido que o `to_csv` do pandas em tabelas grandes
+        for tabela in _tabelas_arrow(dados, linhas_por_bloco):
+            if escritor is None:
+                escritor = pacsv.CSVWriter(compactado, tabela.schema)
+            escritor.write_table(tabela)
+        escritor.close()
+
+
+def exportar_parquet(dados, destino, linhas_por_bloco=LINHAS_POR_BLOCO_EXPORTACAO):
+    """Parquet com um grupo de linhas por bloco."""
+    escritor = None
+    try:
+        for tabela in _tabelas_arrow(dados, linhas_por_bloco):
+            if escritor is None:
+                escritor = pq.ParquetWriter(destino, tabela.schema)
+            escritor.write_table(tabela)
+    finally:
+        if escritor is not None:
+            escritor.close()
+
+
+def _valores_celulas(serie):
+    """Valores de uma coluna prontos para o xlsxwriter: tipos do Python e None nas células vazias."""
+    if isinstance(serie.dtype, pd.CategoricalDtype):
+        serie = serie.astype(object)
+    if pd.api.types.is_datetime64_any_dtype(serie.dtype):
+        # O Excel não guarda fuso horário
+        if getattr(serie.dt, 'tz', None) is not None:
+            serie = serie.dt.tz_localize(None)
+        valores = serie.dt.to_pydatetime().astype(object)
+    else:
+        valores = serie.to_numpy(dtype=object, copy=True)
+    valores[pd.isna(serie).to_numpy()] = None
+    return valores.tolist()
+
+
+def exportar_xlsx(dados, destino, nome_planilha="Dados", linhas_por_bloco=LINHAS_POR_BLOCO_EXPORTACAO):
+    """
+    Pasta de trabalho do Excel no modo de memória constante do xlsxwriter: cada linha é gravada
+    em disco assim que é escrita. Acima do limite do Excel, as linhas continuam em novas planilhas.
+    """
+    import xlsxwriter
+
+    opcoes = {'constant_memory': True, 'default_date_format': 'dd/mm/yyyy hh:mm:ss',
+              'strings_to_numbers': False, 'strings_to_formulas': False, 'strings_to_urls': False}
+    with xlsxwriter.Workbook(destino, opcoes) as pasta:
+        negrito = pasta.add_format({'bold': True})
+        planilha, linha, colunas = None, 0, None
+
+        def nova_planilha():
+            numero = len(pasta.worksheets()) + 1
+            planilha = pasta.add_worksheet(nome_planilha if numero == 1 else f"{nome_planilha} ({numero})")
+            planilha.write_row(0, 0, [str(c) for c in colunas], negrito)
+            planilha.freeze_panes(1, 0)
+            return planilha
+
+        for bloco in blocos(dados, linhas_por_bloco):
+            if planilha is None:
+                colunas = list(bloco.columns)
+                planilha, linha = nova_planilha(), 1
+            # Os valores viram objetos do Python em lotes menores, que ocupam bem mais memória que o bloco
+            for inicio in range(0, len(bloco), _LINHAS_POR_LOTE_XLSX):
+                lote = bloco.iloc[inicio:inicio + _LINHAS_POR_LOTE_XLSX]
+                valores = [_valores_celulas(lote.iloc[:, j]) for j in range(lote.shape[1])]
+                for registro in zip(*valores):
+                    if linha == MAX_LINHAS_PLANILHA:
+                        planilha, linha = nova_planilha(), 1
+                    planilha.write_row(linha, 0, registro)
+                    linha += 1
+
+
+_EXPORTADORES = {'xlsx': exportar_xlsx, 'csv': exportar_csv, 'parquet': exportar_parquet}
+
+
+def exportar(dados, formato):
+    """
+    Exporta `dados` (DatasetNFe, DataFrame ou Series) para um arquivo temporário anônimo, que é
+    devolvido aberto e posicionado no início; o arquivo some do disco ao ser fechado.
+    """
+    destino = tempfile.TemporaryFile()
+    try:
+        _EXPORTADORES[formato](dados, destino)
+        destino.seek(0)
+    except BaseException:
+        destino.close()
+        raise
+    return destino
@@ -0,0 +1,101 @@
+# utils/filtros.py
+
+from collections import OrderedDict
+import numpy as np
+import pandas as pd
+
+# Quantos resultados de filtro (combinações de UFs e período) ficam memorizados por dataset.
+MAX_FILTROS_MEMORIZADOS = 8
+
+
+class IndiceFiltro:
+    """
+    Índice dos filtros globais (UF do destinatário e período de emissão), construído uma
+    única vez por dataset sobre a tabela de notas.
+
+    As notas são ordenadas pela data de emissão e, para cada UF, guardamos as posições
+    (nessa ordem) das notas daquela UF. Aplicar um filtro é então uma busca binária pelo
+    período seguida de um fatiamento das posições de cada UF selecionada, sem percorrer a
+    tabela inteira. Os datasets filtrados são memorizados pelo estado do filtro.
+    """
+
+    def __init__(self, dataset, coluna_uf='uf_destinatario', coluna_data='data_emissao'):
+        self._dataset = dataset
+        notas = dataset.cabecalho
+
+        dias = notas[coluna_data].to_numpy().astype('datetime64[D]')
+        # Ordenação estável: notas sem data (NaT) ficam no final e nunca entram num período.
+        self._ordem = np.argsort(dias, kind='stable')
+        self._dias_ordenados = dias[self._ordem]
+        self._num_com_data = int((~np.isnat(dias)).sum())
+
+        ufs = notas[coluna_uf]
+        if not isinstance(ufs.dtype, pd.CategoricalDtype):
+            ufs = ufs.astype('category')
+        codigos_ordenados = ufs.cat.codes.to_numpy()[self._ordem]
+        self._posicoes_por_uf = {}
+        for codigo, uf in enumerate(ufs.cat.categories):
+            posicoes = np.flatnonzero(codigos_ordenados == codigo)
+            if len(posicoes):
+                self._posicoes_por_uf[uf] = posicoes
+        self._todas_com_uf = sum(len(p) for p in self._posicoes_por_uf.values()) == len(self._ordem)
+
+        self._memo = OrderedDict()
+
+    @property
+    def ufs(self):
+        """UFs que aparecem no dataset, em ordem alfabética."""
+        return sorted(self._posicoes_por_uf)
+
+    @property
+    def data_min(self):
+        return pd.Timestamp(self._dias_ordenados[0]) if self._num_com_data else None
+
+    @property
+    def data_max(self):
+        return pd.Timestamp(self._dias_ordenados[self._num_com_data - 1]) if self._num_com_data else None
+
+    def mascara(self, ufs, data_inicio=None, data_fim=None):
+        """Máscara booleana sobre as notas para as UFs e o período (inclusivo) informados."""
+        if data_inicio is None or data_fim is None:
+            inicio, fim = 0, len(self._ordem)
+        else:
+            inicio = np.searchsorted(self._dias_ordenados[:self._num_com_data], np.datetime64(data_inicio, 'D'), side='left')
+            fim = np.searchsorted(self._dias_ordenados[:self._num_com_data], np.datetime64(data_fim, 'D'), side='right')
+
+        mascara = np.zeros(len(self._ordem), dtype=bool)
+        for uf in ufs:
+            posicoes = self._posicoes_por_uf.get(uf)
+            if posicoes is None:
+                continue
+            trecho = posicoes[np.searchsorted(posicoes, inicio):np.searchsorted(posicoes, fim)]
+            mascara[self._ordem[trecho]] = True
+        return mascara
+
+    def _seleciona_tudo(self, ufs, data_inicio, data_fim):
+        if list(ufs) != self.ufs or not self._todas_com_uf:
+            return False
+        if data_inicio is None or data_fim is None:
+            return True
+        return (self._num_com_data == len(self._ordem) and self._num_com_data > 0
+                and data_inicio <= self.data_min.date() and data_fim >= self.data_max.date())
+
+    def filtrar(self, ufs, data_inicio=None, data_fim=None):
+        """Dataset filtrado, memorizado pelo estado do filtro."""
+        estado = (tuple(sorted(ufs)), data_inicio, data_fim)
+        if estado in self._memo:
+            self._memo.move_to_end(estado)
+            return self._memo[estado]
+
+        if self._seleciona_tudo(estado[0], data_inicio, data_fim):
+            # Filtro que seleciona todas as notas: devolve o próprio dataset, sem cópia.
+            filtrado = self._dataset
+        else:
+            filtrado = self._dataset.filtrar_notas(self.mascara(ufs, data_inicio, data_fim))
+            filtrado.estado_filtro = estado
+            filtrado.dataset_pai = self._dataset
+
+        self._memo[estado] = filtrado
+        if len(self._memo) > MAX_FILTROS_MEMORIZADOS:
+            self._memo.popitem(last=False)
+        return filtrado
@@ -0,0 +1,200 @@
+# utils/graficos.py
+
+import hashlib
+import json
+import os
+import threading
+import uuid
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+# --- RASTERIZAÇÃO DOS GRÁFICOS DO RELATÓRIO ---
+# Cada `fig.write_image` paga a inicialização do renderizador (kaleido) e roda de novo a cada
+# exportação. Aqui os gráficos são renderizados em paralelo, em processos que mantêm o kaleido
+# aquecido entre exportações, e as imagens ficam em um cache em disco endereçado pelo hash da
+# especificação da figura: um gráfico que não mudou nunca é renderizado de novo.
+DIRETORIO_GRAFICOS = os.environ.get("NFE_GRAFICOS_CACHE_DIR", os.path.join(".cache", "graficos"))
+LIMITE_GRAFICOS_MB = int(os.environ.get("NFE_GRAFICOS_LIMITE_MB", "256"))
+PROCESSOS_GRAFICOS = int(os.environ.get("NFE_GRAFICOS_PROCESSOS", str(min(4, os.cpu_count() or 1))))
+
+# Dimensões das imagens do relatório e tema aplicado aos gráficos.
+LARGURA_IMAGEM = 900
+ALTURA_IMAGEM = 500
+ESCALA_IMAGEM = 2
+TEMA_RELATORIO = 'plotly_white'
+# Incrementar sempre que a forma de renderizar mudar, para invalidar as imagens antigas.
+VERSAO_IMAGENS = 1
+
+
+# --- PROCESSOS DE TRABALHO ---
+def _renderizar(especificacao, tema, largura, altura, escala):
+    import plotly.io as pio
+    fig = pio.from_json(especificacao)
+    fig.update_layout(template=tema)
+    return fig.to_image(format='png', width=largura, height=altura, scale=escala)
+
+
+def _aquecer_trabalhador():
+    """Inicializador dos processos: deixa o kaleido pronto antes do primeiro gráfico."""
+    figura = json.dumps({'data': [{'type': 'bar', 'x': [1], 'y': [1]}]})
+    try:
+        # A primeira renderização confirma que o kaleido (e o navegador que ele usa) está disponível
+        _renderizar(figura, TEMA_RELATORIO, 10, 10, 1)
+        import kaleido
+        # A partir da versão 1, o kaleido só mantém o navegador aberto entre chamadas com o servidor síncrono.
+        if hasattr(kaleido, 'start_sync_server'):
+            kaleido.start_sync_server(silence_warnings=True)
+            _renderizar(figura, TEMA_RELATORIO, 10, 10, 1)
+    except Exception as e:
+        # O erro reaparece, com a mensagem completa, ao renderizar o primeiro gráfico.
+        print(f"Não foi possível aquecer o renderizador de gráficos: {e}")
+
+
+def _nada():
+    return None
+
+
+class ServicoGraficos:
+    """
+    Converte figuras do Plotly em PNG para o relatório Word.
+
+    As imagens são guardadas em `diretorio`, uma por hash de (especificação da figura,
+    dimensões, tema), e reaproveitadas entre exportações e reinícios da aplicação; quando o
+    tamanho total passa do limite, as usadas há mais tempo são removidas. As que faltam são
+    renderizadas ao mesmo tempo em um pool de processos (spawn) que sobrevive entre
+    exportações, com o kaleido já aquecido em cada processo.
+    """
+
+    def __init__(self, diretorio=DIRETORIO_GRAFICOS, limite_mb=LIMITE_GRAFICOS_MB, processos=PROCESSOS_GRAFICOS):
+        self.diretorio = diretorio
+        self.limite_bytes = limite_mb * 1024 * 1024
+        self.processos = max(1, processos)
+        self._executor = None
+        self._lock = threading.Lock()
+        self.acertos = 0
+        self.renderizados = 0
+
+    @staticmethod
+    def chave(especificacao, largura=LARGURA_IMAGEM, altura=ALTURA_IMAGEM, escala=ESCALA_IMAGEM, tema=TEMA_RELATORIO):
+        conteudo = json.dumps([VERSAO_IMAGENS, especificacao, largura, altura, escala, tema])
+        return hashlib.sha256(conteudo.encode('utf-8')).hexdigest()
+
+    def _caminho(self, chave):
+        return os.path.join(self.diretorio, f"{chave}.png")
+
+    def _obter_executor(self):
+        with self._lock:
+            if self._executor is None:
+                self._executor = ProcessPoolExecutor(
+                    max_workers=self.processos, mp_context=multiprocessing.get_context('spawn'),
+                    initializer=_aquecer_trabalhador,
+                )
+            return self._executor
+
+    def aquecer(self):
+        """Inicia os processos (e o kaleido de cada um) sem esperar, antes da primeira exportação."""
+        if self._executor is not None:
+            return
+        executor = self._obter_executor()
+        for _ in range(self.processos):
+            executor.submit(_nada)
+
+    def encerrar(self):
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=False, cancel_futures=True)
+
+    # --- Cache em disco ---
+    def _ler(self, chave):
+        caminho = self._caminho(chave)
+        try:
+            with open(caminho, 'rb') as f:
+                imagem = f.read()
+        except OSError:
+            return None
+        # Marca a imagem como usada recentemente para a política LRU.
+        os.utime(caminho)
+        return imagem
+
+    def _gravar(self, chave, imagem):
+        try:
+            os.makedirs(self.diretorio, exist_ok=True)
+            temporario = f"{self._caminho(chave)}.{uuid.uuid4().hex}.tmp"
+            with open(temporario, 'wb') as f:
+                f.write(imagem)
+            os.replace(temporario, self._caminho(chave))
+            self._limitar_tamanho()
+        except OSError as e:
+            # O cache é apenas uma otimização: a imagem já renderizada segue para o relatório.
+            print(f"Não foi possível gravar a imagem do gráfico no cache: {e}")
+
+    def _limitar_tamanho(self):
+        imagens = []
+        for nome in os.listdir(self.diretorio):
+            if nome.endswith('.png'):
+                estado = os.stat(os.path.join(self.diretorio, nome))
+                imagens.append((estado.st_mtime, estado.st_size, nome))
+        total = sum(tamanho for _, tamanho, _ in imagens)
+        for _, tamanho, nome in sorted(imagens):
+            if total <= self.limite_bytes:
+                break
+            os.remove(os.path.join(self.diretorio, nome))
+            total -= tamanho
+
+    # --- Rasterização ---
+    def rasterizar(self, figuras, largura=LARGURA_IMAGEM, altura=ALTURA_IMAGEM, escala=ESCALA_IMAGEM,
+                   tema=TEMA_RELATORIO):
+        """
+        PNG (bytes) de cada figura, na ordem recebida; a figura que não pôde ser renderizada
+        recebe a exceção no lugar da imagem. As figuras não são modificadas.
+        """
+        especificacoes = [fig.to_json() for fig in figuras]
+        chaves = [self.chave(esp, largura, altura, escala, tema) for esp in especificacoes]
+        imagens = {}
+        pendentes = {}
+        for chave, especificacao in zip(chaves, especificacoes):
+            if chave in imagens or chave in pendentes:
+                continue
+            imagem = self._ler(chave)
+            if imagem is not None:
+                imagens[chave] = imagem
+            else:
+                pendentes[chave] = especificacao
+        with self._lock:
+            self.acertos += len(imagens)
+
+        if pendentes:
+            try:
+                executor = self._obter_executor()
+                futuros = {
+                    chave: executor.submit(_renderizar, especificacao, tema, largura, altura, escala)
+                    for chave, especificacao in pendentes.items()
+                }
+            except BrokenProcessPool as e:
+                self.encerrar()
+                futuros = {}
+                imagens.update({chave: e for chave in pendentes})
+            for chave, futuro in futuros.items():
+                try:
+                    imagens[chave] = futuro.result()
+                except BrokenProcessPool as e:
+                    # Um processo morreu: o pool é recriado na próxima exportação.
+                    self.encerrar()
+                    imagens[chave] = e
+                    continue
+                except Exception as e:
+                    imagens[chave] = e
+                    continue
+                self._gravar(chave, imagens[chave])
+                with self._lock:
+                    self.renderizados += 1
+        return [imagens[chave] for chave in chaves]
+
+    def estatisticas(self):
+        with self._lock:
+            return {'acertos': self.acertos, 'renderizados': self.renderizados}
+
+
+servico_graficos = ServicoGraficos()
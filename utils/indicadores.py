@@ -0,0 +1,26 @@
+# utils/indicadores.py
+
+from utils.agregacoes import memorizar_agregacao
+
+# --- INDICADORES DO PAINEL ---
+# Consultas ao cubo OLAP do dataset usadas pela aba do Dashboard e pelo processamento em lote
+# (cli.py), memorizadas por dataset e estado dos filtros globais.
+
+
+@memorizar_agregacao
+def calcular_kpis(dataset, coluna_quantidade, coluna_cliente):
+    cubo = dataset.cubo
+    return {
+        'valor_total': cubo.total('valor_total'),
+        'quantidade': cubo.total(coluna_quantidade) if coluna_quantidade else "N/A",
+        'notas': cubo.total_notas(),
+        'clientes': cubo.nunique(coluna_cliente) if coluna_cliente else "N/A",
+    }
+
+@memorizar_agregacao
+def calcular_top_n(dataset, dimensao, metrica, top_n):
+    return dataset.cubo.agregar(dimensao, metrica).nlargest(top_n)
+
+@memorizar_agregacao
+def calcular_serie_diaria(dataset, metrica):
+    return dataset.cubo.serie_diaria(metrica)
@@ -0,0 +1,177 @@
+# utils/insights.py
+
+import os
+import queue
+from concurrent.futures import ThreadPoolExecutor
+from langchain_core.rate_limiters import InMemoryRateLimiter
+from tenacity import Retrying, stop_after_attempt, wait_random_exponential
+from utils.callbacks import PolishedCallbackHandler, TelemetriaCallbackHandler
+from utils.agentes import pool_agentes
+from utils.cache_llm import cache_llm
+from utils.receitas import livro_receitas
+from utils.roteador import rotear, redigir_com_llm, prompt_redacao
+
+# --- CONFIGURAÇÃO DA GERAÇÃO DE INSIGHTS ---
+# Quantas perguntas são respondidas ao mesmo tempo.
+MAX_CONCORRENCIA_INSIGHTS = int(os.environ.get("NFE_INSIGHTS_CONCORRENCIA", "4"))
+# Limite de requisições ao LLM por minuto, compartilhado por todas as perguntas em andamento.
+REQUISICOES_LLM_POR_MINUTO = float(os.environ.get("NFE_LLM_REQUISICOES_POR_MINUTO", "15"))
+# Tentativas por pergunta e espera máxima (s) entre elas, com recuo exponencial aleatorizado.
+TENTATIVAS_LLM = int(os.environ.get("NFE_LLM_TENTATIVAS", "3"))
+ESPERA_MAXIMA_LLM = float(os.environ.get("NFE_LLM_ESPERA_MAXIMA", "30"))
+
+
+# Lista de perguntas pré-definidas para a análise automática
+PERGUNTAS_RELEVANTES = [
+    "Qual o faturamento total neste conjunto de dados?",
+    "Qual o número total de notas fiscais únicas (baseado na 'chave_de_acesso')?",
+    "Qual o valor médio por nota fiscal? (calcule o faturamento total dividido pelo número de notas fiscais únicas)",
+    "Quem foi o cliente (use a coluna que representa a razão social do destinatário) que mais comprou em valor?",
+    "Quais são os 5 produtos (use a coluna de descrição do produto) mais vendidos em valor total? Responda em formato de lista.",
+    "Quais são os 5 produtos mais vendidos em quantidade (use a coluna de quantidade)? Responda em formato de lista.",
+    "Qual o número total de clientes únicos (destinatários)?",
+    "Quais os 3 estados (use a coluna de UF do destinatário) que mais receberam valor em mercadorias? Responda em formato de lista.",
+    "Qual a principal operação fiscal (CFOP) em termos de valor total?",
+    "Faça um resumo executivo sobre os dados em 2 frases."
+]
+
+
+def criar_limitador_taxa(requisicoes_por_minuto=REQUISICOES_LLM_POR_MINUTO, rajada=MAX_CONCORRENCIA_INSIGHTS):
+    """
+    Balde de fichas (token bucket) para as chamadas ao LLM: cada requisição consome uma ficha,
+    reposta à taxa configurada; até `rajada` requisições podem sair de uma vez.
+    Deve ser passado ao modelo de chat pelo parâmetro `rate_limiter`.
+    """
+    return InMemoryRateLimiter(
+        requests_per_second=requisicoes_por_minuto / 60,
+        check_every_n_seconds=0.1,
+        max_bucket_size=max(1, rajada),
+    )
+
+# Limitador compartilhado por todos os modelos de chat criados pela aplicação.
+limitador_llm = criar_limitador_taxa()
+
+
+class GeradorInsights:
+    """
+    Responde a uma lista de perguntas sobre o dataset, com no máximo `max_concorrencia`
+    perguntas em andamento ao mesmo tempo.
+
+    Perguntas reconhecidas pelo roteador (utils/roteador.py) são respondidas na hora, sem
+    LLM. As demais rodam em um pool de threads, cada pergunta com um agente emprestado do
+    pool de agentes (utils/agentes.py); as falhas são repetidas com recuo exponencial
+    aleatorizado, sem bloquear as outras perguntas. O modelo de chat é criado sob demanda por `criar_llm` e
+    pode ser qualquer BaseChatModel (inclusive um modelo falso, nos testes); `modelo` e
+    `temperatura` identificam as respostas no cache do LLM (utils/cache_llm.py), que é
+    consultado antes de qualquer chamada. Com `exibir_passos=False`, os agentes não imprimem
+    os seus passos no terminal (PolishedCallbackHandler), como convém ao uso sem interface.
+    """
+
+    def __init__(self, dataset, criar_llm, modelo, temperatura=0, max_concorrencia=MAX_CONCORRENCIA_INSIGHTS,
+                 tentativas=TENTATIVAS_LLM, espera_maxima=ESPERA_MAXIMA_LLM, cache=cache_llm, pool=pool_agentes,
+                 receitas=livro_receitas, exibir_passos=True):
+        self.dataset = dataset
+        self._criar_llm = criar_llm
+        self.modelo = modelo
+        self.temperatura = temperatura
+        self.cache = cache
+        self.pool = pool
+        self.receitas = receitas
+        self.max_concorrencia = max(1, max_concorrencia)
+        self.tentativas = tentativas
+        self.espera_maxima = espera_maxima
+        self.exibir_passos = exibir_passos
+
+    @property
+    def llm(self):
+        return self.pool.cliente_llm(self.modelo, self.temperatura, self._criar_llm)
+
+    def _com_retry(self, avisar, funcao, *args, **kwargs):
+        for tentativa in Retrying(wait=wait_random_exponential(multiplier=1, max=self.espera_maxima),
+                                  stop=stop_after_attempt(self.tentativas), reraise=True):
+            with tentativa:
+                if tentativa.retry_state.attempt_number > 1:
+                    avisar(tentativa.retry_state.attempt_number)
+                return funcao(*args, **kwargs)
+
+    def _invocar_agente(self, indice, pergunta, callbacks):
+        if self.exibir_passos:
+            callbacks = [PolishedCallbackHandler(agent_name=f"Analista de Insights #{indice + 1}"), *callbacks]
+        with self.pool.emprestar(self.dataset, 'insights', self.modelo, self.temperatura, self._criar_llm,
+                                 agent_executor_kwargs={"handle_parsing_errors": True}) as agente:
+            return agente.invoke({"input": pergunta}, config={"callbacks": callbacks})['output']
+
+    def _responder_com_llm(self, indice, pergunta, resposta_roteada, eventos):
+        # As novas tentativas são repassadas à thread de quem chamou `gerar`
+        avisar = lambda numero: eventos.put(('tentativa', indice, numero))
+        # Um único handler de telemetria por pergunta, para numerar as tentativas
+        telemetria = TelemetriaCallbackHandler('insights')
+        try:
+            if resposta_roteada is not None:
+                # O LLM só redige o texto final a partir dos fatos já calculados
+                prompt = prompt_redacao(pergunta, resposta_roteada)
+                gerar = lambda: self._com_retry(avisar, redigir_com_llm, self.llm, pergunta, resposta_roteada,
+                                                callbacks=[telemetria])
+            else:
+                # Uma receita já gravada para a pergunta (utils/receitas.py) dispensa o agente
+                prompt = pergunta
+                gerar = lambda: self.receitas.responder(
+                    self.dataset, pergunta,
+                    lambda captura: self._com_retry(avisar, self._invocar_agente, indice, pergunta, [captura, telemetria]),
+                    lambda fatos: self._com_retry(avisar, redigir_com_llm, self.llm, pergunta, fatos, callbacks=[telemetria]),
+                )
+            resposta = self.cache.obter_ou_gerar(self.dataset, self.modelo, self.temperatura, prompt, gerar)
+            return {"pergunta": pergunta, "resposta": resposta}
+        except Exception as e:
+            # Uma pergunta que falhou não interrompe as demais
+            return {"pergunta": pergunta, "resposta": f"Não foi possível responder a esta pergunta: {e}", "erro": True}
+
+    def gerar(self, perguntas, ao_concluir=None, ao_repetir=None):
+        """
+        Responde às perguntas e devolve os resultados na ordem original. `ao_concluir(indice,
+        resultado, concluidas, total)` é chamado à medida que cada resposta fica pronta, e
+        `ao_repetir(indice, tentativa)` a cada nova tentativa de uma pergunta que falhou. Os dois
+        são chamados na thread de quem chamou `gerar` (podem atualizar a interface com segurança).
+        """
+        total = len(perguntas)
+        resultados = [None] * total
+        concluidas = 0
+
+        def concluir(indice, resultado):
+            nonlocal concluidas
+            resultados[indice] = resultado
+            concluidas += 1
+            if ao_concluir is not None:
+                ao_concluir(indice, resultado, concluidas, total)
+
+        # O roteamento é instantâneo e roda aqui mesmo; só o restante vai para o pool.
+        pendentes = []
+        for indice, pergunta in enumerate(perguntas):
+            resposta_roteada = rotear(self.dataset, pergunta)
+            if resposta_roteada is not None and not resposta_roteada.precisa_redacao:
+                concluir(indice, {"pergunta": pergunta, "resposta": resposta_roteada.texto})
+            else:
+                pendentes.append((indice, pergunta, resposta_roteada))
+
+        if not pendentes:
+            return resultados
+        if any(resposta_roteada is None for _, _, resposta_roteada in pendentes):
+            # Monta o DataFrame completo uma única vez, antes de as threads criarem seus agentes.
+            self.dataset.df
+
+        # As threads só publicam eventos nesta fila; quem os consome é a thread de quem chamou.
+        eventos = queue.Queue()
+        with ThreadPoolExecutor(max_workers=min(self.max_concorrencia, len(pendentes)), thread_name_prefix="insights") as executor:
+            for indice, pergunta, resposta_roteada in pendentes:
+                futuro = executor.submit(self._responder_com_llm, indice, pergunta, resposta_roteada, eventos)
+                futuro.add_done_callback(lambda futuro, indice=indice: eventos.put(('concluida', indice, futuro)))
+            restantes = len(pendentes)
+            while restantes:
+                tipo, indice, valor = eventos.get()
+                if tipo == 'tentativa':
+                    if ao_repetir is not None:
+                        ao_repetir(indice, valor)
+                else:
+                    restantes -= 1
+                    concluir(indice, valor.result())
+        return resultados
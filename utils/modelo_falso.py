@@ -0,0 +1,139 @@
+# utils/modelo_falso.py
+
+import random
+import re
+import threading
+import time
+from typing import Any, Iterator, List, Optional
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, AIMessageChunk, BaseMessage
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+
+# --- MODELO DE CHAT FALSO PARA TESTES E BENCHMARKS ---
+# Substitui o Gemini sem rede: responde seguindo um roteiro ReAct fixo (pensamento, ação,
+# observação...), com latência simulada e falhas e respostas mal formatadas injetadas de
+# forma reprodutível (semente fixa).
+
+# Roteiro padrão: dois passos de código sobre o `df` e a resposta final.
+ROTEIRO_PADRAO = (
+    "Thought: Vou verificar quantos itens o DataFrame tem.\nAction: python_repl_ast\nAction Input: len(df)",
+    "Thought: Agora vou somar o valor dos itens.\nAction: python_repl_ast\nAction Input: df['valor_total'].sum()",
+    "Thought: Já tenho as informações necessárias.\nFinal Answer: Os dados foram analisados com sucesso.",
+)
+# Resposta para prompts que não são do agente (ex.: redação de uma resposta já calculada).
+RESPOSTA_TEXTO_PADRAO = "Segundo os dados analisados, esta é a resposta à pergunta."
+# Saída sem "Action" nem "Final Answer", que o agente não consegue interpretar.
+RESPOSTA_MAL_FORMATADA = "Acho que a resposta está em algum lugar dos dados."
+
+_PERGUNTA_REACT = "Question:"
+_OBSERVACAO = re.compile(r"^Observation:", re.MULTILINE)
+
+
+class FalhaSimulada(ConnectionError):
+    """Falha injetada pelo ModeloReActFalso, no lugar de um erro de rede ou de limite de taxa."""
+
+
+class ModeloReActFalso(BaseChatModel):
+    """
+    Modelo de chat determinístico que segue `roteiro`, uma resposta por iteração do agente.
+
+    A iteração é deduzida do próprio prompt (quantas observações já há depois da pergunta),
+    e não de um contador, de modo que vários agentes podem compartilhar o mesmo modelo ao
+    mesmo tempo, como no pool de agentes. Prompts sem o formato ReAct recebem `resposta_texto`.
+
+    Cada chamada espera `latencia` segundos (mais até `variacao`) e, com as probabilidades
+    `taxa_falhas` e `taxa_mal_formatadas`, levanta FalhaSimulada ou devolve uma resposta mal
+    formatada. Em streaming, a resposta sai palavra por palavra, `latencia_por_token` segundos
+    cada. Os tokens informados no `usage_metadata` são estimados pelo tamanho do texto.
+    """
+    roteiro: List[str] = list(ROTEIRO_PADRAO)
+    resposta_texto: str = RESPOSTA_TEXTO_PADRAO
+    latencia: float = 0.0
+    variacao: float = 0.0
+    latencia_por_token: float = 0.0
+    taxa_falhas: float = 0.0
+    taxa_mal_formatadas: float = 0.0
+    semente: int = 0
+
+    # Estado interno (sorteios reprodutíveis e contadores, compartilhados entre threads)
+    _aleatorio: Any = None
+    _lock: Any = None
+    chamadas: int = 0
+    falhas: int = 0
+    mal_formatadas: int = 0
+    tempo_simulado: float = 0.0
+
+    def __init__(self, **kwargs: Any):
+        super().__init__(**kwargs)
+        self._aleatorio = random.Random(self.semente)
+        self._lock = threading.Lock()
+
+    @property
+    def _llm_type(self) -> str:
+        return "modelo-react-falso"
+
+    def _escolher_resposta(self, messages: List[BaseMessage]) -> str:
+        prompt = "\n".join(str(m.content) for m in messages)
+        if _PERGUNTA_REACT not in prompt:
+            return self.resposta_texto
+        # O rascunho do agente vem depois da pergunta: uma observação por iteração concluída
+        rascunho = prompt.rsplit(_PERGUNTA_REACT, 1)[1]
+        iteracao = len(_OBSERVACAO.findall(rascunho))
+        return self.roteiro[min(iteracao, len(self.roteiro) - 1)]
+
+    def _sortear(self):
+        """(espera, falhar, mal formatada) da próxima chamada."""
+        with self._lock:
+            self.chamadas += 1
+            espera = self.latencia + self._aleatorio.uniform(0, self.variacao)
+            falhar = self._aleatorio.random() < self.taxa_falhas
+            mal_formatada = not falhar and self._aleatorio.random() < self.taxa_mal_formatadas
+            self.falhas += falhar
+            self.mal_formatadas += mal_formatada
+            self.tempo_simulado += espera
+        return espera, falhar, mal_formatada
+
+    def _preparar(self, messages: List[BaseMessage]) -> str:
+        espera, falhar, mal_formatada = self._sortear()
+        if espera:
+            time.sleep(espera)
+        if falhar:
+            raise FalhaSimulada("Falha simulada na chamada ao LLM.")
+        return RESPOSTA_MAL_FORMATADA if mal_formatada else self._escolher_resposta(messages)
+
+    @staticmethod
+    def _uso(messages: List[BaseMessage], texto: str):
+        entrada = -(-sum(len(str(m.content)) for m in messages) // 4)
+        saida = -(-len(texto) // 4)
+        return {'input_tokens': entrada, 'output_tokens': saida, 'total_tokens': entrada + saida}
+
+    def _generate(self, messages: List[BaseMessage], stop: Optional[List[str]] = None,
+                  run_manager=None, **kwargs: Any) -> ChatResult:
+        texto = self._preparar(messages)
+        mensagem = AIMessage(content=texto, usage_metadata=self._uso(messages, texto))
+        return ChatResult(generations=[ChatGeneration(message=mensagem)])
+
+    def _stream(self, messages: List[BaseMessage], stop: Optional[List[str]] = None,
+                run_manager=None, **kwargs: Any) -> Iterator[ChatGenerationChunk]:
+        texto = self._preparar(messages)
+        partes = re.findall(r"\S+\s*|\s+", texto)
+        for i, parte in enumerate(partes):
+            if self.latencia_por_token:
+                time.sleep(self.latencia_por_token)
+                with self._lock:
+                    self.tempo_simulado += self.latencia_por_token
+            # O uso é informado uma única vez, no último pedaço (os pedaços são somados)
+            uso = self._uso(messages, texto) if i == len(partes) - 1 else None
+            pedaco = ChatGenerationChunk(message=AIMessageChunk(content=parte, usage_metadata=uso))
+            if run_manager:
+                run_manager.on_llm_new_token(parte, chunk=pedaco)
+            yield pedaco
+
+    def estatisticas(self):
+        with self._lock:
+            return {
+                'chamadas': self.chamadas,
+                'falhas': self.falhas,
+                'mal_formatadas': self.mal_formatadas,
+                'tempo_simulado': self.tempo_simulado,
+            }
@@ -0,0 +1,116 @@
+# utils/perfil.py
+
+import numpy as np
+import pandas as pd
+from utils.agregacoes import memorizar_agregacao
+from utils.cubo import DIMENSAO_DATA, DIMENSAO_UF
+from utils.roteador import COLUNA_CLIENTE, COLUNA_PRODUTO, formatar_inteiro, formatar_reais
+from utils.schema import eh_monetaria
+
+# --- PERFIL COMPACTO DO DATASET PARA OS PROMPTS DOS AGENTES ---
+# Em vez das primeiras linhas do DataFrame unificado (largo demais para o prompt), o agente
+# recebe um perfil com o papel das colunas principais, o tipo, a cardinalidade e a faixa de
+# valores (ou exemplos) de cada coluna.
+PAPEIS_COLUNAS = {
+    'chave da nota fiscal': 'chave_de_acesso',
+    'cliente (destinatário)': COLUNA_CLIENTE,
+    'produto': COLUNA_PRODUTO,
+    'quantidade': 'quantidade',
+    'valor do item (R$)': 'valor_total',
+    'valor da nota (R$)': 'valor_nota_fiscal',
+    'data de emissão': DIMENSAO_DATA,
+    'UF do destinatário': DIMENSAO_UF,
+    'CFOP': 'cfop',
+}
+
+# Colunas com até este número de valores distintos têm os mais frequentes listados.
+MAX_DISTINTOS_LISTADOS = 30
+EXEMPLOS_POR_COLUNA = 3
+TAMANHO_MAXIMO_EXEMPLO = 50
+
+
+def _descrever_tipo(serie, monetaria):
+    if monetaria:
+        return "decimal (R$)"
+    if isinstance(serie.dtype, pd.CategoricalDtype):
+        return "categoria"
+    if pd.api.types.is_datetime64_any_dtype(serie.dtype):
+        return "data"
+    if pd.api.types.is_integer_dtype(serie.dtype):
+        return "inteiro"
+    if pd.api.types.is_float_dtype(serie.dtype):
+        return "decimal"
+    return "texto"
+
+
+def _formatar_valor(valor, monetaria):
+    if monetaria:
+        return formatar_reais(valor / 100)
+    if isinstance(valor, pd.Timestamp):
+        return valor.strftime('%d/%m/%Y')
+    if isinstance(valor, (float, np.floating)):
+        return f"{valor:.4g}"
+    texto = str(valor)
+    return texto if len(texto) <= TAMANHO_MAXIMO_EXEMPLO else texto[:TAMANHO_MAXIMO_EXEMPLO] + "…"
+
+
+def _descrever_valores(serie, monetaria, distintos):
+    """Faixa (colunas numéricas e datas) ou exemplos de valores da coluna."""
+    validos = serie.dropna()
+    if validos.empty:
+        return "sem valores"
+    numerica = pd.api.types.is_numeric_dtype(serie.dtype) and not isinstance(serie.dtype, pd.CategoricalDtype)
+    if (numerica or pd.api.types.is_datetime64_any_dtype(serie.dtype)) and distintos > MAX_DISTINTOS_LISTADOS:
+        return f"de {_formatar_valor(validos.min(), monetaria)} a {_formatar_valor(validos.max(), monetaria)}"
+    if distintos <= MAX_DISTINTOS_LISTADOS:
+        frequentes = validos.value_counts().head(EXEMPLOS_POR_COLUNA).index
+        return "mais frequentes: " + ", ".join(_formatar_valor(v, monetaria) for v in frequentes)
+    return "ex.: " + ", ".join(_formatar_valor(v, monetaria) for v in validos.head(EXEMPLOS_POR_COLUNA))
+
+
+@memorizar_agregacao
+def perfil_dataset(dataset):
+    """
+    Texto com o perfil semântico do DataFrame unificado (`dataset.df`), calculado sobre as
+    tabelas de cabeçalho e itens, sem montar a junção.
+    """
+    linhas = [
+        f"O DataFrame `df` tem {formatar_inteiro(len(dataset))} linhas, uma por item de nota fiscal, "
+        f"de {formatar_inteiro(dataset.num_notas)} notas fiscais. Valores monetários estão em reais.",
+        "Colunas principais:",
+    ]
+    linhas += [f"- {papel}: `{nome}`" for papel, nome in PAPEIS_COLUNAS.items() if nome in dataset.colunas]
+    linhas.append("Todas as colunas (tipo | valores distintos | faixa ou exemplos):")
+    # Colunas repetidas pela junção (ex.: `modelo_y`, igual a `modelo_x`) são listadas uma vez só.
+    primeiras, repetidas = {}, []
+    for nome in dataset.colunas:
+        tabela, col = dataset._origem[nome]
+        if (tabela, col) in primeiras:
+            repetidas.append(f"`{nome}` = `{primeiras[(tabela, col)]}`")
+            continue
+        primeiras[(tabela, col)] = nome
+        serie = dataset.cabecalho[col] if tabela == 'cabecalho' else dataset.itens[col]
+        monetaria = eh_monetaria(col)
+        distintos = serie.nunique()
+        linhas.append(
+            f"- `{nome}`: {_descrever_tipo(serie, monetaria)} | {formatar_inteiro(distintos)} | "
+            f"{_descrever_valores(serie, monetaria, distintos)}"
+        )
+    if repetidas:
+        linhas.append("Colunas com o mesmo conteúdo de outra: " + ", ".join(repetidas) + ".")
+    return "\n".join(linhas)
+
+
+def montar_prefixo(dataset, instrucoes=None):
+    """
+    Prefixo do agente pandas: as instruções do papel (opcionais) e o perfil do dataset, no
+    lugar do `df.head()` que o agente incluiria no prompt.
+    """
+    partes = [instrucoes] if instrucoes else []
+    partes.append(perfil_dataset(dataset))
+    partes.append(
+        "Você está trabalhando com o DataFrame pandas `df` descrito acima, em Python. "
+        "Use os nomes de colunas exatamente como listados. Use as ferramentas abaixo para responder à pergunta:"
+    )
+    # As chaves são escapadas porque o prefixo vira um template de prompt.
+    return "\n\n".join(partes).replace("{", "{{").replace("}", "}}")
@@ -3,124 +3,253 @@
 import pandas as pd
 import zipfile
 import io
+import os
+import csv
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, as_completed
 import unicodedata
-from docx import Document
-from docx.shared import Inches, Pt
-from docx.enum.text import WD_ALIGN_PARAGRAPH
-from datetime import datetime
-import streamlit as st
-
-# As funções de processamento de dados permanecem as mesmas
-@st.cache_data 
-def processar_zip(arquivo_zip):
-    try:
-        with zipfile.ZipFile(arquivo_zip, 'r') as z:
-            nome_cabecalho = [nome for nome in z.namelist() if 'Cabecalho.csv' in nome][0]
-            nome_itens = [nome for nome in z.namelist() if 'Itens.csv' in nome][0]
-            with z.open(nome_cabecalho) as f:
-                df_cabecalho = pd.read_csv(f, sep=',', decimal='.', encoding='utf-8')
-            with z.open(nome_itens) as f:
-                df_itens = pd.read_csv(f, sep=',', decimal='.', encoding='utf-8')
-            
-            df_cabecalho = limpar_nomes_colunas(df_cabecalho)
-            df_itens = limpar_nomes_colunas(df_itens)
-            df_completo = pd.merge(df_cabecalho, df_itens, on='chave_de_acesso', how='inner')
-            
-            for col in df_completo.columns:
-                if 'data' in col:
-                    df_completo[col] = pd.to_datetime(df_completo[col], errors='coerce')
-            return df_completo
-    except Exception as e:
-        raise e
+import pyarrow as pa
+import pyarrow.csv as pacsv
+from utils.cache import cache_datasets, calcular_hash_arquivo
+from utils.dataset import DatasetNFe
+from utils.schema import tipo_arrow, aplicar_schema, concatenar_lotes
+
+# --- CONFIGURAÇÃO DA INGESTÃO ---
+# Teto de memória (em MB) para o DataFrame montado durante a leitura do ZIP.
+# Pode ser ajustado pela variável de ambiente NFE_LIMITE_MEMORIA_MB.
+LIMITE_MEMORIA_MB = int(os.environ.get("NFE_LIMITE_MEMORIA_MB", "4096"))
+# Tamanho de cada bloco lido pelo leitor CSV do Arrow (em bytes).
+TAMANHO_BLOCO_CSV = int(os.environ.get("NFE_TAMANHO_BLOCO_CSV", str(16 * 1024 * 1024)))
+# Número máximo de processos usados para ler vários ZIPs ao mesmo tempo.
+MAX_PROCESSOS_INGESTAO = int(os.environ.get("NFE_PROCESSOS_INGESTAO", str(os.cpu_count() or 1)))
+COLUNAS_OBRIGATORIAS = ['chave_de_acesso']
+
+
+def _normalizar_nome_coluna(col):
+    col = ''.join(c for c in unicodedata.normalize('NFD', col) if unicodedata.category(c) != 'Mn')
+    col = col.lower().strip().replace(' ', '_').replace('/', '_').replace('-', '_')
+    col = col.replace('(', '').replace(')', '').replace('.', '')
+    return col
+
+def _ler_cabecalho_csv(z, nome_membro):
+    """Lê apenas a primeira linha do CSV para conhecer os nomes originais das colunas."""
+    with z.open(nome_membro) as f:
+        primeira_linha = f.readline().decode('utf-8-sig')
+    return next(csv.reader([primeira_linha]))
+
+def _ler_csv_em_lotes(z, nome_membro, ignorar=(), tamanho_bloco=TAMANHO_BLOCO_CSV):
+    """
+    Lê um CSV de dentro do ZIP em blocos com o leitor colunar do Arrow, validando o esquema
+    a cada bloco. As colunas em `ignorar` (nomes já normalizados) não são convertidas.
+    Gera tuplas (DataFrame do bloco, fração do arquivo já lida).
+    """
+    colunas_originais = _ler_cabecalho_csv(z, nome_membro)
+    colunas_limpas = [_normalizar_nome_coluna(c) for c in colunas_originais]
+    faltantes = [c for c in COLUNAS_OBRIGATORIAS if c not in colunas_limpas]
+    if faltantes:
+        raise ValueError(f"O arquivo '{nome_membro}' não possui as colunas obrigatórias: {faltantes}")
+
+    selecionadas = [(original, limpa) for original, limpa in zip(colunas_originais, colunas_limpas)
+                    if limpa not in ignorar]
+    # Todas as colunas têm o tipo declarado no esquema de NF-e (utils/schema.py): nada é
+    # inferido a partir do primeiro bloco.
+    tipos_declarados = {original: tipo_arrow(limpa) for original, limpa in selecionadas}
+    tamanho_total = z.getinfo(nome_membro).file_size or 1
+
+    with z.open(nome_membro) as f:
+        leitor = pacsv.open_csv(
+            f,
+            read_options=pacsv.ReadOptions(block_size=tamanho_bloco, encoding='utf-8'),
+            parse_options=pacsv.ParseOptions(delimiter=','),
+            convert_options=pacsv.ConvertOptions(
+                column_types=tipos_declarados,
+                include_columns=[original for original, _ in selecionadas],
+            ),
+        )
+        esquema = leitor.schema
+        num_bloco = 0
+        while True:
+            try:
+                lote = leitor.read_next_batch()
+            except StopIteration:
+                break
+            except pa.ArrowInvalid as e:
+                raise ValueError(f"Esquema inconsistente em '{nome_membro}' (bloco {num_bloco + 1}): {e}") from e
+            if not lote.schema.equals(esquema):
+                raise ValueError(f"O bloco {num_bloco + 1} de '{nome_membro}' não segue o esquema do início do arquivo.")
+            num_bloco += 1
+            df_lote = lote.to_pandas()
+            df_lote.columns = [limpa for _, limpa in selecionadas]
+            df_lote = aplicar_schema(df_lote)
+            try:
+                fracao = min(f.tell() / tamanho_total, 1.0)
+            except (OSError, ValueError):
+                fracao = 0.0
+            yield df_lote, fracao
+
+def processar_zip(arquivo_zip, limite_memoria_mb=LIMITE_MEMORIA_MB, progresso=None, usar_cache=True, hash_conteudo=None):
+    """
+    Lê o ZIP exportado (Cabecalho.csv + Itens.csv) e devolve um DatasetNFe, com o cabeçalho
+    e os itens em tabelas separadas.
+
+    O resultado fica num cache persistente em disco, endereçado pelo hash do conteúdo do ZIP:
+    reenviar o mesmo arquivo (mesmo após reiniciar a aplicação) apenas reabre o dataset já
+    processado. `progresso`, se informado, recebe (fração concluída, mensagem) a cada etapa.
+    `hash_conteudo` pode ser informado quando já calculado, para não ler o arquivo de novo.
+    Levanta MemoryError se os dados lidos ultrapassarem `limite_memoria_mb`.
+    """
+    def informar(fracao, mensagem):
+        if progresso is not None:
+            progresso(fracao, mensagem)
+
+    informar(0.0, "Verificando o conteúdo do arquivo...")
+    if hash_conteudo is None:
+        hash_conteudo = calcular_hash_arquivo(arquivo_zip)
+    if usar_cache:
+        tabelas = cache_datasets.obter(hash_conteudo)
+        if tabelas is not None:
+            informar(1.0, "Dados recuperados do cache.")
+            return DatasetNFe.do_cache(tabelas, hash_conteudo)
+
+    df_cabecalho, df_itens, compartilhadas = _ler_tabelas(arquivo_zip, limite_memoria_mb, informar)
+    dataset = DatasetNFe(df_cabecalho, df_itens, hash_conteudo=hash_conteudo, compartilhadas=compartilhadas)
+    informar(0.97, "Pré-calculando os agregados do dashboard...")
+    dataset.cubo
+    if usar_cache:
+        cache_datasets.gravar(hash_conteudo, dataset.tabelas_para_cache())
+    informar(1.0, "Dados carregados.")
+    return dataset
+
+def processar_zips(arquivos_zip, dataset_existente=None, limite_memoria_mb=LIMITE_MEMORIA_MB,
+                   progresso=None, max_processos=MAX_PROCESSOS_INGESTAO):
+    """
+    Carrega vários ZIPs e os anexa a `dataset_existente` (se houver), sem reprocessar o que já
+    está carregado. Arquivos já presentes no dataset (pelo hash do conteúdo) são ignorados,
+    arquivos no cache em disco são apenas reabertos e os demais são processados em paralelo
+    num pool de processos. As notas são deduplicadas pela chave de acesso ao anexar.
+    """
+    def informar(fracao, mensagem):
+        if progresso is not None:
+            progresso(fracao, mensagem)
+
+    carregados = set(dataset_existente.hashes_arquivos) if dataset_existente is not None else set()
+    pendentes = {}
+    for arquivo in arquivos_zip:
+        hash_conteudo = calcular_hash_arquivo(arquivo)
+        if hash_conteudo not in carregados and hash_conteudo not in pendentes:
+            pendentes[hash_conteudo] = arquivo
+    if not pendentes:
+        return dataset_existente
+
+    particoes = {}
+    a_processar = {}
+    for hash_conteudo, arquivo in pendentes.items():
+        tabelas = cache_datasets.obter(hash_conteudo)
+        if tabelas is not None:
+            particoes[hash_conteudo] = DatasetNFe.do_cache(tabelas, hash_conteudo)
+        else:
+            a_processar[hash_conteudo] = arquivo
+
+    total = len(pendentes)
+    informar(len(particoes) / total, f"{len(particoes)} de {total} arquivo(s) recuperado(s) do cache.")
+    if len(a_processar) == 1:
+        # Um único arquivo é processado no próprio processo, com progresso detalhado.
+        (hash_conteudo, arquivo), = a_processar.items()
+        inicio = len(particoes) / total
+        particoes[hash_conteudo] = processar_zip(
+            arquivo, limite_memoria_mb,
+            progresso=lambda fracao, mensagem: informar(inicio + fracao / total, mensagem),
+            hash_conteudo=hash_conteudo,
+        )
+    elif a_processar:
+        contexto = multiprocessing.get_context('spawn')
+        num_processos = max(1, min(max_processos, len(a_processar)))
+        with ProcessPoolExecutor(max_workers=num_processos, mp_context=contexto) as pool:
+            futuros = {
+                pool.submit(_processar_zip_em_subprocesso, _conteudo_para_subprocesso(arquivo),
+                            limite_memoria_mb, hash_conteudo): hash_conteudo
+                for hash_conteudo, arquivo in a_processar.items()
+            }
+            for futuro in as_completed(futuros):
+                hash_conteudo = futuros[futuro]
+                dataset = futuro.result()
+                if dataset is None:
+                    # O subprocesso gravou o resultado no cache: reabrimos via memory-map, sem cópia.
+                    dataset = DatasetNFe.do_cache(cache_datasets.obter(hash_conteudo), hash_conteudo)
+                particoes[hash_conteudo] = dataset
+                informar(len(particoes) / total, f"{len(particoes)} de {total} arquivo(s) processado(s)...")
+
+    # Anexa as partições na ordem em que os arquivos foram enviados.
+    dataset = dataset_existente
+    for hash_conteudo in pendentes:
+        dataset = particoes[hash_conteudo] if dataset is None else dataset.anexar(particoes[hash_conteudo])
+    informar(1.0, "Dados carregados.")
+    return dataset
+
+def _conteudo_para_subprocesso(arquivo):
+    """Caminhos são enviados como estão; arquivos em memória (ex.: UploadedFile) como bytes."""
+    if isinstance(arquivo, (str, os.PathLike)):
+        return arquivo
+    posicao = arquivo.tell()
+    arquivo.seek(0)
+    conteudo = arquivo.read()
+    arquivo.seek(posicao)
+    return conteudo
+
+def _processar_zip_em_subprocesso(conteudo, limite_memoria_mb, hash_conteudo):
+    """
+    Executado no pool de processos. Quando o dataset fica gravado no cache em disco, devolve
+    None e o processo principal o reabre de lá; caso contrário, devolve o próprio dataset.
+    """
+    arquivo = io.BytesIO(conteudo) if isinstance(conteudo, bytes) else conteudo
+    dataset = processar_zip(arquivo, limite_memoria_mb, hash_conteudo=hash_conteudo)
+    if cache_datasets.obter(hash_conteudo) is not None:
+        return None
+    return dataset
+
+def _ler_tabelas(arquivo_zip, limite_memoria_mb, informar):
+    """
+    Lê o cabeçalho e os itens do ZIP em blocos. As colunas dos itens que repetem o cabeçalho
+    (UF, data de emissão, emitente...) nem chegam a ser convertidas pelo leitor.
+    Retorna (cabeçalho, itens, nomes das colunas repetidas).
+    """
+    limite_bytes = limite_memoria_mb * 1024 * 1024
+    with zipfile.ZipFile(arquivo_zip, 'r') as z:
+        nome_cabecalho = [nome for nome in z.namelist() if 'Cabecalho.csv' in nome][0]
+        nome_itens = [nome for nome in z.namelist() if 'Itens.csv' in nome][0]
+
+        informar(0.0, "Lendo o cabeçalho das notas fiscais...")
+        blocos_cabecalho = [df_lote for df_lote, _ in _ler_csv_em_lotes(z, nome_cabecalho)]
+        if not blocos_cabecalho:
+            raise ValueError(f"O arquivo '{nome_cabecalho}' não contém notas fiscais.")
+        df_cabecalho = concatenar_lotes(blocos_cabecalho)
+        del blocos_cabecalho
+
+        colunas_itens = [_normalizar_nome_coluna(c) for c in _ler_cabecalho_csv(z, nome_itens)]
+        compartilhadas = [c for c in colunas_itens if c in df_cabecalho.columns and c != 'chave_de_acesso']
+
+        blocos_itens = []
+        memoria_usada = df_cabecalho.memory_usage(deep=True).sum()
+        for df_lote, fracao in _ler_csv_em_lotes(z, nome_itens, ignorar=compartilhadas):
+            memoria_usada += df_lote.memory_usage(deep=True).sum()
+            if memoria_usada > limite_bytes:
+                raise MemoryError(
+                    f"Os dados excedem o limite de memória configurado ({limite_memoria_mb} MB). "
+                    "Ajuste NFE_LIMITE_MEMORIA_MB ou divida o arquivo."
+                )
+            blocos_itens.append(df_lote)
+            informar(0.05 + 0.85 * fracao, f"Processando itens... {fracao:.0%} do arquivo lido")
+
+        informar(0.95, "Consolidando os dados...")
+        if blocos_itens:
+            df_itens = concatenar_lotes(blocos_itens)
+        else:
+            df_itens = pd.DataFrame(columns=[c for c in colunas_itens if c not in compartilhadas])
+        return df_cabecalho, df_itens, compartilhadas
 
 def limpar_nomes_colunas(df):
     cols_novas = []
     for col in df.columns:
-        col = ''.join(c for c in unicodedata.normalize('NFD', col) if unicodedata.category(c) != 'Mn')
-        col = col.lower().strip().replace(' ', '_').replace('/', '_').replace('-', '_')
-        col = col.replace('(', '').replace(')', '').replace('.', '')
-        cols_novas.append(col)
+        cols_novas.append(_normalizar_nome_coluna(col))
     df.columns = cols_novas
     return df
-
-@st.cache_data
-def criar_documento_word(report_items):
-    """
-    Gera um documento Word profissional e bem formatado.
-    """
-    document = Document()
-    
-    styles = document.styles
-    styles['Title'].font.name = 'Calibri'
-    styles['Title'].font.size = Pt(26)
-    styles['Heading 1'].font.name = 'Calibri'
-    styles['Heading 1'].font.size = Pt(16)
-    styles['Heading 2'].font.name = 'Calibri'
-    styles['Heading 2'].font.size = Pt(13)
-
-    # --- Cabeçalho do Relatório ---
-    document.add_heading('Relatório de Análise de Notas Fiscais', level=0)
-    p_data = document.add_paragraph()
-    p_data.alignment = WD_ALIGN_PARAGRAPH.CENTER
-    data_geracao = datetime.now().strftime("%d de %B de %Y, %H:%M:%S")
-    p_data.add_run(f'Relatório gerado em: {data_geracao}').italic = True
-    
-    # --- CORREÇÃO ---
-    # A linha abaixo foi removida. Ela forçava o conteúdo a começar na segunda página.
-    # document.add_page_break()
-
-    # Adiciona um parágrafo em branco para dar um espaçamento antes do primeiro item.
-    document.add_paragraph()
-
-    # --- Renderização dos Itens do Relatório ---
-    for item in report_items:
-        try:
-            titulo_item = item.get('title', 'Item de Relatório')
-            document.add_heading(titulo_item, level=2)
-            
-            content = item['content']
-            
-            if item['type'] == 'qa' or item.get('category') == 'insight_ia':
-                document.add_paragraph(f"Pergunta: {content['pergunta']}", style='Intense Quote')
-                document.add_paragraph(f"Resposta: {content['resposta']}")
-
-            elif item['type'] == 'dataframe':
-                df_item = content['dados']
-                if df_item.index.name is not None:
-                    df_item = df_item.reset_index()
-                if not df_item.empty:
-                    t = document.add_table(df_item.shape[0] + 1, df_item.shape[1], style='Table Grid')
-                    for j, col_name in enumerate(df_item.columns):
-                        cell = t.cell(0, j)
-                        cell.text = str(col_name)
-                        cell.paragraphs[0].runs[0].font.bold = True
-                    for i in range(df_item.shape[0]):
-                        for j in range(df_item.shape[1]):
-                            valor = df_item.values[i, j]
-                            texto = f"{valor:,.2f}" if isinstance(valor, (int, float)) else str(valor)
-                            t.cell(i + 1, j).text = texto
-                else:
-                    document.add_paragraph("Nenhum dado para exibir nesta análise.")
-
-            elif item['type'] == 'chart':
-                fig = content['fig']
-                fig.update_layout(template='plotly_white')
-                
-                img_buffer = io.BytesIO()
-                fig.write_image(img_buffer, format='png', width=900, height=500, scale=2)
-                img_buffer.seek(0)
-                
-                document.add_picture(img_buffer, width=Inches(6.5))
-                document.paragraphs[-1].alignment = WD_ALIGN_PARAGRAPH.CENTER
-
-            document.add_paragraph()
-
-        except Exception as e:
-            print(f"ERRO AO PROCESSAR ITEM PARA DOCX: {item.get('title', 'N/A')}. Detalhes: {e}")
-            document.add_paragraph(f"Não foi possível renderizar o item: {item.get('title', 'N/A')}", style='Body Text')
-
-    doc_buffer = io.BytesIO()
-    document.save(doc_buffer)
-    doc_buffer.seek(0)
-    
-    return doc_buffer
\ No newline at end of file
@@ -0,0 +1,177 @@
+# utils/receitas.py
+
+import json
+import os
+import re
+import threading
+import time
+import uuid
+from typing import Any
+from langchain.callbacks.base import BaseCallbackHandler
+from langchain_core.agents import AgentAction
+from langchain_experimental.tools.python.tool import sanitize_input
+from utils.roteador import normalizar_pergunta, RespostaRoteada
+from utils.sandbox import pool_sandbox
+
+# --- RECEITAS DE ANÁLISE ---
+# O código pandas que o agente executou com sucesso para responder a uma pergunta é
+# guardado como "receita". Quando a mesma pergunta é feita sobre outro dataset com as
+# colunas necessárias, a receita é executada diretamente, sem nenhuma etapa de raciocínio
+# do LLM, que apenas redige a resposta a partir do resultado; se falhar, a pergunta segue
+# para o agente normalmente.
+ARQUIVO_RECEITAS = os.environ.get("NFE_RECEITAS_ARQUIVO", os.path.join(".cache", "receitas.json"))
+MAX_RECEITAS = int(os.environ.get("NFE_RECEITAS_MAXIMO", "500"))
+
+FERRAMENTA_PYTHON = 'python_repl_ast'
+# Saída da ferramenta de Python quando o código levanta uma exceção (ex.: "KeyError: 'x'").
+_SAIDA_COM_ERRO = re.compile(r"^[A-Za-z_][\w.]*(Error|Exception|Exit|Interrupt): ")
+_LITERAL_TEXTO = re.compile(r"""['"]([^'"\n]+)['"]""")
+
+
+class ErroReceita(RuntimeError):
+    """A receita não pôde ser executada sobre o dataset."""
+
+
+class CapturaReceitaCallbackHandler(BaseCallbackHandler):
+    """Guarda, em ordem, os códigos que a ferramenta de Python executou sem erro durante uma execução do agente."""
+
+    def __init__(self):
+        super().__init__()
+        self.passos = []
+        self._pendentes = {}
+
+    def on_agent_action(self, action: AgentAction, *, run_id, **kwargs: Any) -> Any:
+        if action.tool == FERRAMENTA_PYTHON and isinstance(action.tool_input, str):
+            self._pendentes[run_id] = action.tool_input
+
+    def on_tool_end(self, output: Any, *, run_id, parent_run_id=None, **kwargs: Any) -> Any:
+        codigo = self._pendentes.pop(parent_run_id, None)
+        if codigo is not None and not _SAIDA_COM_ERRO.match(str(output)):
+            self.passos.append(sanitize_input(codigo))
+
+
+class LivroReceitas:
+    """
+    Receitas de análise por pergunta (normalizada como no roteador), gravadas em um arquivo
+    JSON. Cada receita guarda os passos de código e as colunas do DataFrame que eles citam,
+    usadas para verificar se um novo dataset é compatível antes de executá-la.
+
+    As receitas são código Python gerado pelo agente e executado sem o LLM, no mesmo sandbox
+    do agente (utils/sandbox.py), com os mesmos limites de tempo e de memória.
+    """
+
+    def __init__(self, arquivo=ARQUIVO_RECEITAS, max_receitas=MAX_RECEITAS, sandbox=pool_sandbox):
+        self.arquivo = arquivo
+        self.sandbox = sandbox
+        self.max_receitas = max_receitas
+        self._receitas = None
+        self._lock = threading.Lock()
+        self.reproduzidas = 0
+        self.falhas = 0
+
+    def _carregar(self):
+        if self._receitas is None:
+            try:
+                with open(self.arquivo, encoding='utf-8') as f:
+                    self._receitas = json.load(f)
+            except FileNotFoundError:
+                self._receitas = {}
+            except (OSError, ValueError) as e:
+                print(f"Arquivo de receitas ignorado ({self.arquivo}): {e}")
+                self._receitas = {}
+        return self._receitas
+
+    def _salvar(self):
+        os.makedirs(os.path.dirname(self.arquivo) or '.', exist_ok=True)
+        temporario = f"{self.arquivo}.{uuid.uuid4().hex}.tmp"
+        try:
+            with open(temporario, 'w', encoding='utf-8') as f:
+                json.dump(self._receitas, f, ensure_ascii=False, indent=1)
+            os.replace(temporario, self.arquivo)
+        except OSError as e:
+            # As receitas são apenas uma otimização: uma falha de gravação não deve interromper a análise.
+            print(f"Não foi possível gravar as receitas: {e}")
+            if os.path.exists(temporario):
+                os.remove(temporario)
+
+    def obter(self, pergunta):
+        with self._lock:
+            return self._carregar().get(normalizar_pergunta(pergunta))
+
+    def gravar(self, pergunta, passos, dataset):
+        """Grava os passos de código que responderam à pergunta (nada é gravado sem passos)."""
+        if not passos:
+            return
+        citados = {texto for passo in passos for texto in _LITERAL_TEXTO.findall(passo)}
+        receita = {
+            'pergunta': pergunta,
+            'passos': list(passos),
+            'colunas': sorted(citados & set(dataset.colunas)),
+            'gravada_em': time.time(),
+        }
+        with self._lock:
+            receitas = self._carregar()
+            receitas.pop(normalizar_pergunta(pergunta), None)
+            receitas[normalizar_pergunta(pergunta)] = receita
+            # As mais antigas saem primeiro (o dicionário preserva a ordem de gravação).
+            while len(receitas) > self.max_receitas:
+                receitas.pop(next(iter(receitas)))
+            self._salvar()
+
+    def executar(self, dataset, pergunta):
+        """Resultado da receita da pergunta sobre `dataset.df`, ou None se não houver receita compatível ou ela falhar."""
+        receita = self.obter(pergunta)
+        if receita is None:
+            return None
+        faltantes = set(receita['colunas']) - set(dataset.colunas)
+        if faltantes:
+            print(f"Receita ignorada para '{pergunta[:50]}': colunas ausentes {sorted(faltantes)}")
+            return None
+        # Os passos compartilham as variáveis, como na execução original do agente.
+        namespace = uuid.uuid4().hex
+        try:
+            for passo in receita['passos']:
+                ok, resultado = self.sandbox.executar(dataset, passo, namespace=namespace)
+                if not ok:
+                    raise ErroReceita(resultado)
+        except Exception as e:
+            if isinstance(e, ErroReceita) and str(e).startswith("NameError"):
+                # Os passos gravados rodaram juntos na execução original: um nome indefinido indica
+                # que o namespace se perdeu no sandbox (processo encerrado), não que a receita é ruim.
+                print(f"Receita interrompida para '{pergunta[:50]}' ({e}); usando o agente.")
+                return None
+            print(f"Receita falhou para '{pergunta[:50]}' ({e}); usando o agente.")
+            with self._lock:
+                self.falhas += 1
+                # A receita é descartada; a execução do agente que vem a seguir grava uma nova.
+                if self._carregar().pop(normalizar_pergunta(pergunta), None) is not None:
+                    self._salvar()
+            return None
+        with self._lock:
+            self.reproduzidas += 1
+        return resultado.strip() or None
+
+    def responder(self, dataset, pergunta, invocar_agente, redigir):
+        """
+        Responde pela receita da pergunta, quando houver; caso contrário chama
+        `invocar_agente(captura)`, que deve incluir o handler `captura` nos callbacks do
+        agente, e grava a receita da nova resposta.
+
+        A saída da receita é apenas o resultado do último passo de código (ex.: uma Series
+        impressa): `redigir(fatos)` transforma esses fatos (RespostaRoteada) na resposta final,
+        como as intenções do roteador que pedem redação (veja `redigir_com_llm`).
+        """
+        resultado = self.executar(dataset, pergunta)
+        if resultado is not None:
+            return redigir(RespostaRoteada(None, resultado))
+        captura = CapturaReceitaCallbackHandler()
+        resposta = invocar_agente(captura)
+        self.gravar(pergunta, captura.passos, dataset)
+        return resposta
+
+    def estatisticas(self):
+        with self._lock:
+            return {'receitas': len(self._carregar()), 'reproduzidas': self.reproduzidas, 'falhas': self.falhas}
+
+
+livro_receitas = LivroReceitas()
@@ -0,0 +1,210 @@
+# utils/regras.py
+
+import time
+from functools import cached_property
+import numpy as np
+import pandas as pd
+from utils.schema import centavos_para_reais, eh_monetaria, COLUNAS_CABECALHO, COLUNAS_ITENS, COLUNAS_UNIFICADAS
+from utils.agregacoes import memorizar_agregacao
+from utils.cfop import MAX_CFOP, classificar_cfop, eh_saida_estadual
+
+# --- MOTOR DE REGRAS FISCAIS ---
+# Cada regra é uma função registrada com o decorador `@regra`, que recebe o contexto da
+# auditoria (veja ContextoRegras) e devolve:
+#   - tipo "predicado": uma máscara booleana sobre as notas ou sobre os itens, que vira a
+#     tabela de ocorrências com as colunas declaradas na regra;
+#   - tipo "agregacao": o resultado já agregado (DataFrame ou Series), ou None.
+# Todas as regras são avaliadas juntas por `avaliar_regras`, sobre o mesmo contexto.
+REGRAS = {}
+
+class Regra:
+    def __init__(self, nome, titulo, funcao, tipo, nivel=None, requer=(), colunas=()):
+        self.nome = nome
+        self.titulo = titulo
+        self.descricao = (funcao.__doc__ or '').strip()
+        self.funcao = funcao
+        self.tipo = tipo
+        self.nivel = nivel
+        # Colunas sem as quais a regra não é avaliada, com os nomes dos CSVs de origem
+        # (`uf_emitente`), pois as regras leem as tabelas do cabeçalho e dos itens diretamente.
+        self.requer = tuple(requer)
+        # Colunas exibidas na tabela de ocorrências de um predicado, com os nomes do formato
+        # unificado (`uf_emitente_x`), que é o das tabelas mostradas e exportadas.
+        self.colunas = tuple(colunas)
+
+
+class ResultadoRegra:
+    def __init__(self, regra, resultado, segundos):
+        self.regra = regra
+        self.resultado = resultado
+        self.segundos = segundos
+
+    @property
+    def disponivel(self):
+        return self.resultado is not None
+
+    @property
+    def ocorrencias(self):
+        return len(self.resultado) if self.disponivel else 0
+
+
+def regra(nome, titulo, tipo='predicado', nivel='nota', requer=(), colunas=()):
+    """Registra uma regra de auditoria no motor (veja REGRAS)."""
+    if tipo not in ('predicado', 'agregacao'):
+        raise ValueError(f"Tipo de regra desconhecido: {tipo}")
+    if tipo == 'predicado' and nivel not in ('nota', 'item'):
+        raise ValueError(f"Nível de regra desconhecido: {nivel}")
+    desconhecidas = [col for col in requer if col not in COLUNAS_CABECALHO and col not in COLUNAS_ITENS]
+    if desconhecidas:
+        raise ValueError(f"Colunas de origem desconhecidas em `requer` da regra {nome}: {', '.join(desconhecidas)}")
+    desconhecidas = [col for col in colunas if col not in COLUNAS_UNIFICADAS]
+    if desconhecidas:
+        raise ValueError(f"Colunas do formato unificado desconhecidas em `colunas` da regra {nome}: "
+                         f"{', '.join(desconhecidas)}")
+
+    def registrar(funcao):
+        REGRAS[nome] = Regra(nome, titulo, funcao, tipo, nivel, requer, colunas)
+        return funcao
+    return registrar
+
+
+class ContextoRegras:
+    """
+    Vetores compartilhados entre as regras, calculados uma única vez por auditoria sobre as
+    tabelas colunares do dataset (cabeçalho e itens), sem montar o DataFrame unificado.
+    """
+
+    def __init__(self, dataset):
+        self.dataset = dataset
+        self.notas = dataset.cabecalho
+        self.itens = dataset.itens
+
+    def tem_colunas(self, colunas):
+        return all(col in self.notas.columns or col in self.itens.columns for col in colunas)
+
+    def item_para_nota(self, valores_nota):
+        """Leva um vetor do nível da nota para o nível do item."""
+        return np.asarray(valores_nota)[self.dataset.posicao_nota]
+
+    @cached_property
+    def soma_itens_centavos(self):
+        """Soma do valor dos itens de cada nota, em centavos."""
+        return self.dataset.somar_por_nota('valor_total', centavos=True)
+
+    @cached_property
+    def interestadual(self):
+        """Notas com UF do emitente diferente da UF do destinatário."""
+        # As colunas de UF compartilham as mesmas categorias, então a comparação é feita sobre os códigos.
+        return (self.notas['uf_emitente'] != self.notas['uf_destinatario']).to_numpy()
+
+    @cached_property
+    def cfop(self):
+        """CFOP dos itens como inteiros (veja utils/cfop.py); valores fora da tabela viram 0."""
+        cfop = self.itens['cfop'].to_numpy()
+        return np.where((cfop > 0) & (cfop < MAX_CFOP), cfop, 0).astype(np.int64)
+
+
+def _tabela_ocorrencias(contexto, regra_avaliada, mascara):
+    dataset = contexto.dataset
+    posicoes = np.flatnonzero(mascara)
+    colunas = [nome for nome in regra_avaliada.colunas if nome in dataset.colunas]
+    if regra_avaliada.nivel == 'item':
+        return dataset.juntar(colunas, posicoes=posicoes).reset_index(drop=True)
+
+    dados = pd.DataFrame({nome: dataset.coluna_nota(nome).take(posicoes).reset_index(drop=True) for nome in colunas})
+    for nome in colunas:
+        if eh_monetaria(dataset._origem[nome][1]):
+            dados[nome] = centavos_para_reais(dados[nome])
+    return dados
+
+
+def _avaliar(contexto, regra_avaliada):
+    if not contexto.tem_colunas(regra_avaliada.requer):
+        return None
+    resultado = regra_avaliada.funcao(contexto)
+    if regra_avaliada.tipo == 'predicado':
+        return _tabela_ocorrencias(contexto, regra_avaliada, resultado)
+    return resultado
+
+
+@memorizar_agregacao
+def avaliar_regras(dataset, nomes=None):
+    """
+    Avalia as regras registradas (ou apenas as de `nomes`) sobre um mesmo contexto e devolve
+    {nome: ResultadoRegra}, com o tempo de cada regra. O custo de um vetor compartilhado entra
+    no tempo da primeira regra que o utiliza.
+    """
+    contexto = ContextoRegras(dataset)
+    resultados = {}
+    for nome in (nomes or REGRAS):
+        regra_avaliada = REGRAS[nome]
+        inicio = time.perf_counter()
+        resultado = _avaliar(contexto, regra_avaliada)
+        resultados[nome] = ResultadoRegra(regra_avaliada, resultado, time.perf_counter() - inicio)
+    return resultados
+
+
+# --- REGRAS EMBUTIDAS ---
+@regra('consistencia_valores', "Consistência de Valores (Total da Nota vs. Soma dos Itens)", tipo='agregacao',
+       requer=('chave_de_acesso', 'valor_nota_fiscal', 'valor_total'))
+def consistencia_valores(contexto):
+    """Notas cujo valor declarado difere da soma dos itens em mais de um centavo."""
+    notas = contexto.notas
+    # A comparação é feita em centavos inteiros, sem erro de arredondamento.
+    check_df = pd.DataFrame({
+        'chave_de_acesso': notas['chave_de_acesso'],
+        'valor_declarado_nota': notas['valor_nota_fiscal'],
+        'soma_calculada_itens': contexto.soma_itens_centavos,
+    }).drop_duplicates(subset='chave_de_acesso')
+    check_df['diferenca'] = check_df['valor_declarado_nota'] - check_df['soma_calculada_itens']
+    check_df = check_df[check_df['diferenca'].abs() > 1].reset_index(drop=True)
+    for col in ['valor_declarado_nota', 'soma_calculada_itens', 'diferenca']:
+        check_df[col] = centavos_para_reais(check_df[col])
+    return check_df
+
+@regra('operacoes_geo', "Análise de Operações (Internas vs. Interestaduais)", tipo='agregacao',
+       requer=('uf_emitente', 'uf_destinatario', 'valor_total'))
+def operacoes_geo(contexto):
+    """Valor das notas internas e interestaduais."""
+    tipo_de_operacao = np.where(contexto.interestadual, 'Interestadual', 'Interna')
+    valores = centavos_para_reais(contexto.soma_itens_centavos)
+    return valores.groupby(tipo_de_operacao).sum().rename_axis('tipo_de_operacao').rename('valor_total')
+
+@regra('cfop', "Análise por Tipo de Operação (CFOP)", tipo='agregacao', requer=('cfop', 'valor_total'))
+def analise_cfop(contexto):
+    """Top 15 CFOPs por valor total dos itens."""
+    # O próprio CFOP é o índice do bincount: uma única passada pelos itens.
+    valores = contexto.itens['valor_total'].to_numpy(dtype=np.float64, na_value=0.0)
+    somas = np.bincount(contexto.cfop, weights=valores, minlength=MAX_CFOP)
+    contagens = np.bincount(contexto.cfop, minlength=MAX_CFOP)
+    presentes = np.flatnonzero(contagens)
+    cfop_analysis = pd.DataFrame(
+        {'Valor Total': somas[presentes].round() / 100, 'Qtd. de Itens': contagens[presentes]},
+        index=pd.Index(presentes, name='cfop'),
+    ).sort_values(by='Valor Total', ascending=False).head(15)
+    classificacao = classificar_cfop(cfop_analysis.index.to_numpy())
+    cfop_analysis['descricao'] = classificacao['descricao'].astype(str).to_numpy()
+    cfop_analysis['label_grafico'] = cfop_analysis.index.astype(str) + ' - ' + cfop_analysis['descricao']
+    cfop_analysis['categoria'] = classificacao['categoria'].astype(str).to_numpy()
+    return cfop_analysis
+
+@regra('chaves_duplicadas', "Chaves de Acesso Duplicadas", nivel='nota',
+       requer=('chave_de_acesso',),
+       colunas=('chave_de_acesso', 'numero_x', 'razao_social_emitente_x', 'data_emissao_x'))
+def chaves_duplicadas(contexto):
+    """Notas cuja chave de acesso aparece mais de uma vez no arquivo de cabeçalho."""
+    return contexto.notas['chave_de_acesso'].duplicated(keep=False).to_numpy()
+
+@regra('cfop_interno_interestadual', "CFOP Interno (5xxx) em Operação Interestadual", nivel='item',
+       requer=('cfop', 'uf_emitente', 'uf_destinatario'),
+       colunas=('chave_de_acesso', 'cfop', 'uf_emitente_x', 'uf_destinatario_x', 'descricao_do_produto_servico', 'valor_total'))
+def cfop_interno_interestadual(contexto):
+    """Itens com CFOP de saída dentro do estado (5xxx) em notas com UFs de emitente e destinatário diferentes."""
+    return eh_saida_estadual(contexto.cfop) & contexto.item_para_nota(contexto.interestadual)
+
+@regra('itens_valor_nao_positivo', "Itens com Valor Zerado ou Negativo", nivel='item',
+       requer=('valor_total',),
+       colunas=('chave_de_acesso', 'numero_produto', 'descricao_do_produto_servico', 'quantidade', 'valor_unitario', 'valor_total'))
+def itens_valor_nao_positivo(contexto):
+    """Itens cujo valor total é zero ou negativo."""
+    return (contexto.itens['valor_total'] <= 0).to_numpy(dtype=bool, na_value=False)
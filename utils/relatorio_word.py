@@ -0,0 +1,310 @@
+# utils/relatorio_word.py
+
+import hashlib
+import io
+import json
+import os
+import re
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+import pandas as pd
+from docx import Document
+from docx.oxml.ns import qn
+from docx.shared import Inches, Pt
+from docx.enum.text import WD_ALIGN_PARAGRAPH
+from lxml import etree
+from utils.graficos import servico_graficos
+from utils.tabelas_word import adicionar_tabela_limitada, adicionar_apendices, reservar_xml, salvar_documento
+
+# --- RELATÓRIO WORD MONTADO POR FRAGMENTOS ---
+# Cada item fixado no relatório é renderizado uma única vez, assim que é fixado, em um
+# fragmento: o XML dos seus parágrafos e tabelas, as imagens dos gráficos e os apêndices. A
+# exportação apenas concatena os fragmentos no documento final, de modo que adicionar, remover
+# ou reordenar um item custa apenas o trabalho daquele item, e não a renderização do relatório
+# inteiro. Os fragmentos são identificados pelo conteúdo do item (`assinatura`) e ficam em
+# memória, os usados há mais tempo descartados primeiro; um fragmento descartado é renderizado
+# de novo na exportação.
+MAX_FRAGMENTOS = int(os.environ.get("NFE_RELATORIO_FRAGMENTOS", "128"))
+
+# Marcadores deixados no XML dos fragmentos e resolvidos na montagem do documento final.
+_IMAGEM = re.compile(r'r:embed="(rId\d+)"')
+_DESENHO = re.compile(r'<wp:docPr id="\d+"')
+_MARCADOR_IMAGEM = re.compile(r'@@imagem-(\d+)@@')
+_MARCADOR_APENDICE = re.compile(r'@@apendice-(\d+)@@')
+_MARCADOR_DESENHO = '<wp:docPr id="@@desenho@@"'
+_MARCADORES_DESENHO = re.compile(re.escape(_MARCADOR_DESENHO))
+# Declarações de namespace herdadas da raiz do documento, que o documento final também declara.
+_DECLARACAO = re.compile(r' xmlns:\w+="[^"]*"')
+_TABELA = re.compile(r'@@tabela-([0-9a-f]{32})@@')
+
+
+def assinatura(item):
+    """Hash do conteúdo do item: itens iguais têm a mesma assinatura e compartilham o fragmento."""
+    h = hashlib.sha256()
+    h.update(json.dumps([item.get('type'), item.get('category'), item.get('title')], default=str).encode('utf-8'))
+    for chave, valor in sorted(item.get('content', {}).items()):
+        h.update(chave.encode('utf-8'))
+        if isinstance(valor, (pd.DataFrame, pd.Series)):
+            nomes = list(valor.columns) if isinstance(valor, pd.DataFrame) else [valor.name]
+            h.update(json.dumps([nomes, list(valor.index.names), valor.shape], default=str).encode('utf-8'))
+            h.update(pd.util.hash_pandas_object(valor, index=True).values.tobytes())
+        elif hasattr(valor, 'to_plotly_json'):
+            # Figura do Plotly
+            h.update(valor.to_json().encode('utf-8'))
+        else:
+            h.update(json.dumps(valor, default=str, sort_keys=True).encode('utf-8'))
+    return h.hexdigest()
+
+
+class FragmentoRelatorio:
+    """
+    Um item do relatório já renderizado: `xml` do corpo e `apendices` (XML de cada apêndice),
+    com marcadores no lugar das imagens (`imagens`, PNG), dos números dos apêndices e dos
+    identificadores dos desenhos, que só são conhecidos na montagem do documento final.
+    """
+
+    def __init__(self, xml, imagens, apendices, falhou=False):
+        self.xml = xml
+        self.imagens = imagens
+        self.apendices = apendices
+        # Fragmentos com erro não são guardados: o item é renderizado de novo na próxima exportação.
+        self.falhou = falhou
+
+
+def _serializar(elementos, tabelas):
+    """XML dos elementos do corpo do rascunho, com as tabelas reservadas já no lugar dos marcadores."""
+    partes = []
+    for elemento in elementos:
+        if elemento.tag == qn('w:p'):
+            marcador = _TABELA.fullmatch(''.join(elemento.xpath('./w:r/w:t/text()')))
+            if marcador:
+                partes.append(tabelas[marcador.group(1)])
+                continue
+        xml = etree.tostring(elemento, encoding='unicode')
+        abertura = xml.index('>')
+        partes.append(_DECLARACAO.sub('', xml[:abertura]) + xml[abertura:])
+    return _DESENHO.sub(_MARCADOR_DESENHO, ''.join(partes))
+
+
+def _adicionar_conteudo(document, item, tabelas, apendices):
+    titulo_item = item.get('title', 'Item de Relatório')
+    document.add_heading(titulo_item, level=2)
+
+    content = item['content']
+
+    if item['type'] == 'qa' or item.get('category') == 'insight_ia':
+        document.add_paragraph(f"Pergunta: {content['pergunta']}", style='Intense Quote')
+        document.add_paragraph(f"Resposta: {content['resposta']}")
+
+    elif item['type'] == 'summary':
+        document.add_paragraph(content['texto'])
+
+    elif item['type'] == 'dataframe':
+        df_item = content['dados']
+        if df_item.index.name is not None:
+            df_item = df_item.reset_index()
+        if not df_item.empty:
+            # Tabelas grandes: só as primeiras linhas no corpo, o restante nos apêndices
+            adicionar_tabela_limitada(document, df_item, titulo_item, tabelas, apendices,
+                                      rotulo_apendice="@@apendice-0@@")
+        else:
+            document.add_paragraph("Nenhum dado para exibir nesta análise.")
+
+    elif item['type'] == 'chart':
+        imagem = servico_graficos.rasterizar([content['fig']])[0]
+        if isinstance(imagem, Exception):
+            raise imagem
+        document.add_picture(io.BytesIO(imagem), width=Inches(6.5))
+        document.paragraphs[-1].alignment = WD_ALIGN_PARAGRAPH.CENTER
+
+    document.add_paragraph()
+
+
+def renderizar_fragmento(item):
+    """Renderiza o item em um documento de rascunho e extrai dele o fragmento."""
+    document = Document()
+    corpo = document.element.body
+    # O corpo do rascunho começa apenas com as propriedades da seção, que ficam de fora
+    inicio = len(corpo) - 1
+    tabelas, apendices = {}, []
+    falhou = False
+    try:
+        _adicionar_conteudo(document, item, tabelas, apendices)
+    except Exception as e:
+        print(f"ERRO AO PROCESSAR ITEM PARA DOCX: {item.get('title', 'N/A')}. Detalhes: {e}")
+        for elemento in list(corpo)[inicio:-1]:
+            corpo.remove(elemento)
+        tabelas, apendices = {}, []
+        document.add_paragraph(f"Não foi possível renderizar o item: {item.get('title', 'N/A')}", style='Body Text')
+        falhou = True
+    fim = len(corpo) - 1
+
+    # Cada apêndice do item é serializado à parte, para ser numerado e levado ao final do documento
+    limites = []
+    for numero, apendice in enumerate(apendices):
+        antes = len(corpo) - 1
+        adicionar_apendices(document, tabelas, [apendice], rotulos=[f"@@apendice-{numero}@@"])
+        limites.append((antes, len(corpo) - 1))
+
+    elementos = list(corpo)
+    xml = _serializar(elementos[inicio:fim], tabelas)
+    xml_apendices = [_serializar(elementos[a:b], tabelas) for a, b in limites]
+
+    # As imagens saem do rascunho e recebem um marcador no lugar da relação com o documento
+    imagens, relacoes = [], {}
+
+    def trocar_imagem(correspondencia):
+        relacao = correspondencia.group(1)
+        if relacao not in relacoes:
+            relacoes[relacao] = len(imagens)
+            imagens.append(document.part.related_parts[relacao].blob)
+        return f'r:embed="@@imagem-{relacoes[relacao]}@@"'
+
+    xml = _IMAGEM.sub(trocar_imagem, xml)
+    return FragmentoRelatorio(xml, imagens, xml_apendices, falhou)
+
+
+def _novo_documento():
+    document = Document()
+
+    styles = document.styles
+    styles['Title'].font.name = 'Calibri'
+    styles['Title'].font.size = Pt(26)
+    styles['Heading 1'].font.name = 'Calibri'
+    styles['Heading 1'].font.size = Pt(16)
+    styles['Heading 2'].font.name = 'Calibri'
+    styles['Heading 2'].font.size = Pt(13)
+
+    # --- Cabeçalho do Relatório ---
+    document.add_heading('Relatório de Análise de Notas Fiscais', level=0)
+    p_data = document.add_paragraph()
+    p_data.alignment = WD_ALIGN_PARAGRAPH.CENTER
+    data_geracao = datetime.now().strftime("%d de %B de %Y, %H:%M:%S")
+    p_data.add_run(f'Relatório gerado em: {data_geracao}').italic = True
+
+    # Adiciona um parágrafo em branco para dar um espaçamento antes do primeiro item.
+    document.add_paragraph()
+    return document
+
+
+def montar_documento(fragmentos):
+    """Documento Word (BytesIO) com o cabeçalho do relatório e os fragmentos, na ordem recebida."""
+    document = _novo_documento()
+    xmls = {}
+    apendices = []
+    # Cada desenho (imagem) do documento precisa de um identificador único
+    desenhos = iter(range(1, 1 << 31))
+
+    for fragmento in fragmentos:
+        # As imagens entram no pacote do documento final; iguais são gravadas uma única vez
+        relacoes = [document.part.get_or_add_image(io.BytesIO(imagem))[0] for imagem in fragmento.imagens]
+        primeiro_apendice = len(apendices) + 1
+        apendices += fragmento.apendices
+        xml = _MARCADOR_IMAGEM.sub(lambda m: relacoes[int(m.group(1))], fragmento.xml)
+        xml = _MARCADOR_APENDICE.sub(lambda m: str(primeiro_apendice + int(m.group(1))), xml)
+        xml = _MARCADORES_DESENHO.sub(lambda m: f'<wp:docPr id="{next(desenhos)}"', xml)
+        reservar_xml(document, xml, xmls)
+
+    for numero, xml in enumerate(apendices, start=1):
+        reservar_xml(document, _MARCADOR_APENDICE.sub(str(numero), xml), xmls)
+
+    # O XML dos fragmentos entra no documento ao salvar
+    return salvar_documento(document, xmls)
+
+
+class MontadorRelatorio:
+    """
+    Guarda os fragmentos dos itens do relatório e monta o documento a partir deles.
+
+    `preparar` é chamado quando o item é fixado: identifica o item pela assinatura do seu
+    conteúdo (em `item['id']`) e começa a renderizar o fragmento em segundo plano. `documento`
+    espera os fragmentos que ainda estão sendo renderizados, renderiza os que faltam e monta o
+    relatório; o último documento montado é reaproveitado enquanto os itens não mudam.
+    """
+
+    def __init__(self, max_fragmentos=MAX_FRAGMENTOS, threads=2):
+        self.max_fragmentos = max(1, max_fragmentos)
+        self._fragmentos = OrderedDict()
+        self._executor = ThreadPoolExecutor(max_workers=threads, thread_name_prefix="fragmentos-relatorio")
+        self._lock = threading.Lock()
+        self._ultimo = (None, None)
+        self.renderizados = 0
+        self.reaproveitados = 0
+        self.montagens = 0
+
+    def _renderizar(self, item):
+        fragmento = renderizar_fragmento(item)
+        with self._lock:
+            self.renderizados += 1
+        return fragmento
+
+    def preparar(self, item):
+        """Identifica o item e agenda a renderização do seu fragmento; devolve o próprio item."""
+        item['id'] = assinatura(item)
+        with self._lock:
+            if item['id'] in self._fragmentos:
+                self._fragmentos.move_to_end(item['id'])
+                return item
+            self._fragmentos[item['id']] = self._executor.submit(self._renderizar, item)
+            while len(self._fragmentos) > self.max_fragmentos:
+                self._fragmentos.popitem(last=False)
+        return item
+
+    def contem(self, itens, item):
+        """Se um item com o mesmo conteúdo de `item` (já preparado) está em `itens`."""
+        return any(outro.get('id') == item['id'] for outro in itens)
+
+    def fragmento(self, item):
+        if 'id' not in item:
+            self.preparar(item)
+        with self._lock:
+            futuro = self._fragmentos.get(item['id'])
+            if futuro is not None:
+                self._fragmentos.move_to_end(item['id'])
+        if futuro is None:
+            # Descartado do cache: é renderizado de novo, já nesta thread
+            fragmento = self._renderizar(item)
+        else:
+            fragmento = futuro.result()
+            with self._lock:
+                self.reaproveitados += 1
+        if fragmento.falhou and futuro is not None:
+            with self._lock:
+                if self._fragmentos.get(item['id']) is futuro:
+                    del self._fragmentos[item['id']]
+        return fragmento
+
+    def documento(self, itens):
+        """Relatório Word (BytesIO) com os itens na ordem recebida."""
+        chave = tuple(item.get('id') for item in itens)
+        with self._lock:
+            ultima_chave, conteudo = self._ultimo
+        if conteudo is None or ultima_chave != chave or None in chave:
+            fragmentos = [self.fragmento(item) for item in itens]
+            conteudo = montar_documento(fragmentos).getvalue()
+            with self._lock:
+                self.montagens += 1
+                if not any(f.falhou for f in fragmentos):
+                    self._ultimo = (tuple(item['id'] for item in itens), conteudo)
+        return io.BytesIO(conteudo)
+
+    def estatisticas(self):
+        with self._lock:
+            return {
+                'fragmentos': len(self._fragmentos),
+                'renderizados': self.renderizados,
+                'reaproveitados': self.reaproveitados,
+                'montagens': self.montagens,
+            }
+
+
+montador_relatorio = MontadorRelatorio()
+
+
+def criar_documento_word(report_items):
+    """
+    Gera um documento Word profissional e bem formatado.
+    """
+    return montador_relatorio.documento(report_items)
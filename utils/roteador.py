@@ -0,0 +1,218 @@
+# utils/roteador.py
+
+import re
+import unicodedata
+from utils.cubo import DIMENSAO_UF
+from utils.cfop import classificar_cfop
+
+# --- ROTEADOR DE PERGUNTAS ---
+# Perguntas de negócio com resposta fixa (faturamento total, top N produtos, principal
+# CFOP...) são reconhecidas por padrões e respondidas diretamente a partir do cubo OLAP do
+# dataset, em milissegundos e sem chamar o LLM. As demais seguem para o agente.
+# Cada intenção é registrada com o decorador `@intencao` e recebe (dataset, n), onde `n` é
+# o número pedido na pergunta (ex.: "os 5 produtos"), quando houver.
+INTENCOES = []
+
+COLUNA_CLIENTE = 'nome_destinatario_x'
+COLUNA_PRODUTO = 'descricao_do_produto_servico'
+
+NUMEROS_POR_EXTENSO = {
+    'um': 1, 'uma': 1, 'dois': 2, 'duas': 2, 'tres': 3, 'quatro': 4, 'cinco': 5,
+    'seis': 6, 'sete': 7, 'oito': 8, 'nove': 9, 'dez': 10,
+}
+_NUMERO = r"(?P<n>\d+|" + "|".join(NUMEROS_POR_EXTENSO) + r")"
+
+
+class Intencao:
+    def __init__(self, nome, padroes, funcao, requer=(), redacao=False):
+        self.nome = nome
+        self.padroes = [re.compile(p) for p in padroes]
+        self.funcao = funcao
+        # Dimensões/medidas do cubo de que a intenção precisa.
+        self.requer = tuple(requer)
+        # Intenções cujo texto final é redigido pelo LLM a partir dos fatos calculados.
+        self.redacao = redacao
+
+
+class RespostaRoteada:
+    def __init__(self, intencao, texto):
+        self.intencao = intencao
+        self.texto = texto
+
+    @property
+    def precisa_redacao(self):
+        return self.intencao.redacao
+
+
+def intencao(nome, padroes, requer=(), redacao=False):
+    """Registra uma intenção de pergunta no roteador (veja INTENCOES)."""
+    def registrar(funcao):
+        INTENCOES.append(Intencao(nome, padroes, funcao, requer, redacao))
+        return funcao
+    return registrar
+
+
+def normalizar_pergunta(pergunta):
+    """Minúsculas, sem acentos, sem trechos entre parênteses, instruções de formato e pontuação."""
+    texto = ''.join(c for c in unicodedata.normalize('NFD', pergunta) if unicodedata.category(c) != 'Mn').lower()
+    texto = re.sub(r"\([^)]*\)", " ", texto)
+    texto = re.sub(r"responda (em|no) formato de lista", " ", texto)
+    texto = re.sub(r"[^\w]+", " ", texto)
+    return re.sub(r"\s+", " ", texto).strip()
+
+
+def _numero(correspondencia, padrao):
+    if correspondencia is None or 'n' not in correspondencia.groupdict() or correspondencia.group('n') is None:
+        return padrao
+    valor = correspondencia.group('n')
+    return int(valor) if valor.isdigit() else NUMEROS_POR_EXTENSO[valor]
+
+
+def rotear(dataset, pergunta):
+    """
+    Resposta calculada diretamente para a pergunta, ou None quando ela não corresponde a
+    nenhuma intenção conhecida (ou o dataset não tem as colunas necessárias).
+    """
+    texto = normalizar_pergunta(pergunta)
+    cubo = dataset.cubo
+    disponiveis = set(cubo.dimensoes) | set(cubo.medidas)
+    for intencao_registrada in INTENCOES:
+        for padrao in intencao_registrada.padroes:
+            correspondencia = padrao.fullmatch(texto)
+            if correspondencia is None:
+                continue
+            if not all(col in disponiveis for col in intencao_registrada.requer):
+                return None
+            resposta = intencao_registrada.funcao(dataset, _numero(correspondencia, None))
+            return RespostaRoteada(intencao_registrada, resposta)
+    return None
+
+
+def prompt_redacao(pergunta, resposta):
+    """Prompt que pede ao LLM apenas a redação final, a partir dos fatos já calculados."""
+    return (
+        "Você é um analista de notas fiscais. Responda à pergunta abaixo usando exclusivamente os fatos "
+        "fornecidos, sem inventar números.\n\n"
+        f"Pergunta: {pergunta}\n\nFatos:\n{resposta.texto}"
+    )
+
+
+def redigir_com_llm(llm, pergunta, resposta, callbacks=None):
+    """
+    Pede ao LLM apenas a redação final, a partir dos fatos já calculados. Com `callbacks`,
+    a resposta é pedida em streaming, e os handlers recebem os tokens à medida que chegam.
+    """
+    prompt = prompt_redacao(pergunta, resposta)
+    if callbacks:
+        return "".join(parte.content for parte in llm.stream(prompt, config={"callbacks": callbacks}))
+    return llm.invoke(prompt).content
+
+
+# --- FORMATAÇÃO ---
+def formatar_reais(valor):
+    return "R$ " + f"{valor:,.2f}".replace(",", "v").replace(".", ",").replace("v", ".")
+
+def formatar_inteiro(valor):
+    return f"{int(valor):,}".replace(",", ".")
+
+def formatar_quantidade(valor):
+    return formatar_inteiro(valor) if float(valor).is_integer() else f"{valor:,.2f}".replace(",", "v").replace(".", ",").replace("v", ".")
+
+def _lista(serie, formatar):
+    return "\n".join(f"{i}. {indice}: {formatar(valor)}" for i, (indice, valor) in enumerate(serie.items(), start=1))
+
+
+# --- INTENÇÕES EMBUTIDAS ---
+_TOTAL_DE = r"(qual (e |foi )?(o |a )?)?(numero|total|quantidade) (total )?de "
+
+@intencao('faturamento_total', [
+    r"(qual (e |foi )?o )?(faturamento|valor) total( de vendas)?( (neste|deste|do|no) (conjunto de dados|arquivo|dataset|periodo))?",
+], requer=('valor_total',))
+def faturamento_total(dataset, n):
+    return f"O faturamento total é de {formatar_reais(dataset.cubo.total('valor_total'))}."
+
+@intencao('total_notas', [
+    _TOTAL_DE + r"notas( fiscais)?( unicas| distintas)?",
+    r"quantas notas( fiscais)?( unicas| distintas)?( existem| ha| foram emitidas)?",
+])
+def total_notas(dataset, n):
+    return f"Há {formatar_inteiro(dataset.cubo.total_notas())} notas fiscais únicas."
+
+@intencao('ticket_medio', [
+    r"(qual (e |foi )?o )?(valor|ticket) medio (por|de cada) nota( fiscal)?",
+], requer=('valor_total',))
+def ticket_medio(dataset, n):
+    cubo = dataset.cubo
+    notas = cubo.total_notas()
+    if not notas:
+        return "Não há notas fiscais no conjunto de dados."
+    return f"O valor médio por nota fiscal é de {formatar_reais(cubo.total('valor_total') / notas)}."
+
+@intencao('maior_cliente', [
+    r"(quem|qual) (foi |e )?o cliente que mais comprou( em valor)?",
+], requer=(COLUNA_CLIENTE, 'valor_total'))
+def maior_cliente(dataset, n):
+    por_cliente = dataset.cubo.agregar(COLUNA_CLIENTE, 'valor_total')
+    if por_cliente.empty:
+        return "Não há clientes no conjunto de dados."
+    return f"O cliente que mais comprou foi {por_cliente.idxmax()}, com {formatar_reais(por_cliente.max())}."
+
+@intencao('top_produtos_valor', [
+    r"quais (sao )?os " + _NUMERO + r" produtos mais vendidos em valor( total)?",
+    r"top " + _NUMERO + r" produtos( por valor| por faturamento)?",
+], requer=(COLUNA_PRODUTO, 'valor_total'))
+def top_produtos_valor(dataset, n):
+    top = dataset.cubo.agregar(COLUNA_PRODUTO, 'valor_total').nlargest(n or 5)
+    return f"Os {len(top)} produtos mais vendidos em valor total são:\n{_lista(top, formatar_reais)}"
+
+@intencao('top_produtos_quantidade', [
+    r"quais (sao )?os " + _NUMERO + r" produtos mais vendidos em quantidade",
+    r"top " + _NUMERO + r" produtos por quantidade",
+], requer=(COLUNA_PRODUTO, 'quantidade'))
+def top_produtos_quantidade(dataset, n):
+    top = dataset.cubo.agregar(COLUNA_PRODUTO, 'quantidade').nlargest(n or 5)
+    return f"Os {len(top)} produtos mais vendidos em quantidade são:\n{_lista(top, formatar_quantidade)}"
+
+@intencao('clientes_unicos', [
+    _TOTAL_DE + r"clientes( unicos| distintos)?( destinatarios)?",
+    r"quantos clientes( unicos| distintos)?( existem| ha)?",
+], requer=(COLUNA_CLIENTE,))
+def clientes_unicos(dataset, n):
+    return f"Há {formatar_inteiro(dataset.cubo.nunique(COLUNA_CLIENTE))} clientes únicos (destinatários)."
+
+@intencao('top_ufs', [
+    r"quais (sao )?(os|as) " + _NUMERO + r" (estados|ufs) que mais receberam valor( em mercadorias)?",
+], requer=(DIMENSAO_UF, 'valor_total'))
+def top_ufs(dataset, n):
+    top = dataset.cubo.agregar(DIMENSAO_UF, 'valor_total').nlargest(n or 3)
+    return f"Os {len(top)} estados que mais receberam valor em mercadorias são:\n{_lista(top, formatar_reais)}"
+
+@intencao('principal_cfop', [
+    r"qual (e |foi )?a principal operacao fiscal( cfop)? em (termos de )?valor( total)?",
+    r"qual (e |foi )?o principal cfop( em (termos de )?valor( total)?)?",
+], requer=('cfop', 'valor_total'))
+def principal_cfop(dataset, n):
+    por_cfop = dataset.cubo.agregar('cfop', 'valor_total')
+    if por_cfop.empty:
+        return "Não há operações fiscais no conjunto de dados."
+    cfop = por_cfop.idxmax()
+    classificacao = classificar_cfop([cfop]).iloc[0]
+    return (f"A principal operação fiscal é o CFOP {cfop} ({classificacao['descricao']}, categoria "
+            f"{classificacao['categoria']}), com {formatar_reais(por_cfop.max())}.")
+
+@intencao('resumo_executivo', [
+    r"faca um resumo executivo( sobre os dados)?( em " + _NUMERO + r" frases)?",
+], requer=('valor_total',), redacao=True)
+def resumo_executivo(dataset, n):
+    # Fatos que embasam o resumo; a redação fica a cargo do LLM.
+    fatos = [faturamento_total(dataset, None), total_notas(dataset, None), ticket_medio(dataset, None)]
+    disponiveis = set(dataset.cubo.dimensoes)
+    if COLUNA_CLIENTE in disponiveis:
+        fatos += [clientes_unicos(dataset, None), maior_cliente(dataset, None)]
+    if COLUNA_PRODUTO in disponiveis:
+        fatos.append(top_produtos_valor(dataset, 3))
+    if DIMENSAO_UF in disponiveis:
+        fatos.append(top_ufs(dataset, 3))
+    if 'cfop' in disponiveis:
+        fatos.append(principal_cfop(dataset, None))
+    return "\n".join(fatos)
@@ -0,0 +1,350 @@
+# utils/sandbox.py
+
+import ast
+import atexit
+import multiprocessing
+import os
+import shutil
+import tempfile
+import threading
+import uuid
+from collections import OrderedDict
+from contextlib import redirect_stdout
+from io import StringIO
+from typing import Any
+import pyarrow as pa
+from langchain_core.tools import BaseTool
+from langchain_experimental.tools.python.tool import sanitize_input
+
+# --- SANDBOX DE EXECUÇÃO DO CÓDIGO DOS AGENTES ---
+# O código pandas escrito pelo LLM roda em processos separados, e não no servidor do
+# Streamlit: uma consulta descontrolada estoura o tempo ou a memória de um processo, que é
+# encerrado e substituído, sem travar a aplicação para os demais usuários.
+PROCESSOS_SANDBOX = int(os.environ.get("NFE_SANDBOX_PROCESSOS", str(min(4, os.cpu_count() or 1))))
+# Tempo máximo (s) de cada execução e memória máxima (MB) de cada processo.
+TEMPO_LIMITE_SANDBOX = float(os.environ.get("NFE_SANDBOX_TEMPO_LIMITE", "30"))
+LIMITE_MEMORIA_SANDBOX_MB = int(os.environ.get("NFE_SANDBOX_LIMITE_MEMORIA_MB", "4096"))
+# Tamanho máximo (caracteres) do resultado devolvido ao agente.
+MAX_CARACTERES_RESULTADO = int(os.environ.get("NFE_SANDBOX_MAX_CARACTERES", "4000"))
+# Diretório dos datasets publicados para os processos (arquivos Arrow IPC lidos via memory-map);
+# por padrão, um diretório temporário removido ao fim da aplicação.
+DIRETORIO_SANDBOX = os.environ.get("NFE_SANDBOX_DIR")
+# Quantos datasets ficam publicados ao mesmo tempo (os usados há mais tempo são removidos).
+LIMITE_DATASETS_SANDBOX = int(os.environ.get("NFE_AGENTES_DATASETS", "2"))
+
+# Namespaces (variáveis de cada execução do agente) mantidos por processo.
+_MAX_NAMESPACES = 32
+
+
+def executar_codigo(codigo, variaveis):
+    """
+    Executa o código como a ferramenta de Python do agente (o valor da última expressão é o
+    resultado), mas deixando as exceções se propagarem.
+    """
+    arvore = ast.parse(codigo)
+    exec(ast.unparse(ast.Module(arvore.body[:-1], type_ignores=[])), variaveis)
+    ultima = ast.unparse(ast.Module(arvore.body[-1:], type_ignores=[]))
+    saida = StringIO()
+    with redirect_stdout(saida):
+        try:
+            resultado = eval(ultima, variaveis)
+        except SyntaxError:
+            exec(ultima, variaveis)
+            resultado = None
+    return saida.getvalue() if resultado is None else str(resultado)
+
+
+def truncar_resultado(texto, limite=MAX_CARACTERES_RESULTADO):
+    if len(texto) <= limite:
+        return texto
+    return texto[:limite] + f"\n… (resultado truncado: {len(texto)} caracteres no total)"
+
+
+# --- PROCESSO DE TRABALHO ---
+def _limitar_memoria(limite_mb):
+    try:
+        import resource
+    except ImportError:
+        # Sem o módulo resource (Windows), o processo roda sem limite de memória.
+        return
+    limite = limite_mb * 1024 * 1024
+    resource.setrlimit(resource.RLIMIT_AS, (limite, limite))
+
+
+def _trabalhador(conexao, limite_memoria_mb, max_caracteres):
+    """Laço do processo de trabalho: recebe (arquivo, namespace, código) e devolve (ok, texto)."""
+    _limitar_memoria(limite_memoria_mb)
+    dataframes = {}
+    namespaces = OrderedDict()
+    while True:
+        try:
+            pedido = conexao.recv()
+        except EOFError:
+            return
+        arquivo, namespace, codigo = pedido
+        try:
+            if arquivo not in dataframes:
+                # Um único dataset por processo: o anterior é liberado antes de abrir o novo.
+                dataframes.clear()
+                namespaces.clear()
+                tabela = pa.ipc.open_file(pa.memory_map(arquivo, 'r')).read_all()
+                dataframes[arquivo] = tabela.to_pandas(split_blocks=True)
+            variaveis = namespaces.pop(namespace, None) or {'df': dataframes[arquivo]}
+            namespaces[namespace] = variaveis
+            while len(namespaces) > _MAX_NAMESPACES:
+                namespaces.popitem(last=False)
+            resposta = (True, truncar_resultado(executar_codigo(codigo, variaveis), max_caracteres))
+        except MemoryError:
+            namespaces.pop(namespace, None)
+            resposta = (False, "MemoryError: a consulta ultrapassou o limite de memória do sandbox.")
+        except BaseException as e:
+            resposta = (False, truncar_resultado(f"{type(e).__name__}: {e}", max_caracteres))
+        conexao.send(resposta)
+
+
+class _Processo:
+    def __init__(self, contexto, limite_memoria_mb, max_caracteres):
+        self.conexao, self._conexao_filho = contexto.Pipe()
+        self.processo = contexto.Process(
+            target=_trabalhador, args=(self._conexao_filho, limite_memoria_mb, max_caracteres), daemon=True
+        )
+        # Espelho do estado do processo de trabalho: o dataset aberto e os namespaces mantidos,
+        # do usado há mais tempo ao mais recente (veja _trabalhador).
+        self.arquivo = None
+        self.namespaces = OrderedDict()
+
+    def iniciar(self):
+        self.processo.start()
+        self._conexao_filho.close()
+
+    def encerrar(self):
+        if self.processo.pid is not None:
+            self.processo.kill()
+            self.processo.join()
+        self.conexao.close()
+
+
+class PoolSandbox:
+    """
+    Pool de processos (spawn) que executam o código dos agentes sobre o DataFrame do dataset.
+
+    O dataset é publicado uma vez como arquivo Arrow IPC e cada processo o abre via
+    memory-map, sem receber cópias pelo pipe. Cada execução tem tempo limite: ao estourá-lo,
+    o processo é encerrado e substituído por outro. A memória de cada processo é limitada
+    (RLIMIT_AS, onde disponível) e o resultado devolvido é truncado.
+
+    As variáveis criadas pelo código ficam no namespace da execução do agente, que existe apenas
+    no processo que o executou: as chamadas de um mesmo namespace vão sempre para esse processo,
+    esperando por ele se estiver ocupado. O namespace só se perde quando o processo é encerrado
+    ou o descarta (limite de namespaces ou troca de dataset).
+    """
+
+    def __init__(self, processos=PROCESSOS_SANDBOX, tempo_limite=TEMPO_LIMITE_SANDBOX,
+                 limite_memoria_mb=LIMITE_MEMORIA_SANDBOX_MB, max_caracteres=MAX_CARACTERES_RESULTADO,
+                 diretorio=DIRETORIO_SANDBOX, limite_datasets=LIMITE_DATASETS_SANDBOX):
+        self.processos = max(1, processos)
+        self.tempo_limite = tempo_limite
+        self.limite_memoria_mb = limite_memoria_mb
+        self.max_caracteres = max_caracteres
+        self.diretorio = diretorio
+        self.limite_datasets = max(1, limite_datasets)
+        self._contexto = multiprocessing.get_context('spawn')
+        self._ociosos = []
+        self._total = 0
+        # namespace -> processo que mantém as suas variáveis
+        self._donos = {}
+        self._condicao = threading.Condition()
+        self._publicados = OrderedDict()
+        self._lock_publicacao = threading.Lock()
+        self.execucoes = 0
+        self.tempo_esgotado = 0
+
+    # --- Datasets publicados ---
+    @staticmethod
+    def _identificar(dataset):
+        if dataset.hash_conteudo is None:
+            return ('objeto', id(dataset))
+        return (dataset.hash_conteudo, dataset.estado_filtro)
+
+    def publicar(self, dataset):
+        """Caminho do arquivo Arrow IPC com o DataFrame unificado do dataset, gravado na primeira vez."""
+        identificacao = self._identificar(dataset)
+        with self._lock_publicacao:
+            if identificacao in self._publicados:
+                self._publicados.move_to_end(identificacao)
+                return self._publicados[identificacao]
+            if self.diretorio is None:
+                self.diretorio = tempfile.mkdtemp(prefix="nfe-sandbox-")
+                atexit.register(shutil.rmtree, self.diretorio, ignore_errors=True)
+            os.makedirs(self.diretorio, exist_ok=True)
+            arquivo = os.path.join(self.diretorio, f"{uuid.uuid4().hex}.arrow")
+            tabela = pa.Table.from_pandas(dataset.df, preserve_index=False)
+            with pa.OSFile(arquivo, 'wb') as sink:
+                with pa.ipc.new_file(sink, tabela.schema) as writer:
+                    writer.write_table(tabela)
+            self._publicados[identificacao] = arquivo
+            while len(self._publicados) > self.limite_datasets:
+                _, antigo = self._publicados.popitem(last=False)
+                self._remover_arquivo(antigo)
+            return arquivo
+
+    def descartar(self, dataset=None):
+        """Remove o arquivo publicado do dataset (ou de todos)."""
+        with self._lock_publicacao:
+            if dataset is None:
+                arquivos = list(self._publicados.values())
+                self._publicados.clear()
+            else:
+                arquivos = [self._publicados.pop(self._identificar(dataset), None)]
+        for arquivo in filter(None, arquivos):
+            self._remover_arquivo(arquivo)
+
+    @staticmethod
+    def _remover_arquivo(arquivo):
+        # Processos que ainda mantêm o arquivo mapeado continuam lendo-o normalmente (Linux/macOS).
+        try:
+            os.remove(arquivo)
+        except OSError:
+            pass
+
+    # --- Processos ---
+    def _retirar(self, namespace, arquivo):
+        with self._condicao:
+            while True:
+                dono = self._donos.get(namespace)
+                if dono is not None:
+                    if dono in self._ociosos:
+                        processo = dono
+                        self._ociosos.remove(processo)
+                        break
+                elif self._ociosos:
+                    # De preferência um processo que já tem o dataset aberto
+                    processo = next((p for p in reversed(self._ociosos) if p.arquivo == arquivo), self._ociosos[-1])
+                    self._ociosos.remove(processo)
+                    break
+                elif self._total < self.processos:
+                    self._total += 1
+                    processo = _Processo(self._contexto, self.limite_memoria_mb, self.max_caracteres)
+                    break
+                self._condicao.wait()
+            self._registrar(processo, namespace, arquivo)
+        if processo.processo.pid is None:
+            try:
+                processo.iniciar()
+            except BaseException:
+                self._descartar(processo)
+                raise
+        return processo
+
+    def _registrar(self, processo, namespace, arquivo):
+        """Atualiza o espelho do processo como o processo de trabalho fará ao receber o pedido."""
+        if processo.arquivo != arquivo:
+            # Ao abrir outro dataset, o processo descarta todos os namespaces
+            self._esquecer(processo, list(processo.namespaces))
+            processo.arquivo = arquivo
+        processo.namespaces[namespace] = None
+        processo.namespaces.move_to_end(namespace)
+        self._donos[namespace] = processo
+        if len(processo.namespaces) > _MAX_NAMESPACES:
+            self._esquecer(processo, list(processo.namespaces)[:-_MAX_NAMESPACES])
+
+    def _esquecer(self, processo, namespaces):
+        for namespace in namespaces:
+            processo.namespaces.pop(namespace, None)
+            if self._donos.get(namespace) is processo:
+                del self._donos[namespace]
+
+    def _devolver(self, processo):
+        with self._condicao:
+            self._ociosos.append(processo)
+            # Acorda todos: quem espera por um processo específico (o dono do namespace) também
+            self._condicao.notify_all()
+
+    def _descartar(self, processo):
+        processo.encerrar()
+        with self._condicao:
+            self._esquecer(processo, list(processo.namespaces))
+            self._total -= 1
+            self._condicao.notify_all()
+
+    def executar(self, dataset, codigo, namespace=None, tempo_limite=None):
+        """
+        Executa o código no sandbox, com `df` = DataFrame do dataset, e devolve (ok, texto).
+        Sem `namespace`, a execução começa com variáveis novas.
+        """
+        arquivo = self.publicar(dataset)
+        namespace = namespace or uuid.uuid4().hex
+        tempo_limite = self.tempo_limite if tempo_limite is None else tempo_limite
+        processo = self._retirar(namespace, arquivo)
+        try:
+            processo.conexao.send((arquivo, namespace, codigo))
+            if not processo.conexao.poll(tempo_limite):
+                self._descartar(processo)
+                with self._condicao:
+                    self.tempo_esgotado += 1
+                return False, f"TimeoutError: a execução ultrapassou {tempo_limite:g} s e foi interrompida."
+            ok, texto = processo.conexao.recv()
+        except (EOFError, OSError):
+            # O processo morreu (ex.: encerrado pelo sistema por falta de memória).
+            self._descartar(processo)
+            return False, "RuntimeError: o processo do sandbox foi encerrado durante a execução (ex.: falta de memória)."
+        self._devolver(processo)
+        with self._condicao:
+            self.execucoes += 1
+        return ok, texto
+
+    def encerrar(self):
+        with self._condicao:
+            processos, self._ociosos = self._ociosos, []
+            self._total -= len(processos)
+            for processo in processos:
+                self._esquecer(processo, list(processo.namespaces))
+        for processo in processos:
+            processo.encerrar()
+        self.descartar()
+
+    def estatisticas(self):
+        with self._condicao:
+            return {
+                'processos': self._total,
+                'execucoes': self.execucoes,
+                'tempo_esgotado': self.tempo_esgotado,
+                'datasets': len(self._publicados),
+            }
+
+
+pool_sandbox = PoolSandbox()
+
+
+class PythonSandboxTool(BaseTool):
+    """
+    Ferramenta de Python dos agentes pandas, com o mesmo nome e descrição da original
+    (python_repl_ast), mas executando o código no PoolSandbox.
+    """
+    name: str = "python_repl_ast"
+    description: str = (
+        "A Python shell. Use this to execute python commands. Input should be a valid python command. "
+        "When using this tool, sometimes output is abbreviated - make sure it does not look abbreviated before using it in your answer."
+    )
+    dataset: Any
+    pool: Any = None
+    namespace: str = ""
+
+    def _run(self, query: str, run_manager=None) -> str:
+        pool = self.pool or pool_sandbox
+        _, texto = pool.executar(self.dataset, sanitize_input(query), namespace=self.namespace or None)
+        return texto
+
+
+def usar_sandbox(agente, dataset, pool=None):
+    """Troca a ferramenta de Python do agente pandas pela do sandbox."""
+    sandbox = PythonSandboxTool(dataset=dataset, pool=pool, namespace=uuid.uuid4().hex)
+    agente.tools = [sandbox if ferramenta.name == sandbox.name else ferramenta for ferramenta in agente.tools]
+    return agente
+
+
+def renovar_namespace(agente):
+    """Faz a próxima execução do agente começar com variáveis novas no sandbox, como um agente recém-montado."""
+    for ferramenta in agente.tools:
+        if isinstance(ferramenta, PythonSandboxTool):
+            ferramenta.namespace = uuid.uuid4().hex
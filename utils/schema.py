@@ -0,0 +1,153 @@
+# utils/schema.py
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+from pandas.api.types import union_categoricals
+from utils.cfop import converter_cfop
+
+# --- ESQUEMA DECLARADO DAS COLUNAS DE NF-e (nomes já normalizados) ---
+# Formato das datas exportadas (ex.: "2024-01-02 09:04:47"). Valores fora desse padrão
+# ainda são interpretados, mas apenas após a tentativa com o formato explícito.
+FORMATO_DATA = '%Y-%m-%d %H:%M:%S'
+
+# Colunas de identificação lidas sempre como texto, mesmo quando só contêm dígitos
+# (chave com 44 dígitos, CNPJ, IE "ISENTO"...).
+PADROES_COLUNAS_TEXTO = ('chave', 'cpf', 'cnpj', 'inscricao')
+
+# Colunas com poucos valores distintos que se repetem muito: guardadas como categóricas.
+# Os códigos numéricos (NCM, modelo, série, número do item) também ficam aqui, como texto:
+# são identificadores, e o NCM pode começar com zero.
+COLUNAS_CATEGORICAS = (
+    'uf_emitente', 'uf_destinatario',
+    'razao_social_emitente', 'nome_destinatario', 'descricao_do_produto_servico',
+    'natureza_da_operacao', 'municipio_emitente', 'evento_mais_recente', 'unidade',
+    'indicador_ie_destinatario', 'destino_da_operacao', 'consumidor_final',
+    'presenca_do_comprador', 'ncm_sh_tipo_de_produto',
+    'codigo_ncm_sh', 'modelo', 'serie', 'numero_produto',
+)
+
+# As UFs usam um conjunto fixo de categorias, o que permite comparar colunas de UF
+# diretamente (ex.: UF do emitente == UF do destinatário) e concatenar lotes sem união.
+UFS = (
+    'AC', 'AL', 'AM', 'AP', 'BA', 'CE', 'DF', 'ES', 'GO', 'MA', 'MG', 'MS', 'MT', 'PA',
+    'PB', 'PE', 'PI', 'PR', 'RJ', 'RN', 'RO', 'RR', 'RS', 'SC', 'SE', 'SP', 'TO', 'EX',
+)
+TIPO_UF = pd.CategoricalDtype(categories=UFS)
+
+# O CFOP é guardado como inteiro (int16), o que permite classificá-lo por consulta direta
+# às tabelas de utils/cfop.py. Na leitura ele chega codificado em dicionário, como as categóricas.
+COLUNAS_CFOP = ('cfop',)
+
+# Valores monetários guardados em centavos (inteiros), sem erro de arredondamento nas somas.
+# O valor unitário fica em ponto flutuante: na NF-e ele pode ter até 10 casas decimais.
+COLUNAS_MONETARIAS = ('valor_nota_fiscal', 'valor_total')
+# Demais colunas numéricas, lidas em ponto flutuante mesmo quando os primeiros valores são inteiros.
+COLUNAS_DECIMAIS = ('quantidade', 'valor_unitario')
+
+# Layout dos dois CSVs exportados pelo portal. As colunas da nota repetidas no CSV de itens
+# (COLUNAS_COMPARTILHADAS) ganham os sufixos "_x" (cabeçalho) e "_y" no formato unificado do
+# merge, como em DatasetNFe.juntar; as demais mantêm o nome.
+COLUNAS_COMPARTILHADAS = (
+    'modelo', 'serie', 'numero', 'natureza_da_operacao', 'data_emissao',
+    'cpf_cnpj_emitente', 'razao_social_emitente', 'inscricao_estadual_emitente', 'uf_emitente',
+    'municipio_emitente', 'cnpj_destinatario', 'nome_destinatario', 'uf_destinatario',
+    'indicador_ie_destinatario', 'destino_da_operacao', 'consumidor_final', 'presenca_do_comprador',
+)
+COLUNAS_CABECALHO = ('chave_de_acesso',) + COLUNAS_COMPARTILHADAS + (
+    'evento_mais_recente', 'data_hora_evento_mais_recente', 'valor_nota_fiscal',
+)
+COLUNAS_ITENS = ('chave_de_acesso',) + COLUNAS_COMPARTILHADAS + (
+    'numero_produto', 'descricao_do_produto_servico', 'codigo_ncm_sh', 'ncm_sh_tipo_de_produto',
+    'cfop', 'quantidade', 'unidade', 'valor_unitario', 'valor_total',
+)
+COLUNAS_UNIFICADAS = tuple(dict.fromkeys(
+    [f"{col}_x" if col in COLUNAS_COMPARTILHADAS else col for col in COLUNAS_CABECALHO]
+    + [f"{col}_y" for col in COLUNAS_COMPARTILHADAS]
+    + [col for col in COLUNAS_ITENS if col not in COLUNAS_COMPARTILHADAS]
+))
+
+_TIPO_DICIONARIO = pa.dictionary(pa.int32(), pa.string())
+
+
+def eh_coluna_data(coluna):
+    return 'data' in coluna
+
+def eh_coluna_uf(coluna):
+    return coluna.startswith('uf_')
+
+def eh_monetaria(coluna):
+    return coluna in COLUNAS_MONETARIAS
+
+def tipo_arrow(coluna):
+    """
+    Tipo com que o leitor CSV do Arrow deve converter a coluna. Nenhum tipo é inferido: o
+    leitor só olha o primeiro bloco, e um valor válido mais adiante (ex.: quantidade 1.5
+    depois de quantidades inteiras) interromperia a leitura.
+    """
+    if any(padrao in coluna for padrao in PADROES_COLUNAS_TEXTO):
+        return pa.string()
+    # Datas também chegam codificadas em dicionário: cada valor distinto é interpretado uma única vez.
+    if coluna in COLUNAS_CATEGORICAS or coluna in COLUNAS_CFOP or eh_coluna_data(coluna):
+        return _TIPO_DICIONARIO
+    if eh_monetaria(coluna) or coluna in COLUNAS_DECIMAIS:
+        return pa.float64()
+    # As demais (ex.: o número da nota) ficam como texto.
+    return pa.string()
+
+def converter_datas(serie, formato=FORMATO_DATA):
+    """
+    Converte uma coluna de datas interpretando cada valor distinto uma única vez, com
+    formato explícito. Valores fora do formato caem na inferência do pandas.
+    """
+    if isinstance(serie.dtype, pd.CategoricalDtype):
+        codigos, unicos = serie.cat.codes.to_numpy(), serie.cat.categories
+    else:
+        codigos, unicos = pd.factorize(serie)
+    unicos = pd.Index(unicos).astype(str)
+
+    datas = pd.to_datetime(unicos, format=formato, errors='coerce')
+    falhas = datas.isna()
+    if falhas.any():
+        datas = datas.where(~falhas, pd.to_datetime(unicos.where(falhas), errors='coerce', format='mixed'))
+    return pd.Series(datas.take(codigos, allow_fill=True, fill_value=pd.NaT), index=serie.index, name=serie.name)
+
+def reais_para_centavos(serie):
+    centavos = np.round(pd.to_numeric(serie, errors='coerce') * 100)
+    return centavos.astype('Int64') if centavos.isna().any() else centavos.astype('int64')
+
+def centavos_para_reais(serie):
+    return serie.astype('float64') / 100
+
+def aplicar_schema(df):
+    """Aplica o esquema declarado a um bloco recém-lido (datas, centavos, CFOP e categóricas)."""
+    for col in df.columns:
+        if eh_coluna_data(col):
+            df[col] = converter_datas(df[col])
+        elif eh_monetaria(col):
+            df[col] = reais_para_centavos(df[col])
+        elif col in COLUNAS_CFOP:
+            df[col] = converter_cfop(df[col])
+        elif eh_coluna_uf(col):
+            if isinstance(df[col].dtype, pd.CategoricalDtype):
+                df[col] = df[col].cat.set_categories(UFS)
+            else:
+                df[col] = df[col].astype(TIPO_UF)
+        elif col in COLUNAS_CATEGORICAS and not isinstance(df[col].dtype, pd.CategoricalDtype):
+            df[col] = df[col].astype('category')
+    return df
+
+def concatenar_lotes(lotes):
+    """Concatena blocos lidos separadamente, unindo as categorias de cada coluna categórica."""
+    if len(lotes) == 1:
+        return lotes[0]
+    colunas = lotes[0].columns
+    categoricas = [
+        col for col in colunas
+        if isinstance(lotes[0][col].dtype, pd.CategoricalDtype) and lotes[0][col].dtype != TIPO_UF
+    ]
+    unidas = {col: union_categoricals([lote[col] for lote in lotes]) for col in categoricas}
+    df = pd.concat([lote.drop(columns=categoricas) for lote in lotes], ignore_index=True)
+    for col, valores in unidas.items():
+        df[col] = valores
+    return df[colunas]
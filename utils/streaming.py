@@ -0,0 +1,115 @@
+# utils/streaming.py
+
+import queue
+import threading
+import time
+from typing import Any
+from langchain.callbacks.base import BaseCallbackHandler
+from langchain_core.agents import AgentAction, AgentFinish
+
+# --- EXECUÇÃO DO AGENTE EM SEGUNDO PLANO, COM STREAMING E CANCELAMENTO ---
+# O script do Streamlit é síncrono: o agente roda em uma thread e os tokens e passos
+# intermediários chegam à interface por uma fila, consumida pela thread do script, a única
+# que pode desenhar na tela. Quando o script é interrompido (ex.: o usuário clicou em
+# "Parar", o que dispara uma nova execução), a execução é cancelada no próximo token ou
+# passo do agente.
+
+
+class ExecucaoCancelada(Exception):
+    """A execução do agente foi cancelada pelo usuário."""
+
+
+class FilaEventosCallbackHandler(BaseCallbackHandler):
+    """
+    Publica os tokens e os passos do agente como eventos (tipo, dados) em uma fila e
+    interrompe a execução, levantando ExecucaoCancelada, assim que o cancelamento é pedido.
+    """
+    # Sem isso, o LangChain apenas registraria a exceção e a execução continuaria.
+    raise_error = True
+
+    def __init__(self, fila, cancelado):
+        super().__init__()
+        self.fila = fila
+        self.cancelado = cancelado
+
+    def _verificar_cancelamento(self):
+        if self.cancelado.is_set():
+            raise ExecucaoCancelada("Execução interrompida pelo usuário.")
+
+    def on_llm_start(self, serialized, prompts, **kwargs: Any) -> Any:
+        self._verificar_cancelamento()
+        self.fila.put(('inicio_llm', None))
+
+    def on_chat_model_start(self, serialized, messages, **kwargs: Any) -> Any:
+        self._verificar_cancelamento()
+        self.fila.put(('inicio_llm', None))
+
+    def on_llm_new_token(self, token: str, **kwargs: Any) -> Any:
+        self._verificar_cancelamento()
+        if token:
+            self.fila.put(('token', token))
+
+    def on_agent_action(self, action: AgentAction, **kwargs: Any) -> Any:
+        self._verificar_cancelamento()
+        self.fila.put(('acao', {'ferramenta': action.tool, 'entrada': action.tool_input}))
+
+    def on_tool_end(self, output: Any, **kwargs: Any) -> Any:
+        self.fila.put(('observacao', str(output)))
+        self._verificar_cancelamento()
+
+    def on_agent_finish(self, finish: AgentFinish, **kwargs: Any) -> Any:
+        self.fila.put(('final', finish.return_values.get('output', '')))
+
+
+class ExecucaoEmSegundoPlano:
+    """
+    Executa `funcao(handler)` em uma thread, onde `handler` é o FilaEventosCallbackHandler
+    que a função deve incluir nos callbacks do LLM ou do agente. `eventos()` entrega os
+    eventos à medida que chegam; ao final, `resultado` (ou `erro`) fica disponível.
+    """
+
+    def __init__(self, funcao):
+        self.fila = queue.Queue()
+        self.cancelado = threading.Event()
+        self.handler = FilaEventosCallbackHandler(self.fila, self.cancelado)
+        self.resultado = None
+        self.erro = None
+        self._funcao = funcao
+        self._thread = threading.Thread(target=self._executar, name="agente-streaming", daemon=True)
+
+    def _executar(self):
+        try:
+            self.resultado = self._funcao(self.handler)
+        except BaseException as e:
+            self.erro = e
+        finally:
+            self.fila.put(('fim', None))
+
+    def iniciar(self):
+        self._thread.start()
+        return self
+
+    def eventos(self, intervalo=0.5):
+        """
+        Eventos (tipo, dados) até o fim da execução; o evento 'fim' não é entregue. Sem novidades
+        por `intervalo` segundos, entrega ('aguardando', segundos desde o início), o que permite a
+        quem consome atualizar a tela (e ao Streamlit, interromper o script) mesmo sem tokens.
+        """
+        inicio = time.monotonic()
+        while True:
+            try:
+                tipo, dados = self.fila.get(timeout=intervalo)
+            except queue.Empty:
+                yield 'aguardando', time.monotonic() - inicio
+                continue
+            if tipo == 'fim':
+                return
+            yield tipo, dados
+
+    @property
+    def cancelada(self):
+        return isinstance(self.erro, ExecucaoCancelada)
+
+    def cancelar(self):
+        """Pede o cancelamento; sem efeito se a execução já terminou."""
+        self.cancelado.set()
@@ -0,0 +1,166 @@
+# utils/tabelas_word.py
+
+import io
+import os
+import re
+import uuid
+import zipfile
+from docx.enum.text import WD_BREAK
+import pandas as pd
+from utils.roteador import formatar_inteiro
+
+# --- TABELAS DO RELATÓRIO WORD ---
+# Preencher uma tabela do python-docx célula a célula (`t.cell(i, j).text`) custa um acesso à
+# árvore XML por célula e leva minutos em tabelas de milhares de linhas. Aqui o XML da tabela
+# inteira é montado como texto, de uma vez, a partir das colunas já formatadas. O documento
+# recebe apenas um marcador no lugar de cada tabela, e os marcadores são substituídos pelo XML
+# das tabelas ao salvar (`salvar_documento`), sem que o python-docx precise interpretá-lo.
+# Linhas exibidas no corpo do relatório; as demais vão para um apêndice no final do documento.
+MAX_LINHAS_TABELA_WORD = int(os.environ.get("NFE_WORD_MAX_LINHAS", "200"))
+# Linhas de cada tabela do apêndice (cada bloco começa em uma nova página).
+LINHAS_POR_BLOCO_APENDICE = int(os.environ.get("NFE_WORD_LINHAS_APENDICE", "2000"))
+
+# Largura útil da página (6,5 polegadas, em twips), dividida igualmente entre as colunas.
+_LARGURA_TABELA = 9360
+
+
+def _formatar_valor(valor):
+    """Formatação de um valor avulso (colunas de tipo misto)."""
+    if valor is None or (pd.api.types.is_scalar(valor) and pd.isna(valor)):
+        return ""
+    if isinstance(valor, (int, float)) and not isinstance(valor, bool):
+        return f"{valor:,.2f}"
+    return str(valor)
+
+
+def formatar_coluna(serie):
+    """
+    (textos, numérica) da coluna: a formatação é escolhida uma vez pelo tipo da coluna, e não
+    a cada célula. Valores ausentes ficam em branco.
+    """
+    if pd.api.types.is_bool_dtype(serie.dtype):
+        return serie.map(str, na_action='ignore').fillna(""), False
+    if pd.api.types.is_integer_dtype(serie.dtype):
+        return serie.map("{:,}".format, na_action='ignore').fillna(""), True
+    if pd.api.types.is_float_dtype(serie.dtype):
+        return serie.map("{:,.2f}".format, na_action='ignore').fillna(""), True
+    if pd.api.types.is_datetime64_any_dtype(serie.dtype):
+        return serie.dt.strftime('%d/%m/%Y').fillna(""), False
+    return serie.astype(object).map(_formatar_valor), False
+
+
+# Escapes do XML e remoção dos caracteres de controle, que não são permitidos no documento.
+_ESCAPES_XML = str.maketrans(
+    {'&': '&amp;', '<': '&lt;', '>': '&gt;', **{chr(c): None for c in range(32) if chr(c) not in '\t\n\r'}}
+)
+_PARTE_DOCUMENTO = 'word/document.xml'
+_MARCADOR = re.compile(r'<w:p>\s*<w:r>\s*<w:t>@@tabela-([0-9a-f]{32})@@</w:t>\s*</w:r>\s*</w:p>')
+
+
+def _celulas(textos, numerica, negrito=False, escapar=True):
+    """XML das células (w:tc) de uma coluna, a partir dos textos já formatados."""
+    inicio = (
+        '<w:tc><w:p>' + ('<w:pPr><w:jc w:val="right"/></w:pPr>' if numerica else '')
+        + '<w:r>' + ('<w:rPr><w:b/></w:rPr>' if negrito else '') + '<w:t xml:space="preserve">'
+    )
+    fim = '</w:t></w:r></w:p></w:tc>'
+    # Números e datas formatados nunca precisam de escape
+    return [inicio + (texto.translate(_ESCAPES_XML) if escapar else texto) + fim for texto in textos]
+
+
+def tabela_xml(df, estilo="TableGrid"):
+    """XML (w:tbl) da tabela com o cabeçalho em negrito, repetido a cada página, e as linhas de `df`."""
+    largura = _LARGURA_TABELA // max(1, df.shape[1])
+    cabecalho, colunas = [], []
+    for j, nome in enumerate(df.columns):
+        serie = df.iloc[:, j]
+        textos, numerica = formatar_coluna(serie)
+        escapar = not (numerica or pd.api.types.is_datetime64_any_dtype(serie.dtype))
+        cabecalho += _celulas([str(nome)], numerica, negrito=True)
+        colunas.append(_celulas(textos.tolist(), numerica, escapar=escapar))
+    partes = [
+        f'<w:tbl><w:tblPr><w:tblStyle w:val="{estilo}"/><w:tblW w:w="0" w:type="auto"/>'
+        '<w:tblLook w:val="04A0" w:firstRow="1" w:lastRow="0" w:firstColumn="1" w:lastColumn="0" '
+        'w:noHBand="0" w:noVBand="1"/></w:tblPr><w:tblGrid>',
+        f'<w:gridCol w:w="{largura}"/>' * df.shape[1],
+        '</w:tblGrid><w:tr><w:trPr><w:tblHeader/></w:trPr>', *cabecalho, '</w:tr>',
+    ]
+    partes += ['<w:tr>' + ''.join(linha) + '</w:tr>' for linha in zip(*colunas)]
+    partes.append('</w:tbl>')
+    return ''.join(partes)
+
+
+def reservar_xml(document, xml, tabelas):
+    """Reserva no fim do documento o lugar de `xml` (elementos do corpo), guardado em `tabelas` até `salvar_documento`."""
+    identificador = uuid.uuid4().hex
+    tabelas[identificador] = xml
+    document.add_paragraph(f"@@tabela-{identificador}@@")
+
+
+def adicionar_tabela(document, df, tabelas, estilo='Table Grid'):
+    """
+    Reserva no fim do documento o lugar da tabela de `df`, cujo XML fica em `tabelas` até
+    `salvar_documento`.
+    """
+    reservar_xml(document, tabela_xml(df, document.styles[estilo].style_id), tabelas)
+
+
+def salvar_documento(document, tabelas):
+    """Salva o documento em um BytesIO, com o XML de cada tabela no lugar do seu marcador."""
+    rascunho = io.BytesIO()
+    document.save(rascunho)
+    if not tabelas:
+        rascunho.seek(0)
+        return rascunho
+    doc_buffer = io.BytesIO()
+    with zipfile.ZipFile(rascunho) as origem, zipfile.ZipFile(doc_buffer, 'w', zipfile.ZIP_DEFLATED) as destino:
+        for info in origem.infolist():
+            conteudo = origem.read(info.filename)
+            if info.filename == _PARTE_DOCUMENTO:
+                texto = conteudo.decode('utf-8')
+                partes, posicao = [], 0
+                for marcador in _MARCADOR.finditer(texto):
+                    partes += [texto[posicao:marcador.start()], tabelas[marcador.group(1)]]
+                    posicao = marcador.end()
+                partes.append(texto[posicao:])
+                conteudo = ''.join(partes).encode('utf-8')
+            destino.writestr(info, conteudo, compress_type=zipfile.ZIP_DEFLATED)
+    doc_buffer.seek(0)
+    return doc_buffer
+
+
+def adicionar_tabela_limitada(document, df, titulo, tabelas, apendices, max_linhas=MAX_LINHAS_TABELA_WORD,
+                              rotulo_apendice=None):
+    """
+    Reserva a tabela com até `max_linhas` linhas de `df`; as demais são guardadas em
+    `apendices`, para `adicionar_apendices` no final do documento, e uma nota indica onde
+    encontrá-las (no Apêndice `rotulo_apendice`, por padrão a posição em `apendices`).
+    """
+    if len(df) <= max_linhas:
+        adicionar_tabela(document, df, tabelas)
+        return
+    adicionar_tabela(document, df.iloc[:max_linhas], tabelas)
+    apendices.append((titulo, df.iloc[max_linhas:], max_linhas))
+    document.add_paragraph(
+        f"Exibindo {formatar_inteiro(max_linhas)} de {formatar_inteiro(len(df))} linhas. "
+        f"As demais estão no Apêndice {rotulo_apendice or len(apendices)}, ao final do relatório."
+    ).runs[0].italic = True
+
+
+def adicionar_apendices(document, tabelas, apendices, linhas_por_bloco=LINHAS_POR_BLOCO_APENDICE, rotulos=None):
+    """
+    Apêndices com as linhas que não couberam no corpo do relatório, em blocos de uma página nova
+    cada, numerados por `rotulos` (por padrão, 1, 2, ...).
+    """
+    for numero, (titulo, df, deslocamento) in zip(rotulos or range(1, len(apendices) + 1), apendices):
+        for inicio in range(0, len(df), linhas_por_bloco):
+            document.add_paragraph().add_run().add_break(WD_BREAK.PAGE)
+            bloco = df.iloc[inicio:inicio + linhas_por_bloco]
+            primeira = deslocamento + inicio + 1
+            if inicio == 0:
+                document.add_heading(f"Apêndice {numero} — {titulo}", level=1)
+            document.add_paragraph(
+                f"Linhas {formatar_inteiro(primeira)} a {formatar_inteiro(primeira + len(bloco) - 1)} "
+                f"de {formatar_inteiro(deslocamento + len(df))}."
+            )
+            adicionar_tabela(document, bloco, tabelas)